@@ -0,0 +1,81 @@
+"""
+Measures the import time of pyrcn with ``python -X importtime``.
+
+Every measurement runs in a fresh interpreter. The median cumulative import time of the module is printed together
+with the imported modules that took the most time themselves. With ``--max-ms``, the script exits with a non-zero
+status if the median exceeds the given budget, so that it can be used to track regressions.
+
+Example::
+
+    python benchmarks/import_time.py pyrcn pyrcn.echo_state_network --repeat 10 --max-ms 50
+"""
+
+# Author: Michael Schindler <michael.schindler@maschindler.de>
+# License: BSD 3 clause
+
+import sys
+import argparse
+import subprocess
+from collections import defaultdict
+
+import numpy as np
+
+
+def measure(module, repeat=5, python=sys.executable):
+    """Imports module repeat times in fresh interpreters.
+
+    Parameters
+    ----------
+    module : str
+        The name of the module to import.
+    repeat : int, default=5
+        The number of measurements.
+    python : str, default=sys.executable
+        The Python interpreter.
+
+    Returns
+    -------
+    cumulative : ndarray of shape (repeat, )
+        The cumulative import times of module in microseconds.
+    self_times : dict of str to ndarray
+        The import times of every imported module without its own imports in microseconds.
+    """
+    cumulative = []
+    self_times = defaultdict(list)
+    for _ in range(repeat):
+        result = subprocess.run([python, '-X', 'importtime', '-c', 'import ' + module],
+                                stderr=subprocess.PIPE, universal_newlines=True, check=True)
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'self [us]' in line:
+                continue
+            self_time, cumulative_time, name = line[len('import time:'):].split('|')
+            self_times[name.strip()].append(int(self_time))
+            if name.strip() == module:
+                cumulative.append(int(cumulative_time))
+    return np.array(cumulative), {name: np.array(times) for name, times in self_times.items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('modules', nargs='*', default=['pyrcn'])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help='number of slowest modules to show')
+    parser.add_argument('--max-ms', type=float, default=None, help='fail if the median import time is larger')
+    args = parser.parse_args(argv)
+
+    exceeded = False
+    for module in args.modules:
+        cumulative, self_times = measure(module, repeat=args.repeat)
+        median = np.median(cumulative) / 1000.
+        print('%s: %.1f ms (median of %d, min %.1f ms)' % (module, median, args.repeat, cumulative.min() / 1000.))
+        slowest = sorted(self_times.items(), key=lambda item: -np.median(item[1]))[:args.top]
+        for name, times in slowest:
+            print('    %8.1f ms  %s' % (np.median(times) / 1000., name))
+        if args.max_ms is not None and median > args.max_ms:
+            print('%s exceeds the budget of %.1f ms' % (module, args.max_ms))
+            exceeded = True
+    return 1 if exceeded else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -93,7 +93,7 @@ grid = {'input_scaling': [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0, 1.1,
 # 
 # We use the ParameterGrid from scikit-learn, which converts the grid parameters defined before into a list of dictionaries for each parameter combination. 
 # 
-# We loop over each entry of the Parameter Grid, set the parameters in reg and fit our model on the training data. Afterwards, we report the MSE on the training and tests set.
+# Since input_scaling and spectral_radius do not change the weight matrices, we do not need to loop over each entry of the Parameter Grid. Instead, "partial_fit_settings" passes each sequence through the reservoir for all parameter combinations at once, and each combination collects its own statistics for the linear regression. Afterwards, "predict_settings" computes the outputs of all combinations, and we report the MSE on the training and tests set.
 # 
 #     The lowest training MSE: 0.0725333549527569; parameter combination: {'input_scaling': 0.1, 'spectral_radius': 1.0}
 #     The lowest tests MSE: 0.0755270784848419; parameter combination: {'input_scaling': 0.1, 'spectral_radius': 0.9}
@@ -107,25 +107,26 @@ grid = {'input_scaling': [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0, 1.1,
 # In[5]:
 
 
-for params in ParameterGrid(grid):
+settings = list(ParameterGrid(grid))
+reg = clone(base_reg)
+for X, y in zip(X_train, y_train):
+    y = np.repeat(np.atleast_2d(y), repeats=8, axis=0)
+    reg.partial_fit_settings(X=X, y=y, settings=settings, update_output_weights=False)
+for estimator in reg.setting_estimators_:
+    estimator.finalize()
+err_train = []
+for X, y in zip(X_train, y_train):
+    y = np.repeat(np.atleast_2d(y), repeats=8, axis=0)
+    y_pred = reg.predict_settings(X=X)
+    err_train.append([mean_squared_error(y, y_setting) for y_setting in y_pred])
+err_test = []
+for X, y in zip(X_test, y_test):
+    y = np.repeat(np.atleast_2d(y), repeats=8, axis=0)
+    y_pred = reg.predict_settings(X=X)
+    err_test.append([mean_squared_error(y, y_setting) for y_setting in y_pred])
+for params, err_train_setting, err_test_setting in zip(settings, np.mean(err_train, axis=0), np.mean(err_test, axis=0)):
     print(params)
-    reg = clone(base_reg)
-    reg.set_params(**params)
-    for X, y in zip(X_train, y_train):
-        y = np.repeat(np.atleast_2d(y), repeats=8, axis=0)
-        reg.partial_fit(X=X, y=y, update_output_weights=False)
-    reg.finalize()
-    err_train = []
-    for X, y in zip(X_train, y_train):
-        y = np.repeat(np.atleast_2d(y), repeats=8, axis=0)
-        y_pred = reg.predict(X=X, keep_reservoir_state=False)
-        err_train.append(mean_squared_error(y, y_pred))
-    err_test = []
-    for X, y in zip(X_test, y_test):
-        y = np.repeat(np.atleast_2d(y), repeats=8, axis=0)
-        y_pred = reg.predict(X=X, keep_reservoir_state=False)
-        err_test.append(mean_squared_error(y, y_pred))
-    print('{0}\t{1}'.format(np.mean(err_train), np.mean(err_test)))
+    print('{0}\t{1}'.format(err_train_setting, err_test_setting))
         
     
 
@@ -129,3 +129,19 @@ plt.plot(test_pred)
 plt.xlabel("n")
 plt.ylabel("X[n]")
 
+
+
+# Generative mode: after the training sequence, the ESN runs freely and each prediction is the next input.
+
+# In[10]:
+
+
+test_gen = esn.generate(X=train_in, n_steps=testLen, autoregressive=True)
+print("Generation MSE (first 100 steps):\t{0}".format(mean_squared_error(y_true=test_out[:100], y_pred=test_gen[:100])))
+
+plt.figure()
+plt.plot(test_out)
+plt.plot(test_gen)
+plt.xlabel("n")
+plt.ylabel("X[n]")
+
@@ -21,6 +21,7 @@ import csv
 from collections import deque
 from intervaltree import IntervalTree
 from sklearn.base import clone
+from sklearn.model_selection import LeaveOneGroupOut
 from joblib import dump, load
 
 from matplotlib import pyplot as plt
@@ -183,6 +184,24 @@ if should_train:
         break  # Here, we have trained a model on seven folds. It can be now evaluated on the training and tests examples.
 
 
+# The regularization of the readout can be cross-validated over the eight folds without training eight models: With keep_sequence_statistics=True, partial_fit keeps xTx and xTy of every file, and cross_validate_readout solves the readout of each fold from the statistics of its training files. The features need to be passed through the ESN only once.
+
+# In[ ]:
+
+
+if should_train:
+    esn_cv = clone(esn1).set_params(keep_sequence_statistics=True)
+    groups = []
+    for fold, fold_files in enumerate(get_splits()):
+        for fid in fold_files:
+            X, y_true, _ = extract_features(r"C:\Users\Steiner\Documents\Python\PyRCN\examples\dataset\onset_detection\boeck_dataset", file_name=fid)
+            esn_cv.partial_fit(X=X, y=y_true, update_output_weights=False)
+            groups.append(fold)
+    betas = [1e-5, 1e-4, 1e-3, 1e-2]
+    scores = esn_cv.cross_validate_readout(cv=LeaveOneGroupOut(), groups=groups, betas=betas)
+    print("Best beta: {0}".format(betas[np.argmax(scores.mean(axis=0))]))
+
+
 # ## Validate the ESN model
 # 
 # This might take a long time, because we stay in line with the reference algorithms and use 8-fold cross validation. 
@@ -9,8 +9,25 @@ The :mod:`pyrcn` module includes various reservoir computing algorithms.
 #         the pyrcn community. ELM are copyright of their respective owners.
 # License: BSD 3-Clause (C) TU Dresden 2020
 
-from pyrcn import extreme_learning_machine, base
+import importlib
 
 __all__ = ['extreme_learning_machine',
-           'base'
+           'base',
+           'cache',
+           'echo_state_network',
+           'linear_model',
+           'model_selection',
+           'preprocessing',
+           'serialization'
            ]
+
+
+def __getattr__(name):
+    # The submodules are imported on first access, because importing scikit-learn dominates the import time of pyrcn.
+    if name in __all__:
+        return importlib.import_module('pyrcn.' + name)
+    raise AttributeError("module 'pyrcn' has no attribute '%s'" % name)
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -5,16 +5,103 @@ The :mod:`pyrcn.base`contains utilities for the reservoir computing modules
 # Author: Michael Schindler <michael.schindler@maschindler.de>
 # License: BSD 3 clause
 
+import time
+from functools import lru_cache
+
 import scipy
+import scipy.sparse
 import numpy as np
+from scipy.special import expit
 
-from sklearn.neural_network._base import ACTIVATIONS
-from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.base import BaseEstimator, TransformerMixin, clone
 from sklearn.utils import check_random_state
 from sklearn.utils.extmath import safe_sparse_dot
 from sklearn.exceptions import NotFittedError
 
 
+def inplace_identity(X):
+    """Return the input array.
+
+    Parameters
+    ----------
+    X : {array-like, sparse matrix}, shape (n_samples, n_features)
+        The input data.
+
+    Returns
+    -------
+    X : {array-like, sparse matrix}, shape (n_samples, n_features)
+        The input data.
+    """
+    return X
+
+
+def inplace_logistic(X):
+    """Compute the logistic function inplace.
+
+    Parameters
+    ----------
+    X : {array-like, sparse matrix}, shape (n_samples, n_features)
+        The input data.
+
+    Returns
+    -------
+    X : {array-like, sparse matrix}, shape (n_samples, n_features)
+        The transformed data.
+    """
+    return expit(X, out=X)
+
+
+def inplace_tanh(X):
+    """Compute the hyperbolic tan function inplace.
+
+    Parameters
+    ----------
+    X : {array-like, sparse matrix}, shape (n_samples, n_features)
+        The input data.
+
+    Returns
+    -------
+    X : {array-like, sparse matrix}, shape (n_samples, n_features)
+        The transformed data.
+    """
+    return np.tanh(X, out=X)
+
+
+def inplace_relu(X):
+    """Compute the rectified linear unit function inplace.
+
+    Parameters
+    ----------
+    X : {array-like, sparse matrix}, shape (n_samples, n_features)
+        The input data.
+
+    Returns
+    -------
+    X : {array-like, sparse matrix}, shape (n_samples, n_features)
+        The transformed data.
+    """
+    return np.maximum(X, 0, out=X)
+
+
+def inplace_softmax(X):
+    """Compute the K-way softmax function inplace.
+
+    Parameters
+    ----------
+    X : {array-like, sparse matrix}, shape (n_samples, n_features)
+        The input data.
+
+    Returns
+    -------
+    X : {array-like, sparse matrix}, shape (n_samples, n_features)
+        The transformed data.
+    """
+    X -= X.max(axis=-1, keepdims=True)
+    np.exp(X, out=X)
+    X /= X.sum(axis=-1, keepdims=True)
+    return X
+
+
 def inplace_bounded_relu(X):
     """Compute the bounded rectified linear unit function inplace.
 
@@ -22,8 +109,14 @@ def inplace_bounded_relu(X):
     ----------
     X : {array-like, sparse matrix}, shape (n_samples, n_features)
         The input data.
+
+    Returns
+    -------
+    X : {array-like, sparse matrix}, shape (n_samples, n_features)
+        The transformed data.
     """
-    np.minimum(np.maximum(X, 0), 1, out=X)
+    np.maximum(X, 0, out=X)
+    return np.minimum(X, 1, out=X)
 
 
 def inplace_tanh_inverse(X):
@@ -59,7 +152,14 @@ def inplace_logistic_inverse(X):
     np.negative(np.log(1 - X), out=X)
 
 
-ACTIVATIONS.update({'bounded_relu': inplace_bounded_relu})
+ACTIVATIONS = {
+    'identity': inplace_identity,
+    'logistic': inplace_logistic,
+    'tanh': inplace_tanh,
+    'relu': inplace_relu,
+    'softmax': inplace_softmax,
+    'bounded_relu': inplace_bounded_relu
+}
 
 ACTIVATIONS_INVERSE = {
     'tanh': inplace_tanh_inverse,
@@ -67,6 +167,19 @@ ACTIVATIONS_INVERSE = {
     'logistic': inplace_logistic_inverse
 }
 
+_FASTFOOD_BATCH_ELEMENTS = 1 << 16
+
+MATRIX_FORMATS = ('dense', 'csr', 'csc', 'fixed_fan_in')
+# Formats of matrices with a known structure, which are not candidates of select_matrix_format
+STRUCTURED_FORMATS = ('cycle', 'delay_line', 'block_diagonal')
+
+# Matrices with more elements are not considered for the dense format
+_DENSE_MAX_ELEMENTS = 1 << 22
+# Minimum duration of one timing of a candidate format in seconds
+_FORMAT_BENCHMARK_TIME = 1e-3
+# Fastest format per (shape, number of non-zero entries, number of vectors)
+_MATRIX_FORMAT_CACHE = {}
+
 
 class InputToNode(BaseEstimator, TransformerMixin):
     """InputToNode class for reservoir computing modules (e.g. ELM)
@@ -106,7 +219,6 @@ class InputToNode(BaseEstimator, TransformerMixin):
 
         self._input_weights = None
         self._bias = None
-        self._hidden_layer_state = None
 
     def fit(self, X, y=None):
         """Fit the InputToNode. Initialize input weights and bias.
@@ -123,22 +235,26 @@ class InputToNode(BaseEstimator, TransformerMixin):
         self._validate_hyperparameters()
         self._validate_data(X, y)
         self._check_n_features(X, reset=True)
+        # the scaling factors are folded into the stored weights once, so that transform does not need to rescale
         self._input_weights = self._uniform_random_input_weights(
             n_features_in=self.n_features_in_,
             hidden_layer_size=self.hidden_layer_size,
             fan_in=np.rint(self.hidden_layer_size * self.sparsity).astype(int),
-            random_state=self.random_state)
+            random_state=self.random_state) * self.input_scaling
         self._bias = self._uniform_random_bias(
             hidden_layer_size=self.hidden_layer_size,
-            random_state=self.random_state)
+            random_state=self.random_state) * self.bias_scaling
         return self
 
-    def transform(self, X):
+    def transform(self, X, out=None):
         """Transforms the input matrix X.
 
         Parameters
         ----------
         X : {ndarray, sparse matrix} of size (n_samples, n_features)
+        out : ndarray of size (n_samples, hidden_layer_size), default=None
+            Array the result is written to, e.g. a column block of a larger hidden layer state.
+            If None, a new array is allocated.
 
         Returns
         -------
@@ -147,11 +263,13 @@ class InputToNode(BaseEstimator, TransformerMixin):
         if self._input_weights is None or self._bias is None:
             raise NotFittedError(self)
 
-        self._hidden_layer_state =\
-            safe_sparse_dot(X, self._input_weights) * self.input_scaling\
-            + np.ones(shape=(X.shape[0], 1)) * self._bias * self.bias_scaling
-        ACTIVATIONS[self.activation](self._hidden_layer_state)
-        return self._hidden_layer_state
+        if out is None:
+            out = np.empty(shape=(X.shape[0], self.hidden_layer_size))
+
+        _project(X, self._input_weights, out=out)
+        out += self._bias
+        ACTIVATIONS[self.activation](out)
+        return out
 
     @staticmethod
     def _uniform_random_input_weights(n_features_in: int, hidden_layer_size: int, fan_in: int, random_state):
@@ -191,3 +309,629 @@ class InputToNode(BaseEstimator, TransformerMixin):
         if self.activation not in ACTIVATIONS:
             raise ValueError("The activation_function '%s' is not supported. Supported "
                              "activations are %s." % (self.activation, ACTIVATIONS))
+
+
+class FastfoodInputToNode(InputToNode):
+    """InputToNode class with structured random input weights for very large hidden layers.
+
+    Instead of a dense or sparse random matrix, the input weights are composed of blocks of size d, where d is the
+    number of input features rounded up to the next power of two [1]_. Every block is the product
+    V = S H G P H B / sqrt(d) of a diagonal random sign matrix B, the Walsh-Hadamard matrix H, a random permutation P,
+    a diagonal Gaussian matrix G and a diagonal scaling matrix S. Each row of V is approximately distributed like a
+    vector of independent standard normal variables.
+
+    The projection costs O(hidden_layer_size * log(n_features)) per sample and only O(hidden_layer_size) parameters
+    need to be stored.
+
+    .. [1] http://proceedings.mlr.press/v28/le13.html
+
+    References
+    ----------
+
+    Q. Le, T. Sarlos and A. Smola, "Fastfood - Approximating Kernel Expansions in Loglinear Time,"
+    in Proceedings of the 30th International Conference on Machine Learning, pp. 244-252, 2013.
+
+    Parameters
+    ----------
+    hidden_layer_size : int, default=500
+        Sets the number of nodes in hidden layer. Equals number of output features.
+    activation : {'tanh', 'identity', 'logistic', 'relu', 'bounded_relu'}, default='tanh'
+        This element represents the activation function in the hidden layer.
+    input_scaling : float, default=1.
+        Scales the input weight matrix.
+    bias_scaling : float, default=1.
+        Scales the input bias of the activation.
+    random_state : {None, int, RandomState}, default=None
+    """
+    def __init__(self,
+                 hidden_layer_size=500,
+                 activation='tanh',
+                 input_scaling=1.,
+                 bias_scaling=1.,
+                 random_state=None):
+        super().__init__(hidden_layer_size=hidden_layer_size,
+                         activation=activation,
+                         input_scaling=input_scaling,
+                         bias_scaling=bias_scaling,
+                         random_state=random_state)
+        self._signs = None
+        self._permutation = None
+        self._gaussian = None
+        self._scaling = None
+
+    def fit(self, X, y=None):
+        """Fit the FastfoodInputToNode. Initialize the structured input weights and bias.
+
+        Parameters
+        ----------
+        X : {ndarray, sparse matrix} of shape (n_samples, n_features)
+        y : ignored
+
+        Returns
+        -------
+        self
+        """
+        self._validate_hyperparameters()
+        self._validate_data(X, y, accept_sparse=True)
+        self._check_n_features(X, reset=True)
+
+        block_size = 1 << int(np.ceil(np.log2(max(self.n_features_in_, 2))))
+        n_blocks = int(np.ceil(self.hidden_layer_size / block_size))
+        shape = (n_blocks, block_size)
+
+        self._signs = self.random_state.choice([-1., 1.], size=shape)
+        self._permutation = np.argsort(self.random_state.uniform(size=shape), axis=1)
+        self._gaussian = self.random_state.normal(size=shape)
+        # chi distributed row norms, as for a matrix with independent standard normal entries
+        row_norms = np.sqrt(self.random_state.chisquare(df=block_size, size=shape))
+        self._scaling = row_norms / np.linalg.norm(self._gaussian, axis=1, keepdims=True) \
+            / np.sqrt(block_size) * self.input_scaling
+        self._bias = self._uniform_random_bias(
+            hidden_layer_size=self.hidden_layer_size,
+            random_state=self.random_state) * self.bias_scaling
+        return self
+
+    def transform(self, X, out=None):
+        """Transforms the input matrix X.
+
+        Parameters
+        ----------
+        X : {ndarray, sparse matrix} of size (n_samples, n_features)
+            Sparse matrices are converted to dense arrays.
+        out : ndarray of size (n_samples, hidden_layer_size), default=None
+            Array the result is written to, e.g. a column block of a larger hidden layer state.
+            If None, a new array is allocated.
+
+        Returns
+        -------
+        Y: ndarray of size (n_samples, hidden_layer_size)
+        """
+        if self._gaussian is None or self._bias is None:
+            raise NotFittedError(self)
+        self._check_n_features(X, reset=False)
+
+        if scipy.sparse.issparse(X):
+            X = X.toarray()
+        n_samples, n_features = X.shape
+        n_blocks, block_size = self._gaussian.shape
+
+        if out is None:
+            out = np.empty(shape=(n_samples, self.hidden_layer_size))
+
+        # small batches of samples keep the intermediate results in the cache during the butterfly passes
+        batch_size = max(1, _FASTFOOD_BATCH_ELEMENTS // (n_blocks * block_size))
+        permutation = (self._permutation + np.arange(n_blocks)[:, np.newaxis] * block_size).ravel()
+        for start in range(0, n_samples, batch_size):
+            stop = min(start + batch_size, n_samples)
+            projection = np.zeros(shape=(stop - start, n_blocks, block_size))
+            np.multiply(X[start:stop, np.newaxis, :], self._signs[:, :n_features], out=projection[:, :, :n_features])
+            _inplace_fwht(projection)
+            projection = np.take(projection.reshape((stop - start, n_blocks * block_size)), permutation, axis=1)
+            projection = projection.reshape((stop - start, n_blocks, block_size))
+            projection *= self._gaussian
+            _inplace_fwht(projection)
+            projection *= self._scaling
+            out[start:stop, :] = projection.reshape((stop - start, n_blocks * block_size))[:, :self.hidden_layer_size]
+
+        out += self._bias
+        ACTIVATIONS[self.activation](out)
+        return out
+
+    def _validate_hyperparameters(self):
+        """Validates the hyperparameters.
+
+        Returns
+        -------
+
+        """
+        if self.hidden_layer_size <= 0:
+            raise ValueError("hidden_layer_size must be > 0, got %s." % self.hidden_layer_size)
+        if self.input_scaling <= 0.:
+            raise ValueError("input_scaling must be > 0, got %s." % self.input_scaling)
+        if self.bias_scaling < 0:
+            raise ValueError("bias must be > 0, got %s." % self.bias_scaling)
+        if self.activation not in ACTIVATIONS:
+            raise ValueError("The activation_function '%s' is not supported. Supported "
+                             "activations are %s." % (self.activation, ACTIVATIONS))
+
+
+class InputToNodeUnion(BaseEstimator, TransformerMixin):
+    """Concatenates the results of multiple input-to-node transformers.
+
+    Unlike :class:`sklearn.pipeline.FeatureUnion`, the combined hidden layer state is allocated only once. Each
+    transformer writes its output into its own column block of that array, so that the results do not need to be
+    stacked in an additional copy. The transformers run in parallel threads.
+
+    Parameters
+    ----------
+    transformer_list : list of (string, transformer) tuples
+        List of transformer objects to be applied to the data. The first half of each tuple is the name of the
+        transformer. The transformer can be 'drop' for it to be ignored.
+    n_jobs : int, default=None
+        The number of threads to run in parallel. ``-1`` means using all processors.
+    transformer_weights : dict, default=None
+        Multiplicative weights for features per transformer. Keys are transformer names, values the weights.
+    """
+    def __init__(self, transformer_list, n_jobs=None, transformer_weights=None):
+        self.transformer_list = transformer_list
+        self.n_jobs = n_jobs
+        self.transformer_weights = transformer_weights
+
+        self._transformers = None
+        self._slices = None
+
+    def fit(self, X, y=None):
+        """Fit all transformers using X.
+
+        Parameters
+        ----------
+        X : {ndarray, sparse matrix} of shape (n_samples, n_features)
+        y : ignored
+
+        Returns
+        -------
+        self
+        """
+        transformers = [(name, transformer) for name, transformer in self.transformer_list if transformer != 'drop']
+        if not transformers:
+            raise ValueError("transformer_list must contain at least one transformer that is not 'drop'.")
+
+        from joblib import Parallel, delayed
+        fitted = Parallel(n_jobs=self.n_jobs, prefer='threads')(
+            delayed(_fit_one)(clone(transformer), X, y) for _, transformer in transformers)
+
+        self._transformers = []
+        self._slices = []
+        start = 0
+        for (name, _), transformer in zip(transformers, fitted):
+            stop = start + _n_output_features(transformer, X)
+            self._transformers.append((name, transformer, self._transformer_weight(name)))
+            self._slices.append(slice(start, stop))
+            start = stop
+        return self
+
+    def transform(self, X):
+        """Transforms the input matrix X by all transformers and concatenates the results.
+
+        Parameters
+        ----------
+        X : {ndarray, sparse matrix} of size (n_samples, n_features)
+
+        Returns
+        -------
+        Y: ndarray of size (n_samples, sum of the output sizes of all transformers)
+        """
+        if self._transformers is None:
+            raise NotFittedError(self)
+
+        from joblib import Parallel, delayed
+        hidden_layer_state = np.empty(shape=(X.shape[0], self._slices[-1].stop))
+        Parallel(n_jobs=self.n_jobs, prefer='threads')(
+            delayed(_transform_one)(transformer, X, hidden_layer_state[:, sl], weight)
+            for (_, transformer, weight), sl in zip(self._transformers, self._slices))
+        return hidden_layer_state
+
+    def _transformer_weight(self, name):
+        if self.transformer_weights is None:
+            return None
+        return self.transformer_weights.get(name)
+
+
+class FixedFanInMatrix:
+    """Sparse matrix with a fixed number of non-zero entries per row (ELLPACK format).
+
+    The column indices and values are stored in two dense arrays of shape (n_rows, fan_in). Rows with fewer non-zero
+    entries are padded with zeros. A matrix-vector product is a single gather, multiplication and row sum, without the
+    dispatch overhead of scipy.sparse, which makes this format suited for the recurrence of a reservoir.
+
+    Parameters
+    ----------
+    indices : ndarray of shape (n_rows, fan_in)
+        The column indices of the entries of every row.
+    data : ndarray of shape (n_rows, fan_in)
+        The values of the entries of every row.
+    shape : tuple of (n_rows, n_columns)
+        The shape of the matrix.
+    """
+    def __init__(self, indices, data, shape):
+        self.indices = indices
+        self.data = data
+        self.shape = shape
+
+    @classmethod
+    def from_sparse(cls, matrix, scale=1.):
+        """Converts a sparse or dense matrix.
+
+        Parameters
+        ----------
+        matrix : {ndarray, sparse matrix} of shape (n_rows, n_columns)
+        scale : float, default=1.
+            Factor that is multiplied with all values.
+
+        Returns
+        -------
+        matrix : FixedFanInMatrix
+        """
+        matrix = scipy.sparse.csr_matrix(matrix)
+        n_rows = matrix.shape[0]
+        row_nnz = np.diff(matrix.indptr)
+        fan_in = row_nnz.max(initial=0)
+        # position of every entry inside its row
+        positions = np.arange(matrix.nnz) - np.repeat(matrix.indptr[:-1], row_nnz)
+        rows = np.repeat(np.arange(n_rows), row_nnz)
+        indices = np.zeros(shape=(n_rows, fan_in), dtype=np.intp)
+        data = np.zeros(shape=(n_rows, fan_in), dtype=matrix.dtype)
+        indices[rows, positions] = matrix.indices
+        data[rows, positions] = matrix.data * scale
+        return cls(indices, data, matrix.shape)
+
+    def dot(self, x):
+        """Computes the product of the matrix with x.
+
+        Parameters
+        ----------
+        x : ndarray of shape (n_columns, ) or (n_columns, n_vectors)
+            A vector or several vectors, e.g. the states of several sequences, as columns.
+
+        Returns
+        -------
+        y : ndarray of shape (n_rows, ) or (n_rows, n_vectors)
+        """
+        if x.ndim == 1:
+            return np.einsum('ij,ij->i', self.data, x[self.indices])
+        return np.einsum('ij,ijk->ik', self.data, x[self.indices])
+
+    def toarray(self):
+        """Returns the matrix as dense array.
+
+        Returns
+        -------
+        matrix : ndarray of shape (n_rows, n_columns)
+        """
+        return self.tocsr().toarray()
+
+    def tocsr(self):
+        """Returns the matrix in CSR format.
+
+        Returns
+        -------
+        matrix : scipy.sparse.csr_matrix of shape (n_rows, n_columns)
+        """
+        n_rows, fan_in = self.indices.shape
+        matrix = scipy.sparse.csr_matrix((self.data.ravel(), self.indices.ravel(), np.arange(n_rows + 1) * fan_in),
+                                         shape=self.shape, copy=True)
+        matrix.sum_duplicates()
+        return matrix
+
+
+class CycleMatrix:
+    """Weighted cyclic shift matrix with the entries (i, i - 1) for all rows i, where row 0 is connected to the last
+    column.
+
+    Parameters
+    ----------
+    weights : ndarray of shape (n_rows, )
+        The entry of every row.
+    """
+    def __init__(self, weights):
+        self.weights = weights
+        self.shape = (weights.shape[0], weights.shape[0])
+
+    @classmethod
+    def from_sparse(cls, matrix, scale=1.):
+        """Extracts the cyclic shift from a sparse or dense matrix. All other entries are ignored.
+
+        Parameters
+        ----------
+        matrix : {ndarray, sparse matrix} of shape (n_rows, n_rows)
+        scale : float, default=1.
+            Factor that is multiplied with all values.
+
+        Returns
+        -------
+        matrix : CycleMatrix
+        """
+        matrix = scipy.sparse.csr_matrix(matrix)
+        return cls(np.concatenate(([matrix[0, -1]], matrix.diagonal(k=-1))) * scale)
+
+    def dot(self, x):
+        """Computes the product of the matrix with x.
+
+        Parameters
+        ----------
+        x : ndarray of shape (n_rows, ) or (n_rows, n_vectors)
+
+        Returns
+        -------
+        y : ndarray of shape (n_rows, ) or (n_rows, n_vectors)
+        """
+        return np.roll(x, 1, axis=0) * self.weights.reshape((-1, ) + (1, ) * (x.ndim - 1))
+
+    def toarray(self):
+        """Returns the matrix as dense array."""
+        return self.tocsr().toarray()
+
+    def tocsr(self):
+        """Returns the matrix in CSR format."""
+        n_rows = self.shape[0]
+        return scipy.sparse.csr_matrix((self.weights, (np.arange(n_rows), np.arange(-1, n_rows - 1) % n_rows)),
+                                       shape=self.shape)
+
+
+class DelayLineMatrix:
+    """Delay line with feedback, i.e. a matrix with non-zero entries only on the first sub- and superdiagonal.
+
+    Parameters
+    ----------
+    forward : ndarray of shape (n_rows - 1, )
+        The entries (i + 1, i) of the delay line.
+    feedback : ndarray of shape (n_rows - 1, )
+        The entries (i, i + 1) of the feedback connections.
+    """
+    def __init__(self, forward, feedback):
+        self.forward = forward
+        self.feedback = feedback
+        self.shape = (forward.shape[0] + 1, forward.shape[0] + 1)
+
+    @classmethod
+    def from_sparse(cls, matrix, scale=1.):
+        """Extracts the sub- and superdiagonal from a sparse or dense matrix. All other entries are ignored.
+
+        Parameters
+        ----------
+        matrix : {ndarray, sparse matrix} of shape (n_rows, n_rows)
+        scale : float, default=1.
+            Factor that is multiplied with all values.
+
+        Returns
+        -------
+        matrix : DelayLineMatrix
+        """
+        matrix = scipy.sparse.csr_matrix(matrix)
+        return cls(matrix.diagonal(k=-1) * scale, matrix.diagonal(k=1) * scale)
+
+    def dot(self, x):
+        """Computes the product of the matrix with x.
+
+        Parameters
+        ----------
+        x : ndarray of shape (n_rows, ) or (n_rows, n_vectors)
+
+        Returns
+        -------
+        y : ndarray of shape (n_rows, ) or (n_rows, n_vectors)
+        """
+        shape = (-1, ) + (1, ) * (x.ndim - 1)
+        y = np.zeros_like(x)
+        np.multiply(x[:-1], self.forward.reshape(shape), out=y[1:])
+        y[:-1] += x[1:] * self.feedback.reshape(shape)
+        return y
+
+    def toarray(self):
+        """Returns the matrix as dense array."""
+        return self.tocsr().toarray()
+
+    def tocsr(self):
+        """Returns the matrix in CSR format."""
+        return scipy.sparse.diags([self.forward, self.feedback], offsets=[-1, 1], shape=self.shape, format='csr')
+
+
+class BlockDiagonalMatrix:
+    """Block-diagonal matrix with dense square blocks of equal size.
+
+    Parameters
+    ----------
+    blocks : ndarray of shape (n_blocks, block_size, block_size)
+        The blocks on the diagonal.
+    """
+    def __init__(self, blocks):
+        self.blocks = blocks
+        self.shape = (blocks.shape[0] * blocks.shape[1], blocks.shape[0] * blocks.shape[1])
+
+    @classmethod
+    def from_sparse(cls, matrix, block_size, scale=1.):
+        """Converts a sparse or dense block-diagonal matrix.
+
+        Parameters
+        ----------
+        matrix : {ndarray, sparse matrix} of shape (n_rows, n_rows)
+        block_size : int
+            The size of the blocks. It must divide n_rows.
+        scale : float, default=1.
+            Factor that is multiplied with all values.
+
+        Returns
+        -------
+        matrix : BlockDiagonalMatrix
+        """
+        matrix = scipy.sparse.coo_matrix(matrix)
+        if matrix.shape[0] % block_size != 0:
+            raise ValueError("The block size %s does not divide the size of the matrix %s."
+                             % (block_size, matrix.shape[0]))
+        if np.any(matrix.row // block_size != matrix.col // block_size):
+            raise ValueError("The matrix has non-zero entries outside of the blocks of size %s." % block_size)
+        blocks = np.zeros(shape=(matrix.shape[0] // block_size, block_size, block_size), dtype=matrix.dtype)
+        blocks[matrix.row // block_size, matrix.row % block_size, matrix.col % block_size] = matrix.data * scale
+        return cls(blocks)
+
+    def dot(self, x):
+        """Computes the product of the matrix with x.
+
+        Parameters
+        ----------
+        x : ndarray of shape (n_rows, ) or (n_rows, n_vectors)
+
+        Returns
+        -------
+        y : ndarray of shape (n_rows, ) or (n_rows, n_vectors)
+        """
+        n_blocks, block_size, _ = self.blocks.shape
+        return np.matmul(self.blocks, x.reshape(n_blocks, block_size, -1)).reshape(x.shape)
+
+    def toarray(self):
+        """Returns the matrix as dense array."""
+        return self.tocsr().toarray()
+
+    def tocsr(self):
+        """Returns the matrix in CSR format."""
+        return scipy.sparse.block_diag(self.blocks, format='csr')
+
+
+def convert_matrix(matrix, matrix_format, scale=1., block_size=None):
+    """Converts a matrix to one of the formats in MATRIX_FORMATS or STRUCTURED_FORMATS. All formats provide a dot
+    method.
+
+    The structured formats only keep the entries of the respective structure, all other entries are ignored.
+
+    Parameters
+    ----------
+    matrix : {ndarray, sparse matrix} of shape (n_rows, n_columns)
+    matrix_format : {'dense', 'csr', 'csc', 'fixed_fan_in', 'cycle', 'delay_line', 'block_diagonal'}
+    scale : float, default=1.
+        Factor that is multiplied with all values.
+    block_size : int, default=None
+        The size of the blocks for the format 'block_diagonal'.
+
+    Returns
+    -------
+    matrix : {ndarray, csr_matrix, csc_matrix, FixedFanInMatrix, CycleMatrix, DelayLineMatrix, BlockDiagonalMatrix}
+        A scaled copy of the matrix in the requested format.
+    """
+    if hasattr(matrix, 'tocsr') and not scipy.sparse.issparse(matrix):
+        matrix = matrix.tocsr()
+    if matrix_format == 'dense':
+        return (matrix.toarray() if scipy.sparse.issparse(matrix) else np.array(matrix)) * scale
+    if matrix_format == 'csr':
+        return scipy.sparse.csr_matrix(matrix) * scale
+    if matrix_format == 'csc':
+        return scipy.sparse.csc_matrix(matrix) * scale
+    if matrix_format == 'fixed_fan_in':
+        return FixedFanInMatrix.from_sparse(matrix, scale=scale)
+    if matrix_format == 'cycle':
+        return CycleMatrix.from_sparse(matrix, scale=scale)
+    if matrix_format == 'delay_line':
+        return DelayLineMatrix.from_sparse(matrix, scale=scale)
+    if matrix_format == 'block_diagonal':
+        return BlockDiagonalMatrix.from_sparse(matrix, block_size=block_size, scale=scale)
+    raise ValueError("The matrix format %s is not supported. Expected one of: %s"
+                     % (matrix_format, ", ".join(MATRIX_FORMATS + STRUCTURED_FORMATS)))
+
+
+def select_matrix_format(matrix, n_vectors=1):
+    """Finds the format with the fastest product of matrix and n_vectors vectors.
+
+    Every candidate in MATRIX_FORMATS is benchmarked once for the shape and the number of non-zero entries of matrix.
+    The result is cached, so that the benchmark is not repeated for matrices of the same structure. Dense matrices with
+    more than _DENSE_MAX_ELEMENTS elements are not considered.
+
+    Parameters
+    ----------
+    matrix : {ndarray, sparse matrix} of shape (n_rows, n_columns)
+    n_vectors : int, default=1
+        The number of vectors that are multiplied at once, e.g. the number of sequences in a batch.
+
+    Returns
+    -------
+    matrix_format : {'dense', 'csr', 'csc', 'fixed_fan_in'}
+    """
+    nnz = matrix.nnz if scipy.sparse.issparse(matrix) else np.count_nonzero(matrix)
+    key = (matrix.shape, nnz, n_vectors)
+    if key not in _MATRIX_FORMAT_CACHE:
+        x = np.random.RandomState(0).randn(*((matrix.shape[1], ) if n_vectors == 1 else (matrix.shape[1], n_vectors)))
+        timings = {}
+        for matrix_format in MATRIX_FORMATS:
+            if matrix_format == 'dense' and matrix.shape[0] * matrix.shape[1] > _DENSE_MAX_ELEMENTS:
+                continue
+            timings[matrix_format] = _time_dot(convert_matrix(matrix, matrix_format), x)
+        _MATRIX_FORMAT_CACHE[key] = min(timings, key=timings.get)
+    return _MATRIX_FORMAT_CACHE[key]
+
+
+def _time_dot(matrix, x, repeat=3):
+    """Returns the shortest time of one product of matrix and x in repeat measurements."""
+    start = time.perf_counter()
+    matrix.dot(x)
+    number = max(1, int(_FORMAT_BENCHMARK_TIME / max(time.perf_counter() - start, 1e-9)))
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            matrix.dot(x)
+        timings.append((time.perf_counter() - start) / number)
+    return min(timings)
+
+
+def _fit_one(transformer, X, y):
+    return transformer.fit(X, y)
+
+
+def _transform_one(transformer, X, out, weight):
+    if isinstance(transformer, InputToNode):
+        transformer.transform(X, out=out)
+    else:
+        out[...] = transformer.transform(X)
+    if weight is not None:
+        out *= weight
+
+
+def _n_output_features(transformer, X):
+    if isinstance(transformer, InputToNode):
+        return transformer.hidden_layer_size
+    return transformer.transform(X[:1]).shape[1]
+
+
+def _project(X, weights, out):
+    """Computes the product of X and weights into the preallocated array out."""
+    if scipy.sparse.issparse(X) or scipy.sparse.issparse(weights):
+        out[...] = safe_sparse_dot(X, weights, dense_output=True)
+    else:
+        np.matmul(X, weights, out=out)
+
+
+def _inplace_fwht(X):
+    """Computes the unnormalized fast Walsh-Hadamard transform along the last axis of X inplace.
+
+    Parameters
+    ----------
+    X : ndarray of shape (..., d)
+        C-contiguous input data. d must be a power of two.
+    """
+    d = X.shape[-1]
+    # the first butterfly passes only combine neighbouring entries and are faster as a small dense product
+    h = min(d, 16)
+    blocks = X.reshape((-1, h))
+    blocks[...] = np.matmul(blocks, _hadamard(h))
+    while h < d:
+        butterfly = X.reshape(X.shape[:-1] + (d // (2 * h), 2, h))
+        upper = butterfly[..., 0, :]
+        lower = butterfly[..., 1, :]
+        difference = upper - lower
+        upper += lower
+        lower[...] = difference
+        h *= 2
+
+
+@lru_cache(maxsize=None)
+def _hadamard(n):
+    import scipy.linalg
+    return scipy.linalg.hadamard(n, dtype=float)
@@ -0,0 +1,167 @@
+"""
+The :mod:`pyrcn.cache` module stores reservoir states on disk, so that they do not need to be recomputed when only the
+readout changes.
+"""
+
+# Author: Michael Schindler <michael.schindler@maschindler.de>
+# License: BSD 3 clause
+
+import os
+import re
+import hashlib
+import threading
+
+import scipy.sparse
+import numpy as np
+
+from sklearn.base import BaseEstimator
+
+# the file names of the stored states, i.e. the keys returned by ReservoirStateCache.key
+_ENTRY_PATTERN = re.compile(r'^[0-9a-f]{40}\.npy$')
+
+
+class ReservoirStateCache(BaseEstimator):
+    """Content-addressed cache of reservoir states.
+
+    The states are stored as .npy files in directory, named by a hash of everything that determines them, i.e. the
+    weights, the hyperparameters that scale them and the input data. They are memory mapped when loaded. If the
+    stored states exceed max_bytes, the least recently used ones are removed. Other files in directory are neither
+    counted nor removed.
+
+    Parameters
+    ----------
+    directory : str
+        The directory to store the states in. It is created if it does not exist.
+    max_bytes : int, default 2 ** 30
+        The size budget of all stored states.
+    dtype : {'float16', 'float32', 'float64'}, default 'float64'
+        The precision of the stored states. With 'float64', the loaded states are the memory mapped files and are
+        exactly the computed states. 'float32' and 'float16' reduce the size of the cache, but the loaded states are
+        rounded and converted to float64 in memory.
+    """
+    def __init__(self, directory, max_bytes: int = 2 ** 30, dtype: str = 'float64'):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.dtype = dtype
+
+    def key(self, *arrays, **params):
+        """
+        Compute the key of the states that are determined by arrays and params.
+
+        Parameters
+        ----------
+        arrays : ndarray or sparse matrix
+            The weights and the input data
+        params : dict
+            The hyperparameters. Their values need to have a deterministic repr.
+
+        Returns
+        -------
+        key : str
+        """
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(repr((sorted(params.items()), self.dtype)).encode())
+        for array in arrays:
+            if scipy.sparse.issparse(array):
+                array = array.tocsr()
+                parts = [array.data, array.indices, array.indptr]
+            else:
+                parts = [np.asarray(array)]
+            digest.update(repr(array.shape).encode())
+            for part in parts:
+                part = np.ascontiguousarray(part)
+                digest.update(part.dtype.str.encode())
+                digest.update(part.view(np.uint8).data)
+        return digest.hexdigest()
+
+    def load(self, key):
+        """
+        Load the states stored under key and mark them as recently used.
+
+        Parameters
+        ----------
+        key : str
+
+        Returns
+        -------
+        states : ndarray or None
+            The stored states, or None if they are not in the cache. States stored as float64 are returned as read-only
+            memory map.
+        """
+        path = self._path(key)
+        try:
+            states = np.load(path, mmap_mode='r')
+            os.utime(path)
+        except (FileNotFoundError, ValueError):
+            return None
+        if states.dtype != np.float64:
+            return states.astype(np.float64)
+        return states
+
+    def store(self, key, states):
+        """
+        Store states under key and remove the least recently used states if the size budget is exceeded. States that
+        are larger than the size budget are not stored.
+
+        Parameters
+        ----------
+        key : str
+        states : ndarray of shape (n_samples, n_features)
+
+        Returns
+        -------
+
+        """
+        if states.size * np.dtype(self.dtype).itemsize > self.max_bytes:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        temporary_path = '%s.%d.%d.tmp' % (path, os.getpid(), threading.get_ident())
+        with open(temporary_path, 'wb') as f:
+            np.save(f, states.astype(self.dtype, copy=False))
+        # readers never see partially written files
+        os.replace(temporary_path, path)
+        self._evict()
+
+    def clear(self):
+        """
+        Remove all stored states. Other files in directory are kept.
+
+        Returns
+        -------
+
+        """
+        for path, _, _ in self._entries():
+            os.remove(path)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.npy')
+
+    def _entries(self):
+        """Returns (path, size, mtime) of all stored states."""
+        if not os.path.isdir(self.directory):
+            return []
+        entries = []
+        for file_name in os.listdir(self.directory):
+            if not _ENTRY_PATTERN.match(file_name):
+                continue
+            path = os.path.join(self.directory, file_name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _evict(self):
+        """Remove the least recently used states until all stored states fit into max_bytes."""
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        size = sum(entry[1] for entry in entries)
+        for path, entry_size, _ in entries:
+            if size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= entry_size
@@ -1,25 +1,51 @@
+import os
+import copy
+import json
+import shutil
+import tempfile
+import warnings
+
 import scipy
+import scipy.sparse
 import numpy as np
-from sklearn.base import BaseEstimator, ClassifierMixin, RegressorMixin
-from sklearn.neural_network._base import ACTIVATIONS
+from sklearn.base import BaseEstimator, ClassifierMixin, RegressorMixin, clone
 from sklearn.utils import check_random_state
-from sklearn.utils import check_X_y, column_or_1d, check_array
-from sklearn.utils.validation import check_is_fitted
+from sklearn.utils import column_or_1d, check_array
+from sklearn.utils.validation import check_is_fitted, check_consistent_length
 from sklearn.utils.extmath import safe_sparse_dot
-from sklearn.preprocessing import LabelBinarizer
 from sklearn.utils.multiclass import _check_partial_fit_first_call
 from sklearn.exceptions import NotFittedError
 
-from joblib import Parallel, delayed
+from pyrcn.base import ACTIVATIONS, CycleMatrix, DelayLineMatrix, BlockDiagonalMatrix, convert_matrix, \
+    select_matrix_format
+from pyrcn.cache import ReservoirStateCache
+
+_OFFLINE_SOLVERS = ['pinv', 'ridge', 'lasso', 'cg']
+
+_RESERVOIR_TOPOLOGIES = ['random', 'cycle', 'delay_line', 'block_diagonal']
+
+# Hyperparameters that only scale the weights and can be evaluated in one batched pass
+_SETTING_PARAMETERS = ['input_scaling', 'spectral_radius', 'bias', 'leakage', 'beta']
+# Hyperparameters that, together with the weights, determine the reservoir states
+_STATE_PARAMETERS = ['input_scaling', 'spectral_radius', 'bias', 'ext_bias', 'leakage', 'reservoir_activation',
+                     'bi_directional', 'reservoir_topology', 'linear_scan', 'n_time_chunks', 'chunk_warm_up']
+# Fitted attributes that the recurrence requires
+_RECURRENCE_ATTRIBUTES = ['input_weights_', 'reservoir_weights_', 'bias_weights_', 'feedback_weights_',
+                          'output_weights_', 'n_outputs_', '_reservoir_format', '_reservoir_matrix']
 
-if scipy.__version__ == '0.9.0' or scipy.__version__ == '0.10.1':
-    from scipy.sparse.linalg import eigs as eigens
-    from scipy.sparse.linalg import ArpackNoConvergence
-else:
-    from scipy.sparse.linalg.eigen.arpack import eigs as eigens
-    from scipy.sparse.linalg.eigen.arpack import ArpackNoConvergence
+# Number of samples that are scanned at once with linear_scan
+_SCAN_BLOCK_SIZE = 256
+# Largest condition number of the eigenvectors of the reservoir weights for linear_scan
+_SCAN_MAX_CONDITION = 1e8
 
-_OFFLINE_SOLVERS = ['pinv', 'ridge', 'lasso']
+_CG_TOL = 1e-6
+_CG_MAX_ITER = 1000
+
+_BLOCK_SIZE = 1024
+# Number of array entries that are checked for finiteness at once
+_CHECK_BLOCK_SIZE = 2 ** 20
+
+_CHECKPOINT_VERSION = 1
 
 
 class BaseEchoStateNetwork(BaseEstimator):
@@ -32,10 +58,12 @@ class BaseEchoStateNetwork(BaseEstimator):
     """
 
     def __init__(self, k_in: int = 2, input_scaling: float = 1., spectral_radius: float = 0., bias: float = 0.,
-                 ext_bias: int = 0, leakage: float = 1., feedback_scaling: float = 0.,reservoir_size: int = 500,
+                 ext_bias: int = 0, leakage: float = 1., feedback_scaling: float = 0., reservoir_size: int = 500,
                  k_res: int = 10, wash_out: int = 0, reservoir_activation: str = 'tanh', bi_directional: bool = False,
                  teacher_scaling: float = 1., teacher_shift: float = 0., solver: str = 'ridge', beta: float = 1e-6,
-                 random_state: int = None):
+                 reorder_neurons: bool = False, reservoir_topology: str = 'random', linear_scan: bool = False,
+                 n_time_chunks: int = 1, chunk_warm_up: int = 100, keep_sequence_statistics: bool = False,
+                 state_cache: str = None, working_dir: str = None, random_state: int = None):
         self.k_in = k_in
         self.input_scaling = input_scaling
         self.spectral_radius = spectral_radius
@@ -52,6 +80,14 @@ class BaseEchoStateNetwork(BaseEstimator):
         self.teacher_shift = teacher_shift
         self.solver = solver
         self.beta = beta
+        self.reorder_neurons = reorder_neurons
+        self.reservoir_topology = reservoir_topology
+        self.linear_scan = linear_scan
+        self.n_time_chunks = n_time_chunks
+        self.chunk_warm_up = chunk_warm_up
+        self.keep_sequence_statistics = keep_sequence_statistics
+        self.state_cache = state_cache
+        self.working_dir = working_dir
         self.random_state = random_state
 
     def fit(self, X, y, n_jobs=0):
@@ -60,7 +96,7 @@ class BaseEchoStateNetwork(BaseEstimator):
 
         Parameters
         ----------
-        X : ndarray of shape (n_samples, n_features)
+        X : {ndarray, sparse matrix} of shape (n_samples, n_features)
             The input data
         y : ndarray of shape (n_samples, ) or (n_samples, n_outputs)
             The target values (class labels in classification, real numbers in regression).
@@ -76,7 +112,7 @@ class BaseEchoStateNetwork(BaseEstimator):
         self._validate_hyperparameters()
         X, y = self._validate_input(X, y)
         self._initialize(y=y, n_features=X.shape[1])
-        return self._fit(X, y, update_output_weights=True, n_jobs=n_jobs)
+        return self._fit(X, y, update_output_weights=True, n_jobs=n_jobs, scale_targets=True)
 
     def finalize(self, n_jobs=0):
         """
@@ -96,25 +132,28 @@ class BaseEchoStateNetwork(BaseEstimator):
 
     def _validate_input(self, X, y):
         """
-        Ensure that the input and output is in a proper format and transform it if possible.
+        Ensure that the input and output is in a proper format and transform it if possible. Float arrays, including
+        memory mapped arrays, are not copied. teacher_scaling and teacher_shift are not applied here, but when xTy is
+        updated.
         Parameters
         ----------
-        X : ndarray of shape (n_samples, n_features)
+        X : {ndarray, sparse matrix} of shape (n_samples, n_features)
             The input data
         y : ndarray of shape (n_samples, ) or (n_samples, n_outputs)
             The target values (class labels in classification, real numbers in regression).
 
         Returns
         -------
-        X : ndarray of shape (n_samples, n_features)
+        X : {ndarray, sparse matrix} of shape (n_samples, n_features)
             The input data
         y : ndarray of shape (n_samples, ) or (n_samples, n_outputs)
-            The target values (class labels in classification, real numbers in regression).
+            The unscaled target values (class labels in classification, real numbers in regression).
         """
-        X, y = check_X_y(X, y, accept_sparse=False, multi_output=True, y_numeric=True)
+        X = _check_input_array(X, accept_sparse='csr')
+        y = _check_input_array(y, ensure_2d=False, dtype='numeric')
+        check_consistent_length(X, y)
         if y.ndim == 2 and y.shape[1] == 1:
             y = column_or_1d(y, warn=True)
-        y = self.teacher_scaling * y + self.teacher_shift
         return X, y
 
     def _validate_hyperparameters(self):
@@ -145,12 +184,30 @@ class BaseEchoStateNetwork(BaseEstimator):
         if self.reservoir_activation not in supported_activations:
             raise ValueError("The reservoir_activation '%s' is not supported. Supported "
                              "activations are %s." % (self.reservoir_activation, supported_activations))
+        if self.reservoir_topology not in _RESERVOIR_TOPOLOGIES:
+            raise ValueError("The reservoir_topology %s is not supported. Expected one of: %s" %
+                             (self.reservoir_topology, ", ".join(_RESERVOIR_TOPOLOGIES)))
+        if self.reservoir_topology == 'delay_line' and self.reservoir_size < 2:
+            raise ValueError("reservoir_size must be >= 2 for a delay_line, got %s." % self.reservoir_size)
+        if self.reservoir_topology == 'block_diagonal' and self.reservoir_size % self.k_res != 0:
+            raise ValueError("reservoir_size must be a multiple of k_res for a block_diagonal reservoir, got %s and %s."
+                             % (self.reservoir_size, self.k_res))
+        if self.n_time_chunks < 1:
+            raise ValueError("n_time_chunks must be >= 1, got %s." % self.n_time_chunks)
+        if self.chunk_warm_up < 0:
+            raise ValueError("chunk_warm_up must be >= 0, got %s." % self.chunk_warm_up)
+        if self.linear_scan and self.reservoir_activation != 'identity':
+            raise ValueError("linear_scan requires the reservoir_activation 'identity', got '%s'."
+                             % self.reservoir_activation)
+        if self.feedback_scaling != 0 and (self.bi_directional or self.linear_scan or self.n_time_chunks > 1):
+            raise ValueError("feedback_scaling must be 0 with bi_directional, linear_scan or n_time_chunks > 1, "
+                             "got %s." % self.feedback_scaling)
         supported_solvers = _OFFLINE_SOLVERS
         if self.solver not in supported_solvers:
             raise ValueError("The solver %s is not supported. Expected one of: %s" %
                              (self.solver, ", ".join(supported_solvers)))
 
-    def _initialize(self, y, n_features):
+    def _initialize(self, y, n_features, collect_states=True):
         """
         Initialize everything for the Echo State Network. Set all attributes, allocate weights.
         Parameters
@@ -159,6 +216,8 @@ class BaseEchoStateNetwork(BaseEstimator):
             The target values (class labels in classification, real numbers in regression).
         n_features : int
             The number of input features, e.g. the second dimension of input matrix X
+        collect_states : bool, default True
+            If False, only the weights are initialized and no training statistics are allocated.
 
         Returns
         -------
@@ -180,20 +239,129 @@ class BaseEchoStateNetwork(BaseEstimator):
         self.input_weights_ = input_weights_init
         self.reservoir_weights_ = reservoir_weights_init
         self.bias_weights_ = bias_weights_init
+        self.feedback_weights_ = feedback_weights_init.T
         self.output_weights_ = output_weights_init
-        self._init_state_collection_matrices()
+        if self.reorder_neurons and self.reservoir_topology == 'random':
+            self._reorder_neurons()
+        self._reservoir_format = self._select_reservoir_format()
+        self._convert_reservoir_weights()
+        self._reservoir_eigenbasis = None
+        if collect_states:
+            self._init_state_collection_matrices()
+        else:
+            self._release_state_collection_matrices()
+
+    def _reorder_neurons(self):
+        """
+        Renumber the neurons with the reverse Cuthill-McKee algorithm to reduce the bandwidth of the reservoir weights.
+        The input, reservoir, bias and feedback weights are permuted consistently, so that the network computes the same
+        function.
+        Returns
+        -------
+
+        """
+        from scipy.sparse.csgraph import reverse_cuthill_mckee
+        reservoir_weights = abs(scipy.sparse.csr_matrix(self.reservoir_weights_))
+        permutation = reverse_cuthill_mckee(reservoir_weights + reservoir_weights.T, symmetric_mode=True)
+        self.input_weights_ = scipy.sparse.csc_matrix(scipy.sparse.csr_matrix(self.input_weights_)[permutation])
+        self.reservoir_weights_ = scipy.sparse.csc_matrix(
+            scipy.sparse.csr_matrix(self.reservoir_weights_)[permutation][:, permutation])
+        self.bias_weights_ = self.bias_weights_[permutation]
+        self.feedback_weights_ = self.feedback_weights_[permutation]
 
     def _init_state_collection_matrices(self):
         # collect the mean and variances of all reservoir nodes. This is required for the dropout strategy.
         self._activations_mean = np.zeros(shape=(self.reservoir_size,))
         self._activations_var = np.zeros(shape=(self.reservoir_size,))
+        self._release_sequence_statistics()
+        self._sequence_statistics = []
+        # the solver 'cg' keeps the reservoir states instead of xTx and xTy
+        if self.solver == 'cg':
+            self._release_state_chunks()
+            self._state_chunks = []
+            self._release_state_collection_matrices()
+            return
         # initialize xTx and xTy for linear regression. Will be deleted after the training is finalized.
+        self._release_state_collection_matrices()
         if self.bi_directional:
-            self._xTx = np.zeros(shape=(2 * self.reservoir_size + 1, 2 * self.reservoir_size + 1))
-            self._xTy = np.zeros(shape=(2 * self.reservoir_size + 1, self.n_outputs_))
+            n_features = 2 * self.reservoir_size + 1
         else:
-            self._xTx = np.zeros(shape=(self.reservoir_size + 1, self.reservoir_size + 1))
-            self._xTy = np.zeros(shape=(self.reservoir_size + 1, self.n_outputs_))
+            n_features = self.reservoir_size + 1
+        self._xTx = self._allocate_state_collection_matrix(shape=(n_features, n_features))
+        self._xTy = self._allocate_state_collection_matrix(shape=(n_features, self.n_outputs_))
+
+    def _allocate_state_collection_matrix(self, shape):
+        """
+        Allocate a zero-initialized matrix to collect training statistics. If working_dir is set, the matrix is a memory
+        mapped .npy file in working_dir, so that it does not need to fit into memory.
+        Parameters
+        ----------
+        shape : tuple of int
+            The shape of the matrix
+
+        Returns
+        -------
+        matrix : ndarray or np.memmap of the given shape
+        """
+        if self.working_dir is None:
+            return np.zeros(shape=shape)
+        fd, path = tempfile.mkstemp(suffix='.npy', prefix='state_collection_', dir=self.working_dir)
+        os.close(fd)
+        # a new file is zero-initialized by the file system
+        return np.lib.format.open_memmap(path, mode='w+', dtype=float, shape=shape)
+
+    def _release_state_collection_matrices(self):
+        """
+        Drop xTx and xTy and remove their files from working_dir if they are memory mapped.
+        Returns
+        -------
+
+        """
+        matrices = [getattr(self, '_xTx', None), getattr(self, '_xTy', None)]
+        self._xTx = None
+        self._xTy = None
+        file_names = [matrix.filename for matrix in matrices if isinstance(matrix, np.memmap)]
+        del matrices
+        for file_name in file_names:
+            os.remove(file_name)
+
+    def _update_state_collection_matrices(self, reservoir_state, y, scaling=1., shift=0.):
+        """
+        Add the statistics of the reservoir states and targets of one sequence to xTx and xTy. Memory mapped matrices
+        are updated tile-wise, so that only a block of rows of xTx needs to be kept in memory.
+        Parameters
+        ----------
+        reservoir_state : ndarray of shape (n_samples, n_features)
+            The collected reservoir states without the wash_out samples
+        y : {ndarray, sparse matrix} of shape (n_samples, n_outputs)
+            The target values without the wash_out samples
+        scaling : float, default 1.
+            The factor of the targets
+        shift : float, default 0.
+            The offset of the targets, i.e. xTy is updated with reservoir_state.T @ (scaling * y + shift)
+
+        Returns
+        -------
+
+        """
+        xTy = _state_target_product(reservoir_state, y)
+        if scaling != 1.:
+            xTy *= scaling
+        if shift != 0.:
+            xTy += shift * np.sum(reservoir_state, axis=0).reshape(-1, 1)
+        self._xTy += xTy
+        if not isinstance(self._xTx, np.memmap):
+            self._xTx += np.dot(reservoir_state.T, reservoir_state)
+            return
+        n_features = reservoir_state.shape[1]
+        for start in range(0, n_features, _BLOCK_SIZE):
+            stop = min(start + _BLOCK_SIZE, n_features)
+            # upper triangle of the row block, the lower triangle is mirrored
+            tiles = np.dot(reservoir_state[:, start:stop].T, reservoir_state[:, start:])
+            self._xTx[start:stop, start:] += tiles
+            self._xTx[stop:, start:stop] += tiles[:, stop - start:].T
+        self._xTx.flush()
+        self._xTy.flush()
 
     def _init_weights(self, n_features):
         """
@@ -220,36 +388,42 @@ class BaseEchoStateNetwork(BaseEstimator):
             idx_co = idx_co + self.k_in
         input_weights_init = scipy.sparse.csc_matrix((data_vec, ij),
                                                      shape=(self.reservoir_size, n_features), dtype='float64')
-        # Recurrent weights inside the reservoir, drawn from a standard normal distribution.
-        converged = False
-        # Recurrent weights are normalized to a unitary spectral radius if possible.
-        attempts = 50
-        while not converged and attempts > 0:
-            try:
-                idx_co = 0
-                nr_entries = np.int32(self.reservoir_size * self.k_res)
-                ij = np.zeros((2, nr_entries), dtype=int)
-                data_vec = self._random_state.randn(nr_entries)
-                for en in range(self.reservoir_size):
-                    per = self._random_state.permutation(self.reservoir_size)[:self.k_res]
-                    ij[0][idx_co:idx_co + self.k_res] = en
-                    ij[1][idx_co:idx_co + self.k_res] = per
-                    idx_co += self.k_res
-
-                reservoir_weights_init = scipy.sparse.csc_matrix((data_vec, ij),
-                                                                 shape=(self.reservoir_size, self.reservoir_size),
-                                                                 dtype='float64')
-                we = eigens(reservoir_weights_init, return_eigenvectors=False, k=6)
-                converged = True
-            except ArpackNoConvergence:
-                print("WARNING: No convergence! Redo {0} times...".format(attempts-1))
-                attempts = attempts - 1
-                if attempts == 0:
-                    print("WARNING: Returning possibly invalid eigenvalues...")
-                we = ArpackNoConvergence.eigenvalues
-                pass
-
-        reservoir_weights_init *= (1. / np.amax(np.absolute(we)))
+        if self.reservoir_topology == 'random':
+            # Recurrent weights inside the reservoir, drawn from a standard normal distribution.
+            eigens, ArpackNoConvergence = _arpack()
+            converged = False
+            # Recurrent weights are normalized to a unitary spectral radius if possible.
+            attempts = 50
+            while not converged and attempts > 0:
+                try:
+                    idx_co = 0
+                    nr_entries = np.int32(self.reservoir_size * self.k_res)
+                    ij = np.zeros((2, nr_entries), dtype=int)
+                    data_vec = self._random_state.randn(nr_entries)
+                    for en in range(self.reservoir_size):
+                        per = self._random_state.permutation(self.reservoir_size)[:self.k_res]
+                        ij[0][idx_co:idx_co + self.k_res] = en
+                        ij[1][idx_co:idx_co + self.k_res] = per
+                        idx_co += self.k_res
+
+                    reservoir_weights_init = scipy.sparse.csc_matrix((data_vec, ij),
+                                                                     shape=(self.reservoir_size, self.reservoir_size),
+                                                                     dtype='float64')
+                    # a fixed start vector makes the result independent of the internal state of ARPACK
+                    we = eigens(reservoir_weights_init, return_eigenvectors=False, k=6,
+                                v0=np.ones(self.reservoir_size))
+                    converged = True
+                except ArpackNoConvergence:
+                    print("WARNING: No convergence! Redo {0} times...".format(attempts-1))
+                    attempts = attempts - 1
+                    if attempts == 0:
+                        print("WARNING: Returning possibly invalid eigenvalues...")
+                    we = ArpackNoConvergence.eigenvalues
+                    pass
+
+            reservoir_weights_init *= (1. / np.amax(np.absolute(we)))
+        else:
+            reservoir_weights_init = self._init_structured_reservoir_weights()
         # Bias weights, fully connected bias for the reservoir nodes, drawn from uniform distribution.
         if self.ext_bias > 0:
             bias_weights_init = (self._random_state.rand(self.reservoir_size, self.ext_bias) * 2 - 1)
@@ -261,12 +435,77 @@ class BaseEchoStateNetwork(BaseEstimator):
         output_weights_init = None  # np.zeros(shape=(self.reservoir_size + 1, self.n_outputs_))
         return input_weights_init, reservoir_weights_init, bias_weights_init, feedback_weights_init, output_weights_init
 
-    def _fit(self, X, y, incremental=False, update_output_weights=True, n_jobs=0):
+    def _init_structured_reservoir_weights(self):
+        """
+        Initialize the recurrent weights of the structured reservoir topologies. The weights are normalized to a
+        unitary spectral radius, which is known analytically for the cycle and the delay line, and is computed for
+        every small block of the block-diagonal reservoir.
+
+        Returns
+        -------
+        reservoir_weights_init : scipy.sparse.csc_matrix of shape (reservoir_size, reservoir_size)
+        """
+        if self.reservoir_topology == 'cycle':
+            # The eigenvalues of a cyclic shift are the roots of unity
+            reservoir_weights = CycleMatrix(np.ones(self.reservoir_size))
+        elif self.reservoir_topology == 'delay_line':
+            # The eigenvalues of the tridiagonal Toeplitz matrix are 2 cos(k pi / (reservoir_size + 1))
+            weight = 1. / (2. * np.cos(np.pi / (self.reservoir_size + 1)))
+            reservoir_weights = DelayLineMatrix(np.full(self.reservoir_size - 1, weight),
+                                                np.full(self.reservoir_size - 1, weight))
+        else:
+            blocks = self._random_state.randn(self.reservoir_size // self.k_res, self.k_res, self.k_res)
+            blocks /= np.amax(np.absolute(np.linalg.eigvals(blocks)), axis=1).reshape(-1, 1, 1)
+            reservoir_weights = BlockDiagonalMatrix(blocks)
+        return scipy.sparse.csc_matrix(reservoir_weights.tocsr())
+
+    def _select_reservoir_format(self):
+        """
+        Select the format of the reservoir weights in the recurrence. The structured topologies have their own formats,
+        for the random topology, the fastest general format is chosen.
+        Returns
+        -------
+        matrix_format : str
+        """
+        if self.reservoir_topology != 'random':
+            return self.reservoir_topology
+        return select_matrix_format(self.reservoir_weights_)
+
+    def _convert_reservoir_weights(self):
+        """
+        Convert the scaled reservoir weights to the selected format once, so that the recurrence does not need to
+        convert them on every pass.
+        Returns
+        -------
+
+        """
+        self._reservoir_matrix = None
+        self._reservoir_matrix = (self.reservoir_weights_, self._reservoir_matrix_key(), self._recurrent_weights())
+
+    def _reservoir_matrix_key(self):
+        return getattr(self, '_reservoir_format', 'csr'), self.spectral_radius, self.k_res
+
+    def _recurrent_weights(self):
+        """
+        The reservoir weights, scaled with spectral_radius, in the format used by the recurrence. The matrix converted
+        at fit time is returned unless the weights or the hyperparameters have changed since. Otherwise, the weights
+        are converted without storing the result, so that a fitted model can be used by several threads at once.
+        Returns
+        -------
+        reservoir_weights : matrix in one of the formats of pyrcn.base.convert_matrix
+        """
+        key = self._reservoir_matrix_key()
+        converted = getattr(self, '_reservoir_matrix', None)
+        if converted is not None and converted[0] is self.reservoir_weights_ and converted[1] == key:
+            return converted[2]
+        return convert_matrix(self.reservoir_weights_, key[0], scale=self.spectral_radius, block_size=self.k_res)
+
+    def _fit(self, X, y, incremental=False, update_output_weights=True, n_jobs=0, scale_targets=False):
         """
         Fit the model to the data matrix X and target(s) y.
         Parameters
         ----------
-        X : ndarray of shape (n_samples, n_features)
+        X : {ndarray, sparse matrix} of shape (n_samples, n_features)
             The input data
         y : ndarray of shape (n_samples, ) or (n_samples, n_outputs)
             The target values (class labels in classification, real numbers in regression).
@@ -280,6 +519,9 @@ class BaseEchoStateNetwork(BaseEstimator):
         n_jobs : int, default: 0
             If n_jobs is larger than 1, then the linear regression for each output dimension is computed separately
             using joblib.
+        scale_targets : bool, default False
+            If True, teacher_scaling and teacher_shift are applied to y. For the ridge and pinv solvers, they are
+            applied to xTy instead of a scaled copy of y.
 
         Returns
         -------
@@ -299,35 +541,69 @@ class BaseEchoStateNetwork(BaseEstimator):
 
         # Run the offline optimization solver
         if self.solver in _OFFLINE_SOLVERS:
-            self._fit_offline(X, y, incremental, update_output_weights=update_output_weights, n_jobs=n_jobs)
+            self._fit_offline(X, y, incremental, update_output_weights=update_output_weights, n_jobs=n_jobs,
+                              scale_targets=scale_targets)
         self.is_fitted_ = True
         return self
 
-    def _pass_through_reservoir(self, X):
+    def _pass_through_reservoir(self, X, teacher=None, chunk_errors=None):
         """
-        Pass the data forward and, if required, backwards through the reservoir.
+        Pass the data forward and, if required, backwards through the reservoir. No attributes of the model are
+        written, so that a fitted model can be used by several threads at once.
         Parameters
         ----------
-        X : ndarray of shape (n_samples, n_features)
+        X : {ndarray, sparse matrix} of shape (n_samples, n_features)
             The input data
+        teacher : ndarray of shape (n_samples, n_outputs), default None
+            The target values that are fed back with feedback_scaling != 0. If None, the output of the model is fed
+            back.
+        chunk_errors : list or None, default None
+            If not None, the deviations of the time-chunked passes are appended to it.
         Returns
         -------
         reservoir_state : ndarray of shape (n_samples, reservoir_size)
             The collected reservoir states
         """
-        reservoir_state = self._forward_pass(reservoir_inputs=X)
+        if self.feedback_scaling != 0:
+            return np.concatenate((np.ones((X.shape[0], 1)), self._forward_pass(X, teacher=teacher)), 1)
+        state_cache = self._state_cache()
+        if state_cache is not None:
+            key = state_cache.key(X, self.input_weights_, self.reservoir_weights_, self.bias_weights_,
+                                  **{name: getattr(self, name) for name in _STATE_PARAMETERS})
+            reservoir_state = state_cache.load(key)
+            if reservoir_state is not None:
+                return reservoir_state
+        reservoir_state = self._forward_pass(reservoir_inputs=X, chunk_errors=chunk_errors)
         if self.bi_directional:
-            reservoir_state = \
-                np.concatenate((reservoir_state, np.flipud(self._forward_pass(reservoir_inputs=np.flipud(X)))), 1)
+            reservoir_state = np.concatenate(
+                (reservoir_state, np.flipud(self._forward_pass(reservoir_inputs=X[::-1], chunk_errors=chunk_errors))),
+                1)
         reservoir_state = np.concatenate((np.ones((reservoir_state.shape[0], 1)), reservoir_state), 1)
+        if state_cache is not None:
+            state_cache.store(key, reservoir_state)
         return reservoir_state
 
-    def _fit_offline(self, X, y, incremental=False, update_output_weights=True, n_jobs: int = 0):
+    def _state_cache(self):
+        """
+        Return the cache of the reservoir states.
+        Returns
+        -------
+        state_cache : ReservoirStateCache or None
+        """
+        if self.state_cache is None or isinstance(self.state_cache, ReservoirStateCache):
+            return self.state_cache
+        if isinstance(self.state_cache, str):
+            return ReservoirStateCache(self.state_cache)
+        raise ValueError("state_cache must be None, a directory or a ReservoirStateCache, got %s."
+                         % type(self.state_cache).__name__)
+
+    def _fit_offline(self, X, y, incremental=False, update_output_weights=True, n_jobs: int = 0,
+                     scale_targets=False):
         """
         Do a single fit of the model on the entire dataset passed trough.
         Parameters
         ----------
-        X : ndarray of shape (n_samples, n_features)
+        X : {ndarray, sparse matrix} of shape (n_samples, n_features)
             The input data
         y : ndarray of shape (n_samples, ) or (n_samples, n_outputs)
             The target values (class labels in classification, real numbers in regression).
@@ -341,6 +617,8 @@ class BaseEchoStateNetwork(BaseEstimator):
         n_jobs : int, default: 0
             If n_jobs is larger than 1, then the linear regression for each output dimension is computed separately
             using joblib.
+        scale_targets : bool, default False
+            If True, teacher_scaling and teacher_shift are applied to y.
 
         Returns
         -------
@@ -349,26 +627,34 @@ class BaseEchoStateNetwork(BaseEstimator):
         n_samples = X.shape[0]
         self._n_samples = self._n_samples + n_samples - self.wash_out
 
-        reservoir_state = self._pass_through_reservoir(X=X)
+        scaling, shift = (self.teacher_scaling, self.teacher_shift) if scale_targets else (1., 0.)
+        teacher = _dense_targets(y, scaling, shift) if self.feedback_scaling != 0 else None
+        if self.linear_scan and getattr(self, '_reservoir_eigenbasis', None) is None:
+            self._reservoir_eigenbasis = _linear_reservoir_eigenbasis(self.reservoir_weights_)
+        chunk_errors = []
+        reservoir_state = self._pass_through_reservoir(X=X, teacher=teacher, chunk_errors=chunk_errors)
+        if chunk_errors:
+            self.time_chunk_error_ = max(chunk_errors)
+        elif not incremental or not hasattr(self, 'time_chunk_error_'):
+            # no time-chunked pass, e.g. the states have been loaded from state_cache
+            self.time_chunk_error_ = None
+        dual_form = not incremental and self._use_dual_form(reservoir_state[self.wash_out:, :])
 
         if incremental:
-            self._xTx = self._xTx + np.dot(reservoir_state[self.wash_out:, :].T, reservoir_state[self.wash_out:, :])
-            self._xTy = self._xTy + np.dot(reservoir_state[self.wash_out:, :].T, y[self.wash_out:, :])
-            if self.bi_directional:
-                new_activations_mean = np.mean(reservoir_state[self.wash_out:, :], axis=0)[1:self.reservoir_size + 1]
-                new_activations_var = np.var(reservoir_state[self.wash_out:, :], axis=0)[1:self.reservoir_size + 1]
-            else:
-                new_activations_mean = np.mean(reservoir_state[self.wash_out:, :], axis=0)[1:]
-                new_activations_var = np.var(reservoir_state[self.wash_out:, :], axis=0)[1:]
-            m = self._n_samples
-            n = reservoir_state.shape[0]
-            tmp_activations_mean = self._activations_mean
-            self._activations_mean = m/(m+n)*tmp_activations_mean + n/(m+n)*new_activations_mean
-            self._activations_var = m / (m + n) * self._activations_var + n / (m + n)*new_activations_var + \
-                                    m * n / (m + n)**2 * (tmp_activations_mean - new_activations_mean)**2
+            if scaling != 1. or shift != 0.:
+                y = _dense_targets(y, scaling, shift)
+            self._collect_reservoir_states(reservoir_state, y)
         else:
-            self._xTx = np.dot(reservoir_state[self.wash_out:, :].T, reservoir_state[self.wash_out:, :])
-            self._xTy = np.dot(reservoir_state[self.wash_out:, :].T, y[self.wash_out:, :])
+            if self.solver == 'cg':
+                self._init_state_collection_matrices()
+                self._store_state_chunk(reservoir_state[self.wash_out:, :],
+                                        _dense_targets(y[self.wash_out:, :], scaling, shift))
+            elif dual_form:
+                # xTx is never formed, the output weights are computed from the dual system
+                self._release_state_collection_matrices()
+            else:
+                self._update_state_collection_matrices(reservoir_state[self.wash_out:, :], y[self.wash_out:, :],
+                                                       scaling=scaling, shift=shift)
             if self.bi_directional:
                 self.activations_mean = np.mean(reservoir_state[self.wash_out:, :], axis=0)[1:self.reservoir_size + 1]
                 self.activations_var = np.var(reservoir_state[self.wash_out:, :], axis=0)[1:self.reservoir_size + 1]
@@ -376,63 +662,393 @@ class BaseEchoStateNetwork(BaseEstimator):
                 self.activations_mean = np.mean(reservoir_state[self.wash_out:, :], axis=0)[1:]
                 self.activations_var = np.var(reservoir_state[self.wash_out:, :], axis=0)[1:]
 
-        if update_output_weights:
+        if update_output_weights and dual_form:
+            self.output_weights_ = self._solve_dual(reservoir_state[self.wash_out:, :],
+                                                    _dense_targets(y[self.wash_out:, :], scaling, shift))
+        elif update_output_weights:
             self._compute_output_weights(n_jobs=n_jobs)
         else:
             self.output_weights_ = None
 
         if not incremental:
-            self._xTx = None
-            self._xTy = None
+            self._release_state_collection_matrices()
+            self._release_state_chunks()
+            self._release_sequence_statistics()
+
+    def _collect_reservoir_states(self, reservoir_state, y):
+        """
+        Add the reservoir states and targets of one sequence to the training statistics, i.e. to xTx and xTy or to the
+        stored state chunks, and update the running mean and variance of the activations.
+        Parameters
+        ----------
+        reservoir_state : ndarray of shape (n_samples, n_features)
+            The collected reservoir states including the wash_out samples
+        y : {ndarray, sparse matrix} of shape (n_samples, n_outputs)
+            The target values including the wash_out samples
+
+        Returns
+        -------
+
+        """
+        if self.keep_sequence_statistics:
+            xTx = np.dot(reservoir_state[self.wash_out:, :].T, reservoir_state[self.wash_out:, :])
+            xTy = _state_target_product(reservoir_state[self.wash_out:, :], y[self.wash_out:, :])
+            self._store_sequence_statistics(xTx, xTy, y[self.wash_out:, :])
+        if self.solver == 'cg':
+            self._store_state_chunk(reservoir_state[self.wash_out:, :], _dense_targets(y[self.wash_out:, :]))
+        elif self.keep_sequence_statistics:
+            self._xTx += xTx
+            self._xTy += xTy
+            if isinstance(self._xTx, np.memmap):
+                self._xTx.flush()
+                self._xTy.flush()
+        else:
+            self._update_state_collection_matrices(reservoir_state[self.wash_out:, :], y[self.wash_out:, :])
+        self._update_activation_statistics(np.mean(reservoir_state[self.wash_out:, :], axis=0),
+                                           np.var(reservoir_state[self.wash_out:, :], axis=0), reservoir_state.shape[0])
+
+    def _store_sequence_statistics(self, xTx, xTy, y):
+        """
+        Keep xTx, xTy and the sum of the squared targets of one sequence for cross_validate_readout. If working_dir is
+        set, the matrices are stored as memory mapped files there.
+        Parameters
+        ----------
+        xTx : ndarray of shape (n_features, n_features)
+            The Gram matrix of the reservoir states of the sequence
+        xTy : ndarray of shape (n_features, n_outputs)
+            The product of the reservoir states and the targets of the sequence
+        y : {ndarray, sparse matrix} of shape (n_samples, n_outputs)
+            The target values without the wash_out samples
+
+        Returns
+        -------
+
+        """
+        if scipy.sparse.issparse(y):
+            yTy = np.asarray(y.multiply(y).sum(axis=0)).ravel()
+        else:
+            yTy = np.sum(y ** 2, axis=0)
+        self._append_sequence_statistics(xTx, xTy, yTy, y.shape[0])
+
+    def _append_sequence_statistics(self, xTx, xTy, yTy, n_samples):
+        """
+        Append the statistics of one sequence to the kept sequence statistics.
+        Parameters
+        ----------
+        xTx : ndarray of shape (n_features, n_features)
+            The Gram matrix of the reservoir states of the sequence
+        xTy : ndarray of shape (n_features, n_outputs)
+            The product of the reservoir states and the targets of the sequence
+        yTy : ndarray of shape (n_outputs,)
+            The sum of the squared targets of the sequence
+        n_samples : int
+            The number of samples of the sequence without the wash_out samples
+
+        Returns
+        -------
+
+        """
+        sequence_xTx = self._allocate_state_collection_matrix(shape=xTx.shape)
+        sequence_xTy = self._allocate_state_collection_matrix(shape=xTy.shape)
+        sequence_xTx[...] = xTx
+        sequence_xTy[...] = xTy
+        if self.working_dir is not None:
+            sequence_xTx.flush()
+            sequence_xTy.flush()
+        self._sequence_statistics.append((sequence_xTx, sequence_xTy, yTy, n_samples))
+
+    def _release_sequence_statistics(self):
+        """
+        Drop the statistics of the individual sequences and remove their files from working_dir if they are memory
+        mapped.
+        Returns
+        -------
 
-    def _forward_pass(self, reservoir_inputs):
+        """
+        statistics = getattr(self, '_sequence_statistics', None) or []
+        self._sequence_statistics = None
+        file_names = [matrix.filename for sequence_statistics in statistics for matrix in sequence_statistics[:2]
+                      if isinstance(matrix, np.memmap)]
+        del statistics
+        for file_name in file_names:
+            os.remove(file_name)
+
+    def cross_validate_readout(self, cv=5, groups=None, betas=None):
+        """
+        Cross-validate the output weights over the sequences that have been passed to partial_fit with
+        keep_sequence_statistics=True. Since the reservoir is fixed, the output weights of every fold follow from the
+        sums of xTx and xTy of its training sequences, and the squared error on its test sequences follows from their
+        xTx, xTy and squared targets. No data is passed through the reservoir.
+
+        Parameters
+        ----------
+        cv : int, cross-validation generator or iterable, default 5
+            Determines the splits of the sequences as in :func:`sklearn.model_selection.cross_validate`, e.g. 8 for
+            8-fold cross validation or LeaveOneGroupOut().
+        groups : array-like of shape (n_sequences, ), default None
+            The group of every sequence, e.g. the file it belongs to, for group-wise cross-validation generators.
+        betas : list of float, default None
+            The regularization parameters to be evaluated. If None, beta is used.
+
+        Returns
+        -------
+        scores : ndarray of shape (n_splits, ) or (n_splits, n_betas)
+            The negative mean squared error on the test sequences of every split, for every value in betas if given.
+        """
+        if not getattr(self, '_sequence_statistics', None):
+            raise NotFittedError("No sequence statistics have been collected. Call 'partial_fit' with "
+                                 "keep_sequence_statistics=True at first.")
+        from sklearn.model_selection import check_cv
+        n_sequences = len(self._sequence_statistics)
+        xTx, xTy, yTy, n_samples = (sum(statistics) for statistics in zip(*self._sequence_statistics))
+        beta_values = [self.beta] if betas is None else betas
+        splits = list(check_cv(cv).split(np.zeros(shape=(n_sequences, 1)), groups=groups))
+        scores = np.zeros(shape=(len(splits), len(beta_values)))
+        for n, (_, test) in enumerate(splits):
+            test_xTx, test_xTy, test_yTy, test_n_samples = \
+                (sum(statistics) for statistics in zip(*[self._sequence_statistics[i] for i in test]))
+            w, V = np.linalg.eigh(xTx - test_xTx)
+            projected_xTy = np.dot(V.T, xTy - test_xTy)
+            for m, beta in enumerate(beta_values):
+                lmda = beta ** 2 * (n_samples - test_n_samples) if self.solver == 'ridge' else 0.
+                output_weights = np.dot(V, projected_xTy / (w + lmda)[:, None])
+                # sum of the squared errors of the test sequences
+                error = np.sum(output_weights * np.dot(test_xTx, output_weights)) \
+                    - 2 * np.sum(output_weights * test_xTy) + np.sum(test_yTy)
+                scores[n, m] = -error / (test_n_samples * xTy.shape[1])
+        return scores[:, 0] if betas is None else scores
+
+    def _update_activation_statistics(self, mean, var, n_samples):
+        """
+        Update the running mean and variance of the activations with the statistics of one sequence.
+        Parameters
+        ----------
+        mean : ndarray of shape (n_features, )
+            The mean of the collected reservoir states of the sequence
+        var : ndarray of shape (n_features, )
+            The variance of the collected reservoir states of the sequence
+        n_samples : int
+            The length of the sequence
+
+        Returns
+        -------
+
+        """
+        new_activations_mean = mean[1:self.reservoir_size + 1]
+        new_activations_var = var[1:self.reservoir_size + 1]
+        m = self._n_samples
+        n = n_samples
+        tmp_activations_mean = self._activations_mean
+        self._activations_mean = m/(m+n)*tmp_activations_mean + n/(m+n)*new_activations_mean
+        self._activations_var = m / (m + n) * self._activations_var + n / (m + n)*new_activations_var + \
+                                m * n / (m + n)**2 * (tmp_activations_mean - new_activations_mean)**2
+
+    def _forward_pass(self, reservoir_inputs, teacher=None, chunk_errors=None):
         """
         Perform a forward pass on the network by computing the values
         of the neurons in the hidden layers and the output layer.
 
+        The reservoir weights are converted to the format that has been selected as the fastest one for their structure
+        at fit time. The contributions of the inputs and biases are computed for all samples at once before the
+        recurrence. With feedback_scaling != 0, the same holds for the feedback of the teacher, whereas the output of
+        the model is computed and fed back in every step of the recurrence if no teacher is given.
+
         Parameters
         ----------
-        reservoir_inputs : ndarray of shape (n_samples, n_features)
+        reservoir_inputs : {ndarray, sparse matrix} of shape (n_samples, n_features)
             The input data
+        teacher : ndarray of shape (n_samples, n_outputs), default None
+            The target values that are fed back with feedback_scaling != 0
+        chunk_errors : list or None, default None
+            If not None, the deviation of a time-chunked pass is appended to it.
 
         Returns
         -------
 
         """
         n_samples, n_features = reservoir_inputs.shape
+        if self.n_time_chunks > 1 and n_samples > self.n_time_chunks * self.chunk_warm_up:
+            reservoir_state, chunk_error = self._chunked_forward_pass(reservoir_inputs)
+            if chunk_errors is not None:
+                chunk_errors.append(chunk_error)
+            return reservoir_state
+        inputs, bias_inputs = self._split_reservoir_inputs(reservoir_inputs)
+        if bias_inputs is not None:
+            bias_weights = (self.bias_weights_ * self.bias).reshape(self.reservoir_size, -1)
+        else:
+            bias_weights = self.bias_weights_ * self.bias
+        if self.linear_scan:
+            reservoir_state = self._linear_scan(inputs, bias_inputs, bias_weights)
+            if reservoir_state is not None:
+                return reservoir_state
+
+        reservoir_weights = self._recurrent_weights()
+        activation = ACTIVATIONS[self.reservoir_activation]
         reservoir_state = np.zeros(shape=(n_samples+1, self.reservoir_size))
-        if self.ext_bias > 0:
-            for sample in range(n_samples):
-                if scipy.sparse.issparse(self.input_weights_):
-                    a = self.input_weights_ * reservoir_inputs[sample, :-self.ext_bias] * self.input_scaling
-                else:
-                    a = np.dot(self.input_weights_, reservoir_inputs[sample, :-self.ext_bias], self.input_scaling)
-                if scipy.sparse.issparse(self.reservoir_weights_):
-                    b = self.reservoir_weights_ * reservoir_state[sample, :] * self.spectral_radius
-                else:
-                    b = np.dot(self.reservoir_weights_, reservoir_state[sample, :], self.spectral_radius)
-
-                reservoir_state[sample + 1, :] = ACTIVATIONS[self.reservoir_activation](
-                    np.atleast_2d(a + b).T + self.bias_weights_ * self.bias * reservoir_inputs[sample, -self.ext_bias]).flatten()
-                reservoir_state[sample + 1, :] = (1 - self.leakage) * reservoir_state[sample, :]\
-                                                 + self.leakage * reservoir_state[sample + 1, :]
+        # in blocks of samples, so that memory mapped inputs are never copied as a whole
+        for start in range(0, n_samples, _BLOCK_SIZE):
+            stop = min(start + _BLOCK_SIZE, n_samples)
+            reservoir_state[start + 1:stop + 1, :] = safe_sparse_dot(inputs[start:stop], self.input_weights_.T,
+                                                                     dense_output=True)
+        reservoir_state[1:, :] *= self.input_scaling
+        if bias_inputs is not None:
+            reservoir_state[1:, :] += np.dot(bias_inputs, bias_weights.T)
         else:
-            for sample in range(n_samples):
-                if scipy.sparse.issparse(self.input_weights_):
-                    a = self.input_weights_ * reservoir_inputs[sample, :] * self.input_scaling
-                else:
-                    a = np.dot(self.input_weights_, reservoir_inputs[sample, :], self.input_scaling)
-                if scipy.sparse.issparse(self.reservoir_weights_):
-                    b = self.reservoir_weights_ * reservoir_state[sample, :] * self.spectral_radius
-                else:
-                    b = np.dot(self.reservoir_weights_, reservoir_state[sample, :], self.spectral_radius)
-
-                reservoir_state[sample+1, :] = \
-                    ACTIVATIONS[self.reservoir_activation](a + b + self.bias_weights_*self.bias)
-                reservoir_state[sample+1, :] = \
-                    (1 - self.leakage) * reservoir_state[sample, :] + self.leakage * reservoir_state[sample+1, :]
+            reservoir_state[1:, :] += bias_weights
+        closed_loop = self.feedback_scaling != 0 and teacher is None
+        if self.feedback_scaling != 0:
+            feedback_weights = self.feedback_scaling * self.feedback_weights_
+        if closed_loop:
+            output_weights = self.output_weights_.reshape(self.reservoir_size + 1, -1)
+        if self.feedback_scaling != 0 and not closed_loop:
+            reservoir_state[2:, :] += np.dot(teacher.reshape(n_samples, -1)[:-1, :], feedback_weights.T)
+        for sample in range(n_samples):
+            state = reservoir_state[sample + 1, :]
+            state += reservoir_weights.dot(reservoir_state[sample, :])
+            if closed_loop and sample > 0:
+                state += np.dot(feedback_weights, output_weights[0] + np.dot(reservoir_state[sample, :],
+                                                                             output_weights[1:]))
+            activation(state)
+            if self.leakage != 1.:
+                state *= self.leakage
+                state += (1 - self.leakage) * reservoir_state[sample, :]
         return reservoir_state[1:, :]
 
+    def _chunked_forward_pass(self, reservoir_inputs):
+        """
+        Perform an approximate forward pass by splitting the input data into n_time_chunks parts, which are passed
+        through the reservoir in parallel worker processes, each starting with chunk_warm_up preceding samples. The
+        first part is extended by a probe segment, where its exact reservoir states are compared to the ones of the
+        second part.
+
+        Parameters
+        ----------
+        reservoir_inputs : {ndarray, sparse matrix} of shape (n_samples, n_features)
+            The input data
+
+        Returns
+        -------
+        reservoir_state : ndarray of shape (n_samples, reservoir_size)
+            The collected reservoir states
+        chunk_error : float
+            The maximum absolute deviation on the probe segment
+        """
+        from joblib import Parallel, delayed, cpu_count
+        n_samples = reservoir_inputs.shape[0]
+        bounds = np.linspace(0, n_samples, self.n_time_chunks + 1).astype(int)
+        probe = min(max(self.chunk_warm_up, 1), bounds[2] - bounds[1])
+        starts = [0] + [max(bound - self.chunk_warm_up, 0) for bound in bounds[1:-1]]
+        stops = [bounds[1] + probe] + list(bounds[2:])
+
+        estimator = self._recurrence_estimator()
+        chunk_states = Parallel(n_jobs=min(self.n_time_chunks, cpu_count()))(
+            delayed(estimator._forward_pass)(reservoir_inputs[start:stop]) for start, stop in zip(starts, stops))
+
+        reservoir_state = np.empty(shape=(n_samples, self.reservoir_size))
+        for start, bound, stop, states in zip(starts, bounds[:-1], bounds[1:], chunk_states):
+            reservoir_state[bound:stop, :] = states[bound - start:stop - start, :]
+        chunk_error = np.abs(chunk_states[0][bounds[1]:, :] - reservoir_state[bounds[1]:bounds[1] + probe, :]).max()
+        return reservoir_state, chunk_error
+
+    def _recurrence_estimator(self):
+        """
+        Create an unchunked copy of the model that only holds the weights and hyperparameters of the recurrence, so
+        that the training statistics are not sent to the worker processes of a time-chunked pass.
+        Returns
+        -------
+        estimator : BaseEchoStateNetwork
+        """
+        estimator = clone(self).set_params(n_time_chunks=1, state_cache=None)
+        for name in _RECURRENCE_ATTRIBUTES:
+            if name in self.__dict__:
+                setattr(estimator, name, self.__dict__[name])
+        if self.linear_scan:
+            estimator._reservoir_eigenbasis = getattr(self, '_reservoir_eigenbasis', None)
+        return estimator
+
+    def _split_reservoir_inputs(self, reservoir_inputs):
+        """
+        Split the input data into the inputs and the external biases. Sparse input data stays sparse, only the external
+        biases are converted to a dense array.
+
+        Parameters
+        ----------
+        reservoir_inputs : {ndarray, sparse matrix} of shape (n_samples, n_features)
+            The input data
+
+        Returns
+        -------
+        inputs : {ndarray, sparse matrix} of shape (n_samples, n_features - ext_bias)
+            The input data without external biases
+        bias_inputs : ndarray of shape (n_samples, ext_bias) or None
+            The external biases, None if ext_bias == 0
+        """
+        if self.ext_bias == 0:
+            return reservoir_inputs, None
+        bias_inputs = reservoir_inputs[:, -self.ext_bias:]
+        if scipy.sparse.issparse(bias_inputs):
+            bias_inputs = bias_inputs.toarray()
+        return reservoir_inputs[:, :-self.ext_bias], bias_inputs
+
+    def _linear_scan(self, inputs, bias_inputs, bias_weights):
+        """
+        Compute the reservoir states of a linear reservoir with a parallel prefix scan.
+
+        With the identity activation, the reservoir states follow x_t = A x_(t-1) + leakage * u_t, where
+        A = (1 - leakage) I + leakage * spectral_radius * W and u_t are the input and bias contributions. In the
+        eigenbasis W = V diag(mu) V^-1, the recurrence decouples into independent scalar recurrences
+        z_t = lambda z_(t-1) + leakage * V^-1 u_t with lambda = 1 - leakage + leakage * spectral_radius * mu, which are
+        scanned for blocks of _SCAN_BLOCK_SIZE samples at once. The input and bias weights are transformed into the
+        eigenbasis instead of the inputs, and of every pair of complex conjugate eigenvalues, only one is computed.
+
+        Parameters
+        ----------
+        inputs : {ndarray, sparse matrix} of shape (n_samples, n_features)
+            The input data without external biases
+        bias_inputs : ndarray of shape (n_samples, ext_bias) or None
+            The external biases
+        bias_weights : ndarray of shape (reservoir_size, ) or (reservoir_size, ext_bias)
+            The scaled bias weights
+
+        Returns
+        -------
+        reservoir_state : ndarray of shape (n_samples, reservoir_size) or None
+            The collected reservoir states. None, if the eigenvectors of the reservoir weights are too ill-conditioned
+            for an accurate result.
+        """
+        # The eigenbasis is cached at fit time, models without it compute it without storing it
+        reservoir_eigenbasis = getattr(self, '_reservoir_eigenbasis', None)
+        if reservoir_eigenbasis is None:
+            reservoir_eigenbasis = _linear_reservoir_eigenbasis(self.reservoir_weights_)
+        if reservoir_eigenbasis is False:
+            warnings.warn("The reservoir weights are not diagonalizable with sufficient accuracy. The linear "
+                          "reservoir is computed sample by sample.")
+            return None
+
+        eigenvalues, inverse_eigenvectors, eigenvectors = reservoir_eigenbasis
+        decay = 1 - self.leakage + self.leakage * self.spectral_radius * eigenvalues
+        decay_powers = decay ** np.arange(1, _SCAN_BLOCK_SIZE + 1).reshape(-1, 1)
+        inverse_eigenvectors = inverse_eigenvectors * self.leakage
+        input_weights = safe_sparse_dot(self.input_weights_.T, inverse_eigenvectors.T, dense_output=True).T \
+            * self.input_scaling
+        bias_weights = np.dot(inverse_eigenvectors, bias_weights)
+
+        reservoir_state = np.empty(shape=(inputs.shape[0], self.reservoir_size))
+        state = np.zeros_like(decay)
+        for start in range(0, inputs.shape[0], _SCAN_BLOCK_SIZE):
+            stop = min(start + _SCAN_BLOCK_SIZE, inputs.shape[0])
+            transformed_state = safe_sparse_dot(inputs[start:stop], input_weights.T, dense_output=True)
+            if bias_inputs is not None:
+                transformed_state += np.dot(bias_inputs[start:stop], bias_weights.T)
+            else:
+                transformed_state += bias_weights
+            _inplace_linear_scan(transformed_state, decay)
+            transformed_state += decay_powers[:stop - start] * state
+            state = transformed_state[-1]
+            np.dot(np.concatenate((transformed_state.real, transformed_state.imag), axis=1), eigenvectors.T,
+                   out=reservoir_state[start:stop])
+        return reservoir_state
+
     def partial_fit(self, X, y, update_output_weights=True, n_jobs=0):
         """
         Fit the model to the data matrix X and target(s) y without finalizing it. This can be used to add more training
@@ -440,7 +1056,7 @@ class BaseEchoStateNetwork(BaseEstimator):
 
         Parameters
         ----------
-        X : ndarray of shape (n_samples, n_features)
+        X : {ndarray, sparse matrix} of shape (n_samples, n_features)
             The input data
         y : ndarray of shape (n_samples, ) or (n_samples, n_outputs)
             The target values (class labels in classification, real numbers in regression).
@@ -466,7 +1082,7 @@ class BaseEchoStateNetwork(BaseEstimator):
         data later.
         Parameters
         ----------
-        X : ndarray of shape (n_samples, n_features)
+        X : {ndarray, sparse matrix} of shape (n_samples, n_features)
             The input data
         y : ndarray of shape (n_samples, ) or (n_samples, n_outputs)
             The target values (class labels in classification, real numbers in regression).
@@ -484,6 +1100,207 @@ class BaseEchoStateNetwork(BaseEstimator):
         """
         return self._fit(X, y, incremental=True, update_output_weights=update_output_weights, n_jobs=n_jobs)
 
+    def partial_fit_settings(self, X, y, settings, update_output_weights=True, n_jobs=0):
+        """
+        Fit copies of the model with different scaling hyperparameters to the data matrix X and target(s) y without
+        finalizing them.
+
+        The hyperparameters input_scaling, spectral_radius, bias, leakage and beta do not change the weight matrices,
+        so that all copies share the weights of this model. The reservoir states of all settings are computed in one
+        batched pass, in which every time step is one product of the reservoir weights with a matrix that has one
+        column per setting. Each copy collects its own xTx and xTy. Calling this method again with the same settings
+        adds more training data, different settings start a new set of copies.
+
+        Parameters
+        ----------
+        X : {ndarray, sparse matrix} of shape (n_samples, n_features)
+            The input data
+        y : ndarray of shape (n_samples, ) or (n_samples, n_outputs)
+            The target values (class labels in classification, real numbers in regression).
+        settings : list of dict
+            The hyperparameter settings, e.g. a ParameterGrid over input_scaling and spectral_radius. Hyperparameters
+            that are not part of a setting are taken from this model.
+        update_output_weights : bool, default True
+            If False, no output weights are computed after passing the current data through the network.
+        n_jobs : int, default: 0
+            If n_jobs is larger than 1, then the linear regression for each output dimension is computed separately
+            using joblib.
+
+        Returns
+        -------
+        estimators : list of estimators
+            One copy of the model per setting, also stored in setting_estimators_. The copies can be finalized and
+            used like any other fitted model.
+        """
+        if self.solver not in _OFFLINE_SOLVERS:
+            raise AttributeError('partial_fit_settings is only available for offline optimizers, not for %s.'
+                                 % self.solver)
+        if self.feedback_scaling != 0:
+            raise ValueError("partial_fit_settings requires feedback_scaling 0, got %s." % self.feedback_scaling)
+        settings = [dict(setting) for setting in settings]
+        for setting in settings:
+            unsupported = sorted(set(setting) - set(_SETTING_PARAMETERS))
+            if unsupported:
+                raise ValueError("Only the hyperparameters %s can be evaluated in a batch, got %s."
+                                 % (", ".join(_SETTING_PARAMETERS), ", ".join(unsupported)))
+        y = _dense_targets(y)
+        if y.ndim == 1:
+            y = y.reshape((-1, 1))
+        if getattr(self, 'setting_estimators_', None) is None or settings != self._settings:
+            self._validate_hyperparameters()
+            if not hasattr(self, 'input_weights_'):
+                # the copies collect the training statistics, not this model
+                self._initialize(y, X.shape[1] - self.ext_bias, collect_states=False)
+            self._release_setting_estimators()
+            self._settings = settings
+            self.setting_estimators_ = [self._setting_estimator(setting) for setting in settings]
+
+        reservoir_states = self._pass_through_reservoir_settings(X)
+        states = reservoir_states[self.wash_out:, :, :]
+        batched = self.solver != 'cg' and self.working_dir is None
+        if batched:
+            # xTx and xTy of all settings in one batched product
+            states_t = np.ascontiguousarray(states.transpose(2, 1, 0))
+            xTx = np.matmul(states_t, states_t.transpose(0, 2, 1))
+            xTy = np.matmul(states_t, y[self.wash_out:, :])
+        mean, var = np.mean(states, axis=0), np.var(states, axis=0)
+        for n, estimator in enumerate(self.setting_estimators_):
+            estimator._n_samples = estimator._n_samples + X.shape[0] - self.wash_out
+            if batched:
+                estimator._xTx += xTx[n]
+                estimator._xTy += xTy[n]
+                if estimator.keep_sequence_statistics:
+                    estimator._store_sequence_statistics(xTx[n], xTy[n], y[self.wash_out:, :])
+                estimator._update_activation_statistics(mean[:, n], var[:, n], X.shape[0])
+            else:
+                estimator._collect_reservoir_states(reservoir_states[:, :, n], y)
+            if update_output_weights:
+                estimator._compute_output_weights(n_jobs=n_jobs)
+            else:
+                estimator.output_weights_ = None
+            estimator.is_fitted_ = True
+        return self.setting_estimators_
+
+    def predict_settings(self, X):
+        """
+        Compute the outputs of all copies of the model that have been fitted with partial_fit_settings in one batched
+        pass through the reservoir.
+
+        Parameters
+        ----------
+        X : {array-like, sparse matrix} of shape (n_samples, n_features)
+            The input data.
+
+        Returns
+        -------
+        y_pred : ndarray of shape (n_settings, n_samples, n_outputs)
+            The outputs of the linear readouts, i.e. without the decoding of class labels.
+        """
+        check_is_fitted(self, ['setting_estimators_'])
+        X = _check_input_array(X, accept_sparse='csr')
+        reservoir_states = self._pass_through_reservoir_settings(X)
+        return np.stack([safe_sparse_dot(reservoir_states[:, :, n], estimator.output_weights_).reshape(X.shape[0], -1)
+                         for n, estimator in enumerate(self.setting_estimators_)])
+
+    def _setting_estimator(self, setting):
+        """
+        Create a copy of the model that shares its weights, but has the given hyperparameters and its own training
+        statistics.
+        Parameters
+        ----------
+        setting : dict
+            The hyperparameters of the copy
+
+        Returns
+        -------
+        estimator : BaseEchoStateNetwork
+        """
+        estimator = copy.copy(self)
+        estimator.__dict__.update(dict.fromkeys(['_xTx', '_xTy', '_state_chunks', 'reservoir_state',
+                                                 'setting_estimators_', '_settings', '_sequence_statistics']))
+        estimator.set_params(**setting)
+        estimator._validate_hyperparameters()
+        estimator._n_samples = 0
+        estimator._init_state_collection_matrices()
+        return estimator
+
+    def _release_setting_estimators(self):
+        """
+        Release the training statistics of all copies created by partial_fit_settings.
+        Returns
+        -------
+
+        """
+        for estimator in getattr(self, 'setting_estimators_', None) or []:
+            estimator._release_state_collection_matrices()
+            estimator._release_state_chunks()
+        self.setting_estimators_ = None
+
+    def _pass_through_reservoir_settings(self, X):
+        """
+        Pass the data forward and, if required, backwards through the reservoir for all settings in
+        setting_estimators_.
+        Parameters
+        ----------
+        X : {ndarray, sparse matrix} of shape (n_samples, n_features)
+            The input data
+        Returns
+        -------
+        reservoir_states : ndarray of shape (n_samples, n_features, n_settings)
+            The collected reservoir states of all settings
+        """
+        reservoir_states = self._forward_pass_settings(reservoir_inputs=X)
+        if self.bi_directional:
+            reservoir_states = np.concatenate(
+                (reservoir_states, np.flip(self._forward_pass_settings(reservoir_inputs=X[::-1]), axis=0)), 1)
+        n_samples, _, n_settings = reservoir_states.shape
+        return np.concatenate((np.ones((n_samples, 1, n_settings)), reservoir_states), 1)
+
+    def _forward_pass_settings(self, reservoir_inputs):
+        """
+        Perform a forward pass for all settings in setting_estimators_ at once. The reservoir states of all settings are
+        the columns of one matrix per time step. Since the scaling hyperparameters are applied to the states instead
+        of the weights, the reservoir weights are shared by all settings.
+
+        Parameters
+        ----------
+        reservoir_inputs : {ndarray, sparse matrix} of shape (n_samples, n_features)
+            The input data
+
+        Returns
+        -------
+        reservoir_states : ndarray of shape (n_samples, reservoir_size, n_settings)
+            The collected reservoir states of all settings
+        """
+        input_scaling, spectral_radius, bias, leakage = (
+            np.array([getattr(estimator, name) for estimator in self.setting_estimators_])
+            for name in ['input_scaling', 'spectral_radius', 'bias', 'leakage'])
+        n_samples = reservoir_inputs.shape[0]
+        inputs, bias_inputs = self._split_reservoir_inputs(reservoir_inputs)
+        if bias_inputs is not None:
+            bias_drive = np.dot(bias_inputs, self.bias_weights_.reshape(self.reservoir_size, -1).T)
+        else:
+            bias_drive = self.bias_weights_
+        if self.reservoir_topology == 'random':
+            matrix_format = select_matrix_format(self.reservoir_weights_, n_vectors=len(self.setting_estimators_))
+        else:
+            matrix_format = self.reservoir_topology
+        reservoir_weights = convert_matrix(self.reservoir_weights_, matrix_format, block_size=self.k_res)
+        activation = ACTIVATIONS[self.reservoir_activation]
+        reservoir_states = np.zeros(shape=(n_samples + 1, self.reservoir_size, len(self.setting_estimators_)))
+        reservoir_states[1:, :, :] = \
+            safe_sparse_dot(inputs, self.input_weights_.T, dense_output=True)[:, :, None] * input_scaling
+        reservoir_states[1:, :, :] += bias_drive[..., None] * bias
+        leaky = np.any(leakage != 1.)
+        for sample in range(n_samples):
+            state = reservoir_states[sample + 1, :, :]
+            state += reservoir_weights.dot(reservoir_states[sample, :, :] * spectral_radius)
+            activation(state)
+            if leaky:
+                state *= leakage
+                state += (1 - leakage) * reservoir_states[sample, :, :]
+        return reservoir_states[1:, :, :]
+
     def drop_out(self, drop_out_rate=0.0):
         """
         Experimental dropout strategy for the ESN. After passing some data through the network and collecting reservoir
@@ -526,11 +1343,14 @@ class BaseEchoStateNetwork(BaseEstimator):
             new_reservoir_size = int(drop_out_rate * self.reservoir_size)
             idx_to_drop_ = np.argsort(self._activations_var)[::-1][int(drop_out_rate * self.reservoir_size):]
             self.bias_weights_ = np.delete(self.bias_weights_, idx_to_drop_)
+            self.feedback_weights_ = np.delete(self.feedback_weights_, idx_to_drop_, axis=0)
             self.input_weights_ = scipy.sparse.csc_matrix(
                 np.delete(self.input_weights_.toarray(), idx_to_drop_, axis=0), dtype='float64')
             self.reservoir_weights_ = scipy.sparse.csc_matrix(
                 np.delete(np.delete(self.reservoir_weights_.toarray(), idx_to_drop_, axis=0), idx_to_drop_, axis=1),
                 dtype='float64')
+            self._reservoir_eigenbasis = None
+            self._convert_reservoir_weights()
 
             self._n_samples = 0
 
@@ -557,8 +1377,9 @@ class BaseEchoStateNetwork(BaseEstimator):
         if self.output_weights_ is None:
             self._compute_output_weights(n_jobs=n_jobs)
 
-        self._xTx = None
-        self._xTy = None
+        self._release_state_collection_matrices()
+        self._release_state_chunks()
+        self._release_sequence_statistics()
         self._activations_mean = None
         self._activations_var = None
         self.is_fitted_ = True
@@ -576,6 +1397,12 @@ class BaseEchoStateNetwork(BaseEstimator):
         -------
 
         """
+        if self.solver == 'cg':
+            self.output_weights_ = self._solve_cg()
+            return
+        if isinstance(self._xTx, np.memmap):
+            self.output_weights_ = self._solve_out_of_core()
+            return
         if self.solver == 'pinv':
             inv_xTx = np.linalg.inv(self._xTx)
         elif self.solver == 'ridge':
@@ -585,21 +1412,489 @@ class BaseEchoStateNetwork(BaseEstimator):
             print("Warning: Not implemented. Falling back to pinv solution")
             inv_xTx = np.linalg.inv(self._xTx)
         if n_jobs > 0:
-            self.output_weights_ = Parallel(n_jobs=n_jobs)(
-                delayed(np.dot)(inv_xTx, self._xTy[:, n]) for n in range(self.n_outputs_))
+            from joblib import Parallel, delayed
+            self.output_weights_ = np.column_stack(Parallel(n_jobs=n_jobs)(
+                delayed(np.dot)(inv_xTx, self._xTy[:, n]) for n in range(self.n_outputs_)))
         else:
             self.output_weights_ = np.dot(inv_xTx, self._xTy)
 
-    def predict(self, X, keep_reservoir_state=False):
+    def compute_output_weights(self, n_jobs=0):
+        """
+        Compute the output weights from all data passed through the network so far, without finalizing the training.
+        This can be used to evaluate several values of beta on the same collected data. With the solver 'cg', the
+        current output weights are used as initial guess.
+
+        Parameters
+        ----------
+        n_jobs : int, default: 0
+            If n_jobs is larger than 1, then the linear regression for each output dimension is computed separately
+            using joblib.
+
+        Returns
+        -------
+        self : returns a trained ESN model.
+        """
+        if self._xTx is None and not getattr(self, '_state_chunks', None):
+            raise NotFittedError("No training data has been collected. Call 'partial_fit' at first.")
+        self._compute_output_weights(n_jobs=n_jobs)
+        return self
+
+    def _store_state_chunk(self, reservoir_state, y):
+        """
+        Store the reservoir states and targets of one sequence for the solver 'cg'. If working_dir is set, the reservoir
+        states are written to a file there and only a memory map is kept.
+        Parameters
+        ----------
+        reservoir_state : ndarray of shape (n_samples, n_features)
+            The collected reservoir states without the wash_out samples
+        y : ndarray of shape (n_samples, n_outputs)
+            The target values without the wash_out samples
+
+        Returns
+        -------
+
+        """
+        if self.working_dir is not None:
+            fd, path = tempfile.mkstemp(suffix='.npy', prefix='reservoir_state_', dir=self.working_dir)
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, reservoir_state)
+            reservoir_state = np.load(path, mmap_mode='r')
+        self._state_chunks.append((reservoir_state, np.array(y, dtype=float)))
+
+    def _release_state_chunks(self):
+        """
+        Drop the reservoir states stored for the solver 'cg' and remove their files from working_dir.
+        Returns
+        -------
+
+        """
+        chunks = getattr(self, '_state_chunks', None)
+        self._state_chunks = None
+        if not chunks:
+            return
+        file_names = [reservoir_state.filename for reservoir_state, _ in chunks
+                      if isinstance(reservoir_state, np.memmap)]
+        del chunks
+        for file_name in file_names:
+            os.remove(file_name)
+
+    def _solve_out_of_core(self):
+        """
+        Solve the linear regression (xTx + lmda I) W = xTy with a blocked Cholesky decomposition for memory mapped xTx.
+        The factorization is computed tile-wise in a temporary file in working_dir, so that only one block of rows needs
+        to be kept in memory.
+        Returns
+        -------
+        output_weights : ndarray of shape (n_features, n_outputs)
+        """
+        import scipy.linalg
+        if self.solver == 'ridge':
+            lmda = self.beta ** 2 * self._n_samples
+        else:
+            lmda = 0.
+        n_features = self._xTx.shape[0]
+        blocks = [(start, min(start + _BLOCK_SIZE, n_features)) for start in range(0, n_features, _BLOCK_SIZE)]
+
+        fd, path = tempfile.mkstemp(suffix='.npy', prefix='cholesky_', dir=self.working_dir)
+        os.close(fd)
+        factor = np.lib.format.open_memmap(path, mode='w+', dtype=float, shape=self._xTx.shape)
+        try:
+            for start, stop in blocks:
+                factor[start:stop, start:] = self._xTx[start:stop, start:]
+                factor[start:stop, start:stop] += lmda * np.eye(stop - start)
+            # right-looking upper Cholesky decomposition xTx + lmda I = U.T U, one block of rows at a time
+            for start, stop in blocks:
+                panel = np.array(factor[start:stop, start:])
+                panel[:, :stop - start] = scipy.linalg.cholesky(panel[:, :stop - start], lower=False)
+                panel[:, stop - start:] = scipy.linalg.solve_triangular(
+                    panel[:, :stop - start], panel[:, stop - start:], trans='T', lower=False)
+                factor[start:stop, start:] = panel
+                for row_start, row_stop in blocks:
+                    if row_start >= stop:
+                        factor[row_start:row_stop, row_start:] -= np.dot(
+                            panel[:, row_start - start:row_stop - start].T, panel[:, row_start - start:])
+            # forward substitution U.T Z = xTy and backward substitution U W = Z
+            output_weights = np.array(self._xTy)
+            for start, stop in blocks:
+                output_weights[start:stop] = scipy.linalg.solve_triangular(
+                    factor[start:stop, start:stop], output_weights[start:stop], trans='T', lower=False)
+                output_weights[stop:] -= np.dot(factor[start:stop, stop:].T, output_weights[start:stop])
+            for start, stop in reversed(blocks):
+                output_weights[start:stop] -= np.dot(factor[start:stop, stop:], output_weights[stop:])
+                output_weights[start:stop] = scipy.linalg.solve_triangular(
+                    factor[start:stop, start:stop], output_weights[start:stop], lower=False)
+        finally:
+            del factor
+            os.remove(path)
+        return output_weights
+
+    def _solve_cg(self):
+        """
+        Solve the regularized linear regression (X.T X + lmda I) W = X.T y with conjugate gradients on the normal
+        equations (CGLS) directly on the stored reservoir states. X.T X is never formed, each iteration requires one
+        pass over the states with X and one with X.T. All output dimensions are solved simultaneously.
+        Returns
+        -------
+        output_weights : ndarray of shape (n_features, n_outputs)
+        """
+        if not self._state_chunks:
+            raise NotFittedError("No reservoir states have been collected. Call 'partial_fit' at first.")
+        lmda = self.beta ** 2 * self._n_samples
+        n_features = self._state_chunks[0][0].shape[1]
+
+        output_weights = np.zeros(shape=(n_features, self.n_outputs_))
+        if self.output_weights_ is not None and np.shape(self.output_weights_) == output_weights.shape:
+            output_weights[...] = self.output_weights_
+
+        residuals = [y - np.dot(reservoir_state, output_weights) for reservoir_state, y in self._state_chunks]
+        gradient = self._cg_normal_residual(residuals, output_weights, lmda)
+        gradient_norm = np.sqrt(np.sum(np.square(self._cg_normal_residual(
+            [y for _, y in self._state_chunks], np.zeros_like(output_weights), lmda)), axis=0))
+        direction = gradient.copy()
+        gamma = np.sum(np.square(gradient), axis=0)
+        for _ in range(_CG_MAX_ITER):
+            if np.all(np.sqrt(gamma) <= _CG_TOL * gradient_norm):
+                break
+            projections = [np.dot(reservoir_state, direction) for reservoir_state, _ in self._state_chunks]
+            delta = sum(np.sum(np.square(projection), axis=0) for projection in projections) \
+                + lmda * np.sum(np.square(direction), axis=0)
+            alpha = np.divide(gamma, delta, out=np.zeros_like(gamma), where=delta > 0)
+            output_weights += alpha * direction
+            for residual, projection in zip(residuals, projections):
+                residual -= alpha * projection
+            gradient = self._cg_normal_residual(residuals, output_weights, lmda)
+            gamma_new = np.sum(np.square(gradient), axis=0)
+            direction *= np.divide(gamma_new, gamma, out=np.zeros_like(gamma), where=gamma > 0)
+            direction += gradient
+            gamma = gamma_new
+        return output_weights
+
+    def _cg_normal_residual(self, residuals, output_weights, lmda):
+        """
+        Compute X.T r - lmda W over all stored reservoir states X and the corresponding residuals r.
+        Parameters
+        ----------
+        residuals : list of ndarray of shape (n_samples, n_outputs)
+            The residuals of all stored sequences
+        output_weights : ndarray of shape (n_features, n_outputs)
+            The current output weights W
+        lmda : float
+            The regularization parameter
+
+        Returns
+        -------
+        normal_residual : ndarray of shape (n_features, n_outputs)
+        """
+        normal_residual = -lmda * output_weights
+        for (reservoir_state, _), residual in zip(self._state_chunks, residuals):
+            normal_residual += np.dot(reservoir_state.T, residual)
+        return normal_residual
+
+    def _use_dual_form(self, reservoir_state):
+        """
+        Decide whether the output weights of a non-incremental fit are computed from the dual form of the linear
+        regression. This is the case if there are fewer samples than reservoir states.
+        Parameters
+        ----------
+        reservoir_state : ndarray of shape (n_samples, n_features)
+            The collected reservoir states without the wash_out samples
+
+        Returns
+        -------
+        use_dual_form : bool
+        """
+        return self.solver in ['pinv', 'ridge'] and reservoir_state.shape[0] < reservoir_state.shape[1]
+
+    def _solve_dual(self, reservoir_state, y):
+        """
+        This is a helper function to compute the output weights from the dual form of the linear regression, which is
+        cheaper than the primal form if there are fewer samples than reservoir states.
+        Parameters
+        ----------
+        reservoir_state : ndarray of shape (n_samples, n_features)
+            The collected reservoir states without the wash_out samples
+        y : ndarray of shape (n_samples, n_outputs)
+            The target values without the wash_out samples
+
+        Returns
+        -------
+        output_weights : ndarray of shape (n_features, n_outputs)
+        """
+        if self.solver == 'pinv':
+            return np.linalg.lstsq(reservoir_state, y, rcond=None)[0]
+        lmda = self.beta ** 2 * self._n_samples
+        gram = np.dot(reservoir_state, reservoir_state.T) + lmda * np.eye(reservoir_state.shape[0])
+        return np.dot(reservoir_state.T, np.linalg.solve(gram, y))
+
+    def save_checkpoint(self, path, consumed=None, gram_dtype=None, triangular=False):
+        """
+        Save the current training state to a checkpoint directory, e.g. while the model is trained incrementally with
+        partial_fit(update_output_weights=False). All weights and training statistics are stored as separate .npy
+        files, which is much faster than pickling the entire model. An existing checkpoint in path is only replaced
+        after the new one has been written completely.
+
+        Parameters
+        ----------
+        path : str
+            The checkpoint directory
+        consumed : list, default None
+            JSON serializable identifiers of the sequences that have been passed through the network so far, e.g. file
+            names. They are returned by load_checkpoint, so that a resumed training can skip them.
+        gram_dtype : dtype, default None
+            The dtype to store xTx with. 'float32' halves the size of the checkpoint, but the resumed training is not
+            exactly the same anymore. If None, xTx is stored as it is.
+        triangular : bool, default False
+            If True, only the upper triangle of the symmetric matrix xTx is stored.
+
+        Returns
+        -------
+
+        """
+        check_is_fitted(self, ['input_weights_', 'reservoir_weights_', 'bias_weights_'])
+        if self.solver == 'cg':
+            raise ValueError("Checkpoints are not supported for the solver 'cg'.")
+
+        params = self.get_params(deep=False)
+        # the state cache is tied to its directory like working_dir, and it cannot be stored in JSON
+        params.pop('state_cache', None)
+        if not isinstance(params['random_state'], (int, np.integer)):
+            params['random_state'] = None
+        metadata = {
+            'version': _CHECKPOINT_VERSION,
+            'estimator': type(self).__name__,
+            'params': params,
+            'n_outputs': int(self.n_outputs_),
+            'n_samples': int(self._n_samples),
+            'triangular': bool(triangular),
+            'consumed': list(consumed) if consumed is not None else [],
+        }
+
+        tmp_path = path.rstrip(os.sep) + '.tmp'
+        if os.path.exists(tmp_path):
+            shutil.rmtree(tmp_path)
+        os.makedirs(tmp_path)
+        for name, array in self._checkpoint_arrays().items():
+            if array is None:
+                continue
+            if scipy.sparse.issparse(array):
+                _save_sparse(os.path.join(tmp_path, name), array)
+            else:
+                np.save(os.path.join(tmp_path, name + '.npy'), array)
+        if self._xTx is not None:
+            _save_gram(os.path.join(tmp_path, 'xTx.npy'), self._xTx, dtype=gram_dtype, triangular=triangular)
+        with open(os.path.join(tmp_path, 'checkpoint.json'), 'w') as f:
+            json.dump(metadata, f)
+
+        if os.path.exists(path):
+            old_path = path.rstrip(os.sep) + '.old'
+            os.rename(path, old_path)
+            os.rename(tmp_path, path)
+            shutil.rmtree(old_path)
+        else:
+            os.rename(tmp_path, path)
+
+    def load_checkpoint(self, path):
+        """
+        Restore the training state from a checkpoint directory written by save_checkpoint. The hyperparameters are
+        restored as well, except for working_dir and state_cache. Statistics kept with keep_sequence_statistics=True
+        are restored, so that cross_validate_readout includes the sequences before the checkpoint.
+
+        Parameters
+        ----------
+        path : str
+            The checkpoint directory
+
+        Returns
+        -------
+        consumed : list
+            The identifiers of the sequences that had been passed through the network when the checkpoint was saved.
+        """
+        with open(os.path.join(path, 'checkpoint.json'), 'r') as f:
+            metadata = json.load(f)
+        if metadata['version'] != _CHECKPOINT_VERSION:
+            raise ValueError("Unsupported checkpoint version %s." % metadata['version'])
+        if metadata['estimator'] != type(self).__name__:
+            raise ValueError("The checkpoint contains a %s, not a %s." % (metadata['estimator'], type(self).__name__))
+
+        params = metadata['params']
+        params.pop('working_dir', None)
+        params.pop('state_cache', None)
+        self.set_params(**params)
+        self.n_outputs_ = metadata['n_outputs']
+        self._n_samples = metadata['n_samples']
+
+        arrays = {}
+        for file_name in os.listdir(path):
+            name, extension = os.path.splitext(file_name)
+            if extension == '.npy' and name != 'xTx':
+                arrays[name] = np.load(os.path.join(path, file_name))
+        for name in ['input_weights_', 'reservoir_weights_']:
+            arrays[name] = _load_sparse(os.path.join(path, name), arrays)
+        self._restore_checkpoint_arrays(arrays)
+
+        self._release_state_collection_matrices()
+        if os.path.exists(os.path.join(path, 'xTx.npy')):
+            self._xTx = self._allocate_state_collection_matrix(shape=arrays['xTy'].shape[:1] * 2)
+            self._xTy = self._allocate_state_collection_matrix(shape=arrays['xTy'].shape)
+            _load_gram(os.path.join(path, 'xTx.npy'), self._xTx, triangular=metadata['triangular'])
+            self._xTy[...] = arrays['xTy']
+        return metadata['consumed']
+
+    def _checkpoint_arrays(self):
+        """
+        Collect all arrays of the training state that are written to a checkpoint, except for xTx.
+        Returns
+        -------
+        arrays : dict of str to ndarray or sparse matrix
+        """
+        arrays = {
+            'input_weights_': self.input_weights_,
+            'reservoir_weights_': self.reservoir_weights_,
+            'bias_weights_': self.bias_weights_,
+            'feedback_weights_': self.feedback_weights_,
+            'output_weights_': self.output_weights_,
+            'activations_mean': self._activations_mean,
+            'activations_var': self._activations_var,
+            'xTy': self._xTy,
+        }
+        for n, (xTx, xTy, yTy, n_samples) in enumerate(getattr(self, '_sequence_statistics', None) or []):
+            arrays['sequence_xTx.%d' % n] = xTx
+            arrays['sequence_xTy.%d' % n] = xTy
+            arrays['sequence_yTy.%d' % n] = yTy
+            arrays['sequence_n_samples.%d' % n] = np.asarray(n_samples)
+        return arrays
+
+    def _restore_checkpoint_arrays(self, arrays):
+        """
+        Restore the training state from the arrays of a checkpoint, except for xTx and xTy.
+        Parameters
+        ----------
+        arrays : dict of str to ndarray or sparse matrix
+
+        Returns
+        -------
+
+        """
+        self._random_state = check_random_state(self.random_state)
+        self.input_weights_ = arrays['input_weights_']
+        self.reservoir_weights_ = arrays['reservoir_weights_']
+        self.bias_weights_ = arrays['bias_weights_']
+        self.feedback_weights_ = arrays.get('feedback_weights_')
+        self._reservoir_format = self._select_reservoir_format()
+        self._convert_reservoir_weights()
+        self._reservoir_eigenbasis = None
+        self.output_weights_ = arrays.get('output_weights_')
+        self._activations_mean = arrays.get('activations_mean')
+        self._activations_var = arrays.get('activations_var')
+        if self.output_weights_ is not None:
+            self.is_fitted_ = True
+        self._release_sequence_statistics()
+        self._sequence_statistics = []
+        n = 0
+        while 'sequence_xTx.%d' % n in arrays:
+            self._append_sequence_statistics(
+                arrays['sequence_xTx.%d' % n], arrays['sequence_xTy.%d' % n], arrays['sequence_yTy.%d' % n],
+                int(arrays['sequence_n_samples.%d' % n]))
+            n += 1
+
+    def export_inference_model(self, dtype='float32', quantize_readout=False):
+        """
+        Export a frozen model that contains only what is required for prediction.
+
+        Neurons that neither contribute to the output nor influence any contributing neuron are removed. The scaling
+        factors are folded into the weights, and the weights are stored with the given dtype. Training statistics,
+        the reservoir state and the hyperparameters are not part of the exported model.
+
+        Parameters
+        ----------
+        dtype : str or numpy dtype, default 'float32'
+            The floating point type of the weights and of the computations during prediction.
+        quantize_readout : bool, default False
+            If True, the output weights are stored as int8 with one scaling factor per output.
+
+        Returns
+        -------
+        model : ESNInferenceModel
+            The exported model.
+        """
+        check_is_fitted(self, ['input_weights_', 'reservoir_weights_', 'bias_weights_', 'output_weights_'])
+        if self.output_weights_ is None:
+            raise NotFittedError("The output weights have not been computed yet. Call 'finalize' at first.")
+        if self.feedback_scaling != 0:
+            raise ValueError("Models with output feedback cannot be exported, got feedback_scaling %s."
+                             % self.feedback_scaling)
+        dtype = np.dtype(dtype)
+        output_weights = np.asarray(self.output_weights_).reshape(self.output_weights_.shape[0], -1)
+        neurons = self._used_neurons(output_weights)
+        readout_rows = neurons + 1
+        if self.bi_directional:
+            readout_rows = np.concatenate((readout_rows, readout_rows + self.reservoir_size))
+
+        input_weights = scipy.sparse.csr_matrix(self.input_weights_)[neurons] * self.input_scaling
+        reservoir_weights = \
+            scipy.sparse.csr_matrix(self.reservoir_weights_)[neurons][:, neurons] * self.spectral_radius
+        reservoir_weights.eliminate_zeros()
+        bias_weights = np.asarray(self.bias_weights_)[neurons] * self.bias
+        readout = output_weights[readout_rows]
+        output_scale = None
+        if quantize_readout:
+            output_scale = np.abs(readout).max(axis=0, initial=0.) / 127.
+            output_scale[output_scale == 0.] = 1.
+            readout = np.round(readout / output_scale).astype(np.int8)
+            output_scale = output_scale.astype(dtype)
+        else:
+            readout = readout.astype(dtype)
+        return ESNInferenceModel(
+            input_weights=input_weights.astype(dtype), reservoir_weights=reservoir_weights.astype(dtype),
+            bias_weights=bias_weights.astype(dtype), output_weights=readout,
+            intercept=output_weights[0].astype(dtype), output_scale=output_scale, leakage=self.leakage,
+            reservoir_activation=self.reservoir_activation, ext_bias=self.ext_bias,
+            bi_directional=self.bi_directional, label_binarizer=getattr(self, '_label_binarizer', None))
+
+    def _used_neurons(self, output_weights):
+        """
+        Find the neurons that have a non-zero output weight or influence such a neuron through the recurrent weights.
+        Parameters
+        ----------
+        output_weights : ndarray of shape (n_features, n_outputs)
+            The output weights including the intercept in the first row
+
+        Returns
+        -------
+        neurons : ndarray of shape (n_neurons, )
+            The sorted indices of the used neurons
+        """
+        readout = output_weights[1:].reshape(-1, self.reservoir_size, output_weights.shape[1])
+        used = np.any(readout != 0, axis=(0, 2))
+        if self.spectral_radius != 0:
+            reservoir_weights = scipy.sparse.csr_matrix(self.reservoir_weights_)
+            while True:
+                # The neurons in the columns of the rows of used neurons feed them in the next time step
+                feeding = np.zeros_like(used)
+                feeding[reservoir_weights[used].indices] = True
+                if not (feeding & ~used).any():
+                    break
+                used |= feeding
+        return np.flatnonzero(used)
+
+    def predict(self, X, keep_reservoir_state=False, reservoir_state_callback=None):
         """
         Predict using the trained ESN model
 
+        Unless keep_reservoir_state is True, no attributes of the model are written, so that one fitted model can serve
+        several threads at once. The products with the weight matrices run in numpy and scipy kernels, which release
+        the GIL.
+
         Parameters
         ----------
-        X : array-like, shape (n_samples, n_features)
+        X : {array-like, sparse matrix} of shape (n_samples, n_features)
             The input data.
         keep_reservoir_state : bool, default False
-            If True, the reservoir state is kept and can be accessed from outside. This is useful for visualization
+            If True, the reservoir state is kept and can be accessed from outside. This is useful for visualization.
+            Since it writes an attribute, it must not be used if several threads share the model.
+        reservoir_state_callback : callable, default None
+            If not None, it is called with the reservoir states of X. Unlike keep_reservoir_state, no attribute is
+            written.
         Returns
         -------
         y_pred : array-like, shape (n_samples,) or (n_samples, n_outputs)
@@ -610,20 +1905,127 @@ class BaseEchoStateNetwork(BaseEstimator):
             msg = ("This %(name)s instance is not fitted yet. Call 'fit' with "
                    "appropriate arguments before using this method.")
             raise NotFittedError(msg % {'name': type(self).__name__})
-        X = check_array(X, accept_sparse=False)
-        y_pred = self._predict(X=X, keep_reservoir_state=keep_reservoir_state)
+        X = _check_input_array(X, accept_sparse='csr')
+        y_pred = self._predict(X=X, keep_reservoir_state=keep_reservoir_state,
+                               reservoir_state_callback=reservoir_state_callback)
         return y_pred
 
-    def _predict(self, X, keep_reservoir_state=False):
+    def generate(self, X, n_steps, y=None, autoregressive=False):
+        """
+        Generate outputs in closed loop after driving the trained ESN model with X.
+
+        The reservoir is first driven with X, and with the teacher y if given. Afterwards, it runs freely for n_steps
+        steps, in which the outputs are only fed back via the feedback weights (feedback_scaling != 0) and, with
+        autoregressive=True, as the next input. The weights are converted only once and all buffers are allocated
+        before the loop.
+
+        Parameters
+        ----------
+        X : {array-like, sparse matrix} of shape (n_samples, n_features)
+            The input data to warm up the reservoir. With ext_bias > 0, the external biases of the last sample are kept
+            during the generation.
+        n_steps : int
+            The number of outputs to generate.
+        y : array-like, shape (n_samples, ) or (n_samples, n_outputs), default None
+            The teacher that is fed back during the warm-up. If None, the outputs of the model are fed back.
+        autoregressive : bool, default False
+            If True, each output is, after reverting teacher_scaling and teacher_shift, the input of the next step. This
+            requires n_features - ext_bias == n_outputs. If False, the inputs are zero during the generation.
+
+        Returns
+        -------
+        y_gen : ndarray of shape (n_steps, ) or (n_steps, n_outputs)
+            The generated outputs
+        """
+        check_is_fitted(self, ['input_weights_', 'reservoir_weights_', 'bias_weights_', 'output_weights_'])
+        X = _check_input_array(X, accept_sparse='csr')
+        if self.bi_directional:
+            raise ValueError("generate does not support bi_directional=True.")
+        if n_steps < 0:
+            raise ValueError("n_steps must be >= 0, got %s." % n_steps)
+        if autoregressive and X.shape[1] - self.ext_bias != self.n_outputs_:
+            raise ValueError("autoregressive=True requires n_features - ext_bias == n_outputs, got %s inputs and %s "
+                             "outputs." % (X.shape[1] - self.ext_bias, self.n_outputs_))
+        output_weights = self.output_weights_.reshape(self.reservoir_size + 1, -1)
+        if y is not None:
+            y = check_array(y, ensure_2d=False).reshape(X.shape[0], -1)
+            y = self.teacher_scaling * y + self.teacher_shift
+        reservoir_state = self._forward_pass(X, teacher=y)
+        if y is not None:
+            output = y[-1, :].copy()
+        else:
+            output = output_weights[0] + np.dot(reservoir_state[-1, :], output_weights[1:])
+        _, bias_inputs = self._split_reservoir_inputs(X[-1:])
+        bias_inputs = bias_inputs[0] if bias_inputs is not None else None
+        y_gen = self._generate(reservoir_state[-1, :].copy(), output, bias_inputs, n_steps, autoregressive)
+        if self.n_outputs_ == 1:
+            y_gen = y_gen.ravel()
+        return y_gen
+
+    def _generate(self, state, output, bias_inputs, n_steps, autoregressive):
+        """
+        Run the reservoir in closed loop.
+
+        Parameters
+        ----------
+        state : ndarray of shape (reservoir_size, )
+            The last reservoir state of the warm-up
+        output : ndarray of shape (n_outputs, )
+            The last output of the warm-up
+        bias_inputs : ndarray of shape (ext_bias, )
+            The external biases
+        n_steps : int
+            The number of outputs to generate
+        autoregressive : bool
+            If True, the outputs are the next inputs
+
+        Returns
+        -------
+        y_gen : ndarray of shape (n_steps, n_outputs)
+            The generated outputs
+        """
+        reservoir_weights = self._recurrent_weights()
+        input_weights = scipy.sparse.csr_matrix(self.input_weights_) * self.input_scaling
+        output_weights = self.output_weights_.reshape(self.reservoir_size + 1, -1)
+        activation = ACTIVATIONS[self.reservoir_activation]
+        if self.ext_bias > 0:
+            bias = np.dot((self.bias_weights_ * self.bias).reshape(self.reservoir_size, -1), bias_inputs)
+        else:
+            bias = np.broadcast_to(self.bias_weights_ * self.bias, (self.reservoir_size, )).copy()
+        feedback_weights = self.feedback_scaling * self.feedback_weights_ if self.feedback_scaling != 0 else None
+
+        y_gen = np.empty(shape=(n_steps, output_weights.shape[1]))
+        next_state = np.empty(shape=(self.reservoir_size, ))
+        for step in range(n_steps):
+            np.add(bias, reservoir_weights.dot(state), out=next_state)
+            if autoregressive:
+                next_state += input_weights.dot((output - self.teacher_shift) / self.teacher_scaling)
+            if feedback_weights is not None:
+                next_state += np.dot(feedback_weights, output)
+            activation(next_state)
+            if self.leakage != 1.:
+                next_state *= self.leakage
+                next_state += (1 - self.leakage) * state
+            state, next_state = next_state, state
+            output = y_gen[step, :]
+            np.dot(state, output_weights[1:], out=output)
+            output += output_weights[0]
+        return y_gen
+
+    def _predict(self, X, keep_reservoir_state=False, reservoir_state_callback=None):
         """
         Predict using the trained ESN model
 
         Parameters
         ----------
-        X : array-like, shape (n_samples, n_features)
+        X : {array-like, sparse matrix} of shape (n_samples, n_features)
             The input data.
         keep_reservoir_state : bool, default False
-            If True, the reservoir state is kept and can be accessed from outside. This is useful for visualization
+            If True, the reservoir state is kept and can be accessed from outside. This is useful for visualization.
+            Since it writes an attribute, it must not be used if several threads share the model.
+        reservoir_state_callback : callable, default None
+            If not None, it is called with the reservoir states of X. Unlike keep_reservoir_state, no attribute is
+            written.
         Returns
         -------
         y_pred : array-like, shape (n_samples,) or (n_samples, n_outputs)
@@ -632,6 +2034,8 @@ class BaseEchoStateNetwork(BaseEstimator):
         reservoir_state = self._pass_through_reservoir(X=X)
         if keep_reservoir_state:
             self.reservoir_state = reservoir_state
+        if reservoir_state_callback is not None:
+            reservoir_state_callback(reservoir_state)
         y_pred = safe_sparse_dot(reservoir_state, self.output_weights_)
         return y_pred
 
@@ -664,6 +2068,11 @@ class ESNClassifier(BaseEchoStateNetwork, ClassifierMixin):
     leakage : float, default 1.0
         This element represents the leakage of the reservoir. Depending on the value, it acts as a short- or long-term
         memory coefficient.
+    feedback_scaling : float, default 0.0
+        This element represents the scaling of the feedback weights from the output to the reservoir. If it is not 0,
+        the output of the previous sample is fed back into the reservoir: the targets during training (teacher
+        forcing), the own output during predict and generate. This is not possible with bi_directional, linear_scan,
+        n_time_chunks > 1 and partial_fit_settings, and the reservoir states are not cached.
     reservoir_size : int, default 500
         This element represents the number of neurons in the reservoir.
     k_res : int, default 10
@@ -685,12 +2094,57 @@ class ESNClassifier(BaseEchoStateNetwork, ClassifierMixin):
         make sense to increase this hyperparameter.
     bi_directional : bool, default False
         If True, the input sequences are passed through the network two times, forward and backward.
-    solver : {'ridge', 'pinv'}
+    solver : {'ridge', 'pinv', 'cg'}
         The solver for weight optimization.
         - 'pinv' uses the pseudoinverse solution of linear regression.
         - 'ridge' uses L2 penalty while computing the linear regression
+        - 'cg' uses L2 penalty and solves the linear regression with conjugate gradients directly on the collected
+          reservoir states, without forming the matrix xTx. This is suitable for very large reservoirs.
     beta : float, optional, default 0.0001
         L2 penalty (regularization term) parameter.
+    reorder_neurons : bool, default False
+        If True, the neurons are renumbered after the initialization with the reverse Cuthill-McKee algorithm, so that
+        connected neurons have close indices. This improves the memory locality of the recurrence in large reservoirs.
+        The predictions do not change, but the weights and reservoir states are stored in the new order of neurons.
+        Only the random reservoir_topology is reordered.
+    reservoir_topology : {'random', 'cycle', 'delay_line', 'block_diagonal'}, default 'random'
+        The structure of the reservoir weights.
+            - 'random', every neuron receives k_res connections from randomly chosen neurons with weights drawn from a
+              standard normal distribution.
+            - 'cycle', the neurons form a ring with equal weights (simple cycle reservoir).
+            - 'delay_line', the neurons form a chain with equal forward and feedback weights.
+            - 'block_diagonal', the neurons form groups of k_res neurons, which are fully connected with weights
+              drawn from a standard normal distribution. reservoir_size must be a multiple of k_res.
+        The spectral radius of the structured topologies is known without an eigenvalue computation, and every step
+        of the recurrence is a shift or a product with small dense blocks.
+    linear_scan : bool, default False
+        If True, the reservoir_activation must be 'identity'. The reservoir is then a linear recurrence, which is
+        decoupled in the eigenbasis of the reservoir weights and computed for blocks of samples with a parallel prefix
+        scan in O(log n_samples) vectorized steps instead of a loop over the samples. The eigendecomposition is dense,
+        which limits this mode to reservoirs with up to a few thousand neurons.
+    n_time_chunks : int, default 1
+        If larger than 1, long sequences are split into n_time_chunks parts that are passed through the reservoir in
+        parallel worker processes. Every part starts with a warm-up of chunk_warm_up preceding samples, which relies on
+        the echo state property, so the reservoir states are only approximately equal to the states of a sequential
+        pass. The maximum deviation on a probe segment after the first split during fitting is stored in
+        time_chunk_error_. It is None if no sequence has been passed in time chunks, e.g. because the states have been
+        loaded from state_cache.
+    chunk_warm_up : int, default 100
+        The number of samples that precede every part of a sequence with n_time_chunks > 1. Sequences that are not
+        longer than n_time_chunks * chunk_warm_up samples are passed sequentially.
+    keep_sequence_statistics : bool, default False
+        If True, partial_fit additionally keeps xTx, xTy and the sum of squared targets of every sequence, in
+        working_dir if it is set. The readout can then be cross-validated over the sequences with
+        cross_validate_readout without passing any data through the reservoir again.
+    state_cache : str or ReservoirStateCache, default None
+        If not None, the reservoir states of every input are stored in a :class:`pyrcn.cache.ReservoirStateCache`, or
+        in such a cache in the directory state_cache. fit, partial_fit and predict load the states from there if the
+        same input has already been passed through a reservoir with the same weights and hyperparameters.
+    working_dir : str, optional, default None
+        Directory to store training data that does not need to be kept in memory. The matrices xTx and xTy are
+        memory mapped files there and the linear regression is solved out-of-core with a blocked Cholesky
+        decomposition. With the solver 'cg', the collected reservoir states are stored there.
+        If None, everything is kept in memory.
     random_state : int, RandomState instance or None, optional, default None
         If int, random_state is the seed used by the random number generator;
         If RandomState instance, random_state is the random number generator;
@@ -710,41 +2164,52 @@ class ESNClassifier(BaseEchoStateNetwork, ClassifierMixin):
     TODO
     """
     def __init__(self, k_in: int = 2, input_scaling: float = 1., spectral_radius: float = 0., bias: float = 0.,
-                 ext_bias: int = 0, leakage: float = 1., reservoir_size: int = 500, k_res: int = 10, wash_out: int = 0,
-                 reservoir_activation: str = 'tanh', bi_directional: bool = False, teacher_scaling: float = 1.,
-                 teacher_shift: float = 0., solver: str = 'ridge', beta: float = 1e-6, random_state: int = None):
+                 ext_bias: int = 0, leakage: float = 1., feedback_scaling: float = 0., reservoir_size: int = 500,
+                 k_res: int = 10, wash_out: int = 0, reservoir_activation: str = 'tanh', bi_directional: bool = False,
+                 teacher_scaling: float = 1., teacher_shift: float = 0., solver: str = 'ridge', beta: float = 1e-6,
+                 reorder_neurons: bool = False, reservoir_topology: str = 'random', linear_scan: bool = False,
+                 n_time_chunks: int = 1, chunk_warm_up: int = 100, keep_sequence_statistics: bool = False,
+                 state_cache: str = None, working_dir: str = None, random_state: int = None):
         super().__init__(k_in=k_in, input_scaling=input_scaling, spectral_radius=spectral_radius, bias=bias,
-                         ext_bias=ext_bias, leakage=leakage, reservoir_size=reservoir_size, k_res=k_res,
-                         wash_out=wash_out, reservoir_activation=reservoir_activation, bi_directional=bi_directional,
+                         ext_bias=ext_bias, leakage=leakage, feedback_scaling=feedback_scaling,
+                         reservoir_size=reservoir_size, k_res=k_res, wash_out=wash_out,
+                         reservoir_activation=reservoir_activation, bi_directional=bi_directional,
                          teacher_scaling=teacher_scaling, teacher_shift=teacher_shift, solver=solver, beta=beta,
-                         random_state=random_state)
+                         reorder_neurons=reorder_neurons, reservoir_topology=reservoir_topology,
+                         linear_scan=linear_scan, n_time_chunks=n_time_chunks, chunk_warm_up=chunk_warm_up,
+                         keep_sequence_statistics=keep_sequence_statistics, state_cache=state_cache,
+                         working_dir=working_dir, random_state=random_state)
 
     def _validate_input(self, X, y):
         """
-        Ensure that the input and output is in a proper format and transform it if possible.
+        Ensure that the input and output is in a proper format and transform it if possible. Float arrays, including
+        memory mapped arrays, are not copied.
         Parameters
         ----------
-        X : ndarray of shape (n_samples, n_features)
+        X : {ndarray, sparse matrix} of shape (n_samples, n_features)
             The input data
         y : ndarray of shape (n_samples, ) or (n_samples, n_outputs)
             The target values (class labels in classification, real numbers in regression).
 
         Returns
         -------
-        X : ndarray of shape (n_samples, n_features)
+        X : {ndarray, sparse matrix} of shape (n_samples, n_features)
             The input data
-        y : ndarray of shape (n_samples, ) or (n_samples, n_outputs)
-            The target values (class labels in classification, real numbers in regression).
+        y : sparse matrix of shape (n_samples, n_outputs)
+            The binarized class labels as sparse indicator matrix. teacher_scaling and teacher_shift are applied when
+            xTy is updated.
         """
-        X, y = check_X_y(X, y, accept_sparse=False, multi_output=True)
+        X = _check_input_array(X, accept_sparse='csr')
+        y = check_array(y, ensure_2d=False, dtype=None)
+        check_consistent_length(X, y)
         if y.ndim == 2 and y.shape[1] == 1:
             y = column_or_1d(y, warn=True)
 
-        self._label_binarizer = LabelBinarizer()
+        from sklearn.preprocessing import LabelBinarizer
+        self._label_binarizer = LabelBinarizer(sparse_output=True)
         self._label_binarizer.fit(y)
         self.classes_ = self._label_binarizer.classes_
-        y = self._label_binarizer.transform(y)
-        y = self.teacher_scaling * y + self.teacher_shift
+        y = self._label_binarizer.transform(y).astype(float)
         return X, y
 
     def fit(self, X, y, n_jobs: int = 0):
@@ -753,7 +2218,7 @@ class ESNClassifier(BaseEchoStateNetwork, ClassifierMixin):
 
         Parameters
         ----------
-        X : ndarray of shape (n_samples, n_features)
+        X : {ndarray, sparse matrix} of shape (n_samples, n_features)
             The input data
         y : ndarray of shape (n_samples, ) or (n_samples, n_outputs)
             The target values (class labels in classification, real numbers in regression).
@@ -771,18 +2236,22 @@ class ESNClassifier(BaseEchoStateNetwork, ClassifierMixin):
             self._initialize(y=y, n_features=X.shape[1] - 1)
         else:
             self._initialize(y=y, n_features=X.shape[1])
-        return self._fit(X, y, incremental=False, update_output_weights=True, n_jobs=n_jobs)
+        return self._fit(X, y, incremental=False, update_output_weights=True, n_jobs=n_jobs, scale_targets=True)
 
-    def predict(self, X, keep_reservoir_state=False):
+    def predict(self, X, keep_reservoir_state=False, reservoir_state_callback=None):
         """
         Predict the classes using the trained ESN classifier
 
         Parameters
         ----------
-        X : array-like, shape (n_samples, n_features)
+        X : {array-like, sparse matrix} of shape (n_samples, n_features)
             The input data.
         keep_reservoir_state : bool, default False
-            If True, the reservoir state is kept and can be accessed from outside. This is useful for visualization
+            If True, the reservoir state is kept and can be accessed from outside. This is useful for visualization.
+            Since it writes an attribute, it must not be used if several threads share the model.
+        reservoir_state_callback : callable, default None
+            If not None, it is called with the reservoir states of X. Unlike keep_reservoir_state, no attribute is
+            written.
         Returns
         -------
         y_pred : array-like, shape (n_samples,) or (n_samples, n_outputs)
@@ -793,7 +2262,8 @@ class ESNClassifier(BaseEchoStateNetwork, ClassifierMixin):
             msg = ("This %(name)s instance is not fitted yet. Call 'fit' with "
                    "appropriate arguments before using this method.")
             raise NotFittedError(msg % {'name': type(self).__name__})
-        y_pred = super().predict(X, keep_reservoir_state=keep_reservoir_state)
+        y_pred = super().predict(X, keep_reservoir_state=keep_reservoir_state,
+                                 reservoir_state_callback=reservoir_state_callback)
 
         if self.n_outputs_ == 1:
             y_pred = y_pred.ravel()
@@ -806,7 +2276,7 @@ class ESNClassifier(BaseEchoStateNetwork, ClassifierMixin):
 
         Parameters
         ----------
-        X : ndarray of shape (n_samples, n_features)
+        X : {ndarray, sparse matrix} of shape (n_samples, n_features)
             The input data
         y : ndarray of shape (n_samples, ) or (n_samples, n_outputs)
             The target values (class labels in classification, real numbers in regression).
@@ -834,7 +2304,7 @@ class ESNClassifier(BaseEchoStateNetwork, ClassifierMixin):
         data later.
         Parameters
         ----------
-        X : ndarray of shape (n_samples, n_features)
+        X : {ndarray, sparse matrix} of shape (n_samples, n_features)
             The input data
         y : ndarray of shape (n_samples, ) or (n_samples, n_outputs)
             The target values (class labels in classification, real numbers in regression).
@@ -851,6 +2321,7 @@ class ESNClassifier(BaseEchoStateNetwork, ClassifierMixin):
         self : returns a trained ESN classifier.
         """
         if _check_partial_fit_first_call(self, classes):
+            from sklearn.preprocessing import LabelBinarizer
             self._label_binarizer = LabelBinarizer().fit(classes)
             if self.ext_bias:
                 super()._initialize(y=y, n_features=X.shape[1] - 1)
@@ -860,22 +2331,55 @@ class ESNClassifier(BaseEchoStateNetwork, ClassifierMixin):
         super()._partial_fit(X, y, update_output_weights=update_output_weights, n_jobs=n_jobs)
         return self
 
-    def predict_proba(self, X, keep_reservoir_state=False):
+    def _checkpoint_arrays(self):
+        """
+        Collect all arrays of the training state that are written to a checkpoint, except for xTx.
+        Returns
+        -------
+        arrays : dict of str to ndarray or sparse matrix
+        """
+        arrays = super()._checkpoint_arrays()
+        arrays['classes_'] = getattr(self, 'classes_', None)
+        return arrays
+
+    def _restore_checkpoint_arrays(self, arrays):
+        """
+        Restore the training state from the arrays of a checkpoint, except for xTx and xTy.
+        Parameters
+        ----------
+        arrays : dict of str to ndarray or sparse matrix
+
+        Returns
+        -------
+
+        """
+        super()._restore_checkpoint_arrays(arrays)
+        if 'classes_' in arrays:
+            from sklearn.preprocessing import LabelBinarizer
+            self.classes_ = arrays['classes_']
+            self._label_binarizer = LabelBinarizer().fit(self.classes_)
+
+    def predict_proba(self, X, keep_reservoir_state=False, reservoir_state_callback=None):
         """
         Predict the probability estimates using the trained ESN classifier
 
         Parameters
         ----------
-        X : array-like, shape (n_samples, n_features)
+        X : {array-like, sparse matrix} of shape (n_samples, n_features)
             The input data.
         keep_reservoir_state : bool, default False
-            If True, the reservoir state is kept and can be accessed from outside. This is useful for visualization
+            If True, the reservoir state is kept and can be accessed from outside. This is useful for visualization.
+            Since it writes an attribute, it must not be used if several threads share the model.
+        reservoir_state_callback : callable, default None
+            If not None, it is called with the reservoir states of X. Unlike keep_reservoir_state, no attribute is
+            written.
         Returns
         -------
         y_pred : array-like, shape (n_samples,) or (n_samples, n_outputs)
             The predicted probability estimates
         """
-        y_pred = super().predict(X, keep_reservoir_state=keep_reservoir_state)
+        y_pred = super().predict(X, keep_reservoir_state=keep_reservoir_state,
+                                 reservoir_state_callback=reservoir_state_callback)
         y_pred = np.maximum(y_pred, 1e-3)
 
         if self.n_outputs_ == 1:
@@ -886,22 +2390,27 @@ class ESNClassifier(BaseEchoStateNetwork, ClassifierMixin):
         else:
             return y_pred
 
-    def predict_log_proba(self, X, keep_reservoir_state=False):
+    def predict_log_proba(self, X, keep_reservoir_state=False, reservoir_state_callback=None):
         """
         Predict the logarithmic probability estimates using the trained ESN classifier
 
         Parameters
         ----------
-        X : array-like, shape (n_samples, n_features)
+        X : {array-like, sparse matrix} of shape (n_samples, n_features)
             The input data.
         keep_reservoir_state : bool, default False
-            If True, the reservoir state is kept and can be accessed from outside. This is useful for visualization
+            If True, the reservoir state is kept and can be accessed from outside. This is useful for visualization.
+            Since it writes an attribute, it must not be used if several threads share the model.
+        reservoir_state_callback : callable, default None
+            If not None, it is called with the reservoir states of X. Unlike keep_reservoir_state, no attribute is
+            written.
         Returns
         -------
         y_pred : array-like, shape (n_samples,) or (n_samples, n_outputs)
             The predicted logarithmic probability estimates
         """
-        y_pred = self.predict_proba(X=X, keep_reservoir_state=keep_reservoir_state)
+        y_pred = self.predict_proba(X=X, keep_reservoir_state=keep_reservoir_state,
+                                    reservoir_state_callback=reservoir_state_callback)
         return np.log(y_pred)
 
 
@@ -933,6 +2442,11 @@ class ESNRegressor(BaseEchoStateNetwork, RegressorMixin):
     leakage : float, default 1.0
         This element represents the leakage of the reservoir. Depending on the value, it acts as a short- or long-term
         memory coefficient.
+    feedback_scaling : float, default 0.0
+        This element represents the scaling of the feedback weights from the output to the reservoir. If it is not 0,
+        the output of the previous sample is fed back into the reservoir: the targets during training (teacher
+        forcing), the own output during predict and generate. This is not possible with bi_directional, linear_scan,
+        n_time_chunks > 1 and partial_fit_settings, and the reservoir states are not cached.
     reservoir_size : int, default 500
         This element represents the number of neurons in the reservoir.
     k_res : int, default 10
@@ -954,12 +2468,57 @@ class ESNRegressor(BaseEchoStateNetwork, RegressorMixin):
         make sense to increase this hyperparameter.
     bi_directional : bool, default False
         If True, the input sequences are passed through the network two times, forward and backward.
-    solver : {'ridge', 'pinv'}
+    solver : {'ridge', 'pinv', 'cg'}
         The solver for weight optimization.
         - 'pinv' uses the pseudoinverse solution of linear regression.
         - 'ridge' uses L2 penalty while computing the linear regression
+        - 'cg' uses L2 penalty and solves the linear regression with conjugate gradients directly on the collected
+          reservoir states, without forming the matrix xTx. This is suitable for very large reservoirs.
     beta : float, optional, default 0.0001
         L2 penalty (regularization term) parameter.
+    reorder_neurons : bool, default False
+        If True, the neurons are renumbered after the initialization with the reverse Cuthill-McKee algorithm, so that
+        connected neurons have close indices. This improves the memory locality of the recurrence in large reservoirs.
+        The predictions do not change, but the weights and reservoir states are stored in the new order of neurons.
+        Only the random reservoir_topology is reordered.
+    reservoir_topology : {'random', 'cycle', 'delay_line', 'block_diagonal'}, default 'random'
+        The structure of the reservoir weights.
+            - 'random', every neuron receives k_res connections from randomly chosen neurons with weights drawn from a
+              standard normal distribution.
+            - 'cycle', the neurons form a ring with equal weights (simple cycle reservoir).
+            - 'delay_line', the neurons form a chain with equal forward and feedback weights.
+            - 'block_diagonal', the neurons form groups of k_res neurons, which are fully connected with weights
+              drawn from a standard normal distribution. reservoir_size must be a multiple of k_res.
+        The spectral radius of the structured topologies is known without an eigenvalue computation, and every step
+        of the recurrence is a shift or a product with small dense blocks.
+    linear_scan : bool, default False
+        If True, the reservoir_activation must be 'identity'. The reservoir is then a linear recurrence, which is
+        decoupled in the eigenbasis of the reservoir weights and computed for blocks of samples with a parallel prefix
+        scan in O(log n_samples) vectorized steps instead of a loop over the samples. The eigendecomposition is dense,
+        which limits this mode to reservoirs with up to a few thousand neurons.
+    n_time_chunks : int, default 1
+        If larger than 1, long sequences are split into n_time_chunks parts that are passed through the reservoir in
+        parallel worker processes. Every part starts with a warm-up of chunk_warm_up preceding samples, which relies on
+        the echo state property, so the reservoir states are only approximately equal to the states of a sequential
+        pass. The maximum deviation on a probe segment after the first split during fitting is stored in
+        time_chunk_error_. It is None if no sequence has been passed in time chunks, e.g. because the states have been
+        loaded from state_cache.
+    chunk_warm_up : int, default 100
+        The number of samples that precede every part of a sequence with n_time_chunks > 1. Sequences that are not
+        longer than n_time_chunks * chunk_warm_up samples are passed sequentially.
+    keep_sequence_statistics : bool, default False
+        If True, partial_fit additionally keeps xTx, xTy and the sum of squared targets of every sequence, in
+        working_dir if it is set. The readout can then be cross-validated over the sequences with
+        cross_validate_readout without passing any data through the reservoir again.
+    state_cache : str or ReservoirStateCache, default None
+        If not None, the reservoir states of every input are stored in a :class:`pyrcn.cache.ReservoirStateCache`, or
+        in such a cache in the directory state_cache. fit, partial_fit and predict load the states from there if the
+        same input has already been passed through a reservoir with the same weights and hyperparameters.
+    working_dir : str, optional, default None
+        Directory to store training data that does not need to be kept in memory. The matrices xTx and xTy are
+        memory mapped files there and the linear regression is solved out-of-core with a blocked Cholesky
+        decomposition. With the solver 'cg', the collected reservoir states are stored there.
+        If None, everything is kept in memory.
     random_state : int, RandomState instance or None, optional, default None
         If int, random_state is the seed used by the random number generator;
         If RandomState instance, random_state is the random number generator;
@@ -979,37 +2538,49 @@ class ESNRegressor(BaseEchoStateNetwork, RegressorMixin):
     TODO
     """
     def __init__(self, k_in: int = 2, input_scaling: float = 1., spectral_radius: float = 0., bias: float = 0.,
-                 ext_bias: int = 0, leakage: float = 1., reservoir_size: int = 500, k_res: int = 10, wash_out: int = 0,
-                 reservoir_activation: str = 'tanh', bi_directional: bool = False, teacher_scaling: float = 1.,
-                 teacher_shift: float = 0., solver: str = 'ridge', beta: float = 1e-6, random_state: int = None):
+                 ext_bias: int = 0, leakage: float = 1., feedback_scaling: float = 0., reservoir_size: int = 500,
+                 k_res: int = 10, wash_out: int = 0, reservoir_activation: str = 'tanh', bi_directional: bool = False,
+                 teacher_scaling: float = 1., teacher_shift: float = 0., solver: str = 'ridge', beta: float = 1e-6,
+                 reorder_neurons: bool = False, reservoir_topology: str = 'random', linear_scan: bool = False,
+                 n_time_chunks: int = 1, chunk_warm_up: int = 100, keep_sequence_statistics: bool = False,
+                 state_cache: str = None, working_dir: str = None, random_state: int = None):
         super().__init__(k_in=k_in, input_scaling=input_scaling, spectral_radius=spectral_radius, bias=bias,
-                         ext_bias=ext_bias, leakage=leakage, reservoir_size=reservoir_size, k_res=k_res,
-                         wash_out=wash_out, reservoir_activation=reservoir_activation, bi_directional=bi_directional,
+                         ext_bias=ext_bias, leakage=leakage, feedback_scaling=feedback_scaling,
+                         reservoir_size=reservoir_size, k_res=k_res, wash_out=wash_out,
+                         reservoir_activation=reservoir_activation, bi_directional=bi_directional,
                          teacher_scaling=teacher_scaling, teacher_shift=teacher_shift, solver=solver, beta=beta,
-                         random_state=random_state)
+                         reorder_neurons=reorder_neurons, reservoir_topology=reservoir_topology,
+                         linear_scan=linear_scan, n_time_chunks=n_time_chunks, chunk_warm_up=chunk_warm_up,
+                         keep_sequence_statistics=keep_sequence_statistics, state_cache=state_cache,
+                         working_dir=working_dir, random_state=random_state)
 
     def fit(self, X, y, n_jobs=0):
         self._validate_hyperparameters()
         X, y = self._validate_input(X, y)
         self._initialize(y=y, n_features=X.shape[1])
-        return self._fit(X, y, update_output_weights=True, n_jobs=n_jobs)
+        return self._fit(X, y, update_output_weights=True, n_jobs=n_jobs, scale_targets=True)
 
-    def predict(self, X, keep_reservoir_state=False):
+    def predict(self, X, keep_reservoir_state=False, reservoir_state_callback=None):
         """
         Predict the classes using the trained ESN regressor
 
         Parameters
         ----------
-        X : array-like, shape (n_samples, n_features)
+        X : {array-like, sparse matrix} of shape (n_samples, n_features)
             The input data.
         keep_reservoir_state : bool, default False
-            If True, the reservoir state is kept and can be accessed from outside. This is useful for visualization
+            If True, the reservoir state is kept and can be accessed from outside. This is useful for visualization.
+            Since it writes an attribute, it must not be used if several threads share the model.
+        reservoir_state_callback : callable, default None
+            If not None, it is called with the reservoir states of X. Unlike keep_reservoir_state, no attribute is
+            written.
         Returns
         -------
         y_pred : array-like, shape (n_samples,) or (n_samples, n_outputs)
             The predicted classes
         """
-        y_pred = super().predict(X, keep_reservoir_state=keep_reservoir_state)
+        y_pred = super().predict(X, keep_reservoir_state=keep_reservoir_state,
+                                 reservoir_state_callback=reservoir_state_callback)
 
         if self.n_outputs_ == 1:
             y_pred = y_pred.ravel()
@@ -1023,7 +2594,7 @@ class ESNRegressor(BaseEchoStateNetwork, RegressorMixin):
 
         Parameters
         ----------
-        X : ndarray of shape (n_samples, n_features)
+        X : {ndarray, sparse matrix} of shape (n_samples, n_features)
             The input data
         y : ndarray of shape (n_samples, ) or (n_samples, n_outputs)
             The target values (class labels in classification, real numbers in regression).
@@ -1050,7 +2621,7 @@ class ESNRegressor(BaseEchoStateNetwork, RegressorMixin):
         data later.
         Parameters
         ----------
-        X : ndarray of shape (n_samples, n_features)
+        X : {ndarray, sparse matrix} of shape (n_samples, n_features)
             The input data
         y : ndarray of shape (n_samples, ) or (n_samples, n_outputs)
             The target values (class labels in classification, real numbers in regression).
@@ -1068,3 +2639,284 @@ class ESNRegressor(BaseEchoStateNetwork, RegressorMixin):
         """
         super()._partial_fit(X, y, update_output_weights=update_output_weights, n_jobs=n_jobs)
         return self
+
+
+def _state_target_product(reservoir_state, y):
+    """
+    Compute reservoir_state.T @ y. If y is a sparse indicator matrix, e.g. binarized class labels, this is a sum of the
+    reservoir states of the samples of each output, which is computed from the sparse matrix without forming a dense
+    y.
+
+    Parameters
+    ----------
+    reservoir_state : ndarray of shape (n_samples, n_features)
+    y : {ndarray, sparse matrix} of shape (n_samples, n_outputs)
+
+    Returns
+    -------
+    xTy : ndarray of shape (n_features, n_outputs)
+    """
+    if scipy.sparse.issparse(y):
+        return safe_sparse_dot(scipy.sparse.csr_matrix(y.T), reservoir_state, dense_output=True).T
+    return np.dot(reservoir_state.T, y)
+
+
+def _dense_targets(y, scaling=1., shift=0.):
+    """Convert target values to an ndarray with scaling and shift applied for the solvers that need them densely."""
+    if scipy.sparse.issparse(y):
+        y = y.toarray()
+    if scaling != 1. or shift != 0.:
+        y = scaling * y + shift
+    return y
+
+
+def _check_input_array(array, ensure_2d=True, accept_sparse=False, dtype='numeric'):
+    """
+    Validate an input array like check_array, but return float arrays, e.g. memory mapped feature files, as they
+    are. Their finiteness is checked in blocks of samples, so that no temporary array of the size of the input is
+    allocated.
+
+    Parameters
+    ----------
+    array : {array-like, sparse matrix}
+    ensure_2d : bool, default True
+    accept_sparse : str or False, default False
+    dtype : 'numeric' or None, default 'numeric'
+
+    Returns
+    -------
+    array : {ndarray, sparse matrix}
+    """
+    if not isinstance(array, np.ndarray) or array.dtype not in (np.float32, np.float64) \
+            or array.ndim not in ((2, ) if ensure_2d else (1, 2)) or array.shape[0] == 0:
+        return check_array(array, accept_sparse=accept_sparse, ensure_2d=ensure_2d, dtype=dtype)
+    n_rows = max(1, _CHECK_BLOCK_SIZE // max(array[:1].size, 1))
+    for start in range(0, array.shape[0], n_rows):
+        if not np.isfinite(array[start:start + n_rows]).all():
+            raise ValueError("Input contains NaN, infinity or a value too large for %r." % array.dtype)
+    return array
+
+
+def _linear_reservoir_eigenbasis(reservoir_weights):
+    """
+    Compute the eigendecomposition of the reservoir weights for the linear scan. Of every pair of complex conjugate
+    eigenvalues, only the one with positive imaginary part is kept.
+
+    Parameters
+    ----------
+    reservoir_weights : {ndarray, sparse matrix} of shape (reservoir_size, reservoir_size)
+
+    Returns
+    -------
+    eigenbasis : tuple of (eigenvalues, inverse_eigenvectors, eigenvectors) or False
+        The kept eigenvalues of shape (n_modes, ), the corresponding rows of the inverse eigenvector matrix of shape
+        (n_modes, reservoir_size), and the real matrix of shape (reservoir_size, 2 * n_modes) that maps the real and
+        imaginary parts of the modes to the reservoir states. False, if the eigenvectors are too ill-conditioned.
+    """
+    if scipy.sparse.issparse(reservoir_weights):
+        reservoir_weights = reservoir_weights.toarray()
+    eigenvalues, eigenvectors = np.linalg.eig(reservoir_weights)
+    if np.linalg.cond(eigenvectors) > _SCAN_MAX_CONDITION:
+        return False
+    inverse_eigenvectors = np.linalg.inv(eigenvectors)
+    kept = eigenvalues.imag >= 0
+    # the conjugate of a kept mode contributes the same real part again
+    eigenvectors = eigenvectors[:, kept] * np.where(eigenvalues[kept].imag > 0, 2., 1.)
+    return (eigenvalues[kept], inverse_eigenvectors[kept],
+            np.concatenate((eigenvectors.real, -eigenvectors.imag), axis=1))
+
+
+def _inplace_linear_scan(X, decay):
+    """
+    Compute the recurrence X[t] = decay * X[t - 1] + X[t] along the first axis inplace. This is a Hillis-Steele scan,
+    which needs log2(n_samples) vectorized steps.
+
+    Parameters
+    ----------
+    X : ndarray of shape (n_samples, n_features)
+    decay : ndarray of shape (n_features, )
+
+    Returns
+    -------
+
+    """
+    offset = 1
+    while offset < X.shape[0]:
+        X[offset:] += decay * X[:-offset]
+        decay = decay * decay
+        offset *= 2
+
+
+def _arpack():
+    """Import the ARPACK eigenvalue solver on first use, because scipy.sparse.linalg is slow to import."""
+    if scipy.__version__ == '0.9.0' or scipy.__version__ == '0.10.1':
+        from scipy.sparse.linalg import eigs, ArpackNoConvergence
+    else:
+        from scipy.sparse.linalg.eigen.arpack import eigs, ArpackNoConvergence
+    return eigs, ArpackNoConvergence
+
+
+def _save_sparse(file_name, matrix):
+    """Save the components of a sparse CSC or CSR matrix as separate .npy files with the common prefix file_name."""
+    np.save(file_name + '.data.npy', matrix.data)
+    np.save(file_name + '.indices.npy', matrix.indices)
+    np.save(file_name + '.indptr.npy', matrix.indptr)
+    np.save(file_name + '.shape.npy', np.array([*matrix.shape, matrix.format == 'csc'], dtype=np.int64))
+
+
+def _load_sparse(file_name, arrays):
+    """Rebuild a sparse matrix saved with _save_sparse. If the matrix is not sparse, it is taken from arrays."""
+    name = os.path.basename(file_name)
+    if name in arrays:
+        return arrays.pop(name)
+    n_rows, n_columns, is_csc = arrays.pop(name + '.shape')
+    matrix_type = scipy.sparse.csc_matrix if is_csc else scipy.sparse.csr_matrix
+    return matrix_type((arrays.pop(name + '.data'), arrays.pop(name + '.indices'), arrays.pop(name + '.indptr')),
+                       shape=(n_rows, n_columns))
+
+
+def _save_gram(file_name, matrix, dtype=None, triangular=False):
+    """Save a symmetric matrix as .npy file, optionally only its upper triangle row by row, block by block."""
+    n = matrix.shape[0]
+    if dtype is None:
+        dtype = matrix.dtype
+    if not triangular:
+        stored = np.lib.format.open_memmap(file_name, mode='w+', dtype=dtype, shape=matrix.shape)
+        for start in range(0, n, _BLOCK_SIZE):
+            stored[start:start + _BLOCK_SIZE] = matrix[start:start + _BLOCK_SIZE]
+    else:
+        stored = np.lib.format.open_memmap(file_name, mode='w+', dtype=dtype, shape=(n * (n + 1) // 2, ))
+        offset = 0
+        for row in range(n):
+            stored[offset:offset + n - row] = matrix[row, row:]
+            offset += n - row
+    stored.flush()
+    del stored
+
+
+def _load_gram(file_name, matrix, triangular=False):
+    """Load a symmetric matrix saved with _save_gram into the preallocated array matrix."""
+    n = matrix.shape[0]
+    stored = np.load(file_name, mmap_mode='r')
+    if not triangular:
+        for start in range(0, n, _BLOCK_SIZE):
+            matrix[start:start + _BLOCK_SIZE] = stored[start:start + _BLOCK_SIZE]
+        return
+    offset = 0
+    for row in range(n):
+        matrix[row, row:] = stored[offset:offset + n - row]
+        offset += n - row
+    for start in range(0, n, _BLOCK_SIZE):
+        stop = min(start + _BLOCK_SIZE, n)
+        tile = np.array(matrix[start:stop, start:stop])
+        matrix[start:stop, start:stop] = np.triu(tile) + np.triu(tile, k=1).T
+        matrix[stop:, start:stop] = matrix[start:stop, stop:].T
+
+
+class ESNInferenceModel(BaseEstimator):
+    """
+    Frozen Echo State Network for prediction only, as exported by :meth:`ESNRegressor.export_inference_model` or
+    :meth:`ESNClassifier.export_inference_model`.
+
+    The scaling factors are folded into the weights, and unused neurons have been removed. All computations are done
+    in the dtype of the weights.
+
+    Parameters
+    ----------
+    input_weights : sparse matrix of shape (n_neurons, n_features)
+        The scaled input weights.
+    reservoir_weights : sparse matrix of shape (n_neurons, n_neurons)
+        The scaled recurrent weights.
+    bias_weights : ndarray of shape (n_neurons, ) or (n_neurons, ext_bias)
+        The scaled bias weights.
+    output_weights : ndarray of shape (n_neurons, n_outputs) or (2 * n_neurons, n_outputs)
+        The output weights without the intercept, either floating point or int8.
+    intercept : ndarray of shape (n_outputs, )
+        The intercept of the outputs.
+    output_scale : ndarray of shape (n_outputs, ) or None
+        The scaling factors of int8 output weights.
+    leakage : float
+        The leakage of the reservoir.
+    reservoir_activation : {'tanh', 'identity', 'logistic', 'relu'}
+        The activation function in the reservoir.
+    ext_bias : int
+        The number of external biases appended to the input matrix.
+    bi_directional : bool
+        If True, the input sequences are passed through the network forward and backward.
+    label_binarizer : LabelBinarizer or None
+        If not None, the outputs are converted to class labels.
+    """
+    def __init__(self, input_weights, reservoir_weights, bias_weights, output_weights, intercept, output_scale=None,
+                 leakage: float = 1., reservoir_activation: str = 'tanh', ext_bias: int = 0,
+                 bi_directional: bool = False, label_binarizer=None):
+        self.input_weights = input_weights
+        self.reservoir_weights = reservoir_weights
+        self.bias_weights = bias_weights
+        self.output_weights = output_weights
+        self.intercept = intercept
+        self.output_scale = output_scale
+        self.leakage = leakage
+        self.reservoir_activation = reservoir_activation
+        self.ext_bias = ext_bias
+        self.bi_directional = bi_directional
+        self.label_binarizer = label_binarizer
+
+    def predict(self, X):
+        """
+        Predict using the frozen ESN model
+
+        Parameters
+        ----------
+        X : array-like, shape (n_samples, n_features)
+            The input data.
+        Returns
+        -------
+        y_pred : array-like, shape (n_samples,) or (n_samples, n_outputs)
+            The predicted values or classes
+        """
+        X = check_array(X, dtype=self.bias_weights.dtype)
+        reservoir_state = self._forward_pass(X)
+        if self.bi_directional:
+            reservoir_state = np.concatenate((reservoir_state, np.flipud(self._forward_pass(np.flipud(X)))), 1)
+        y_pred = np.dot(reservoir_state, self.output_weights.astype(reservoir_state.dtype, copy=False))
+        if self.output_scale is not None:
+            y_pred *= self.output_scale
+        y_pred += self.intercept
+        if y_pred.shape[1] == 1:
+            y_pred = y_pred.ravel()
+        if self.label_binarizer is not None:
+            return self.label_binarizer.inverse_transform(y_pred)
+        return y_pred
+
+    def _forward_pass(self, X):
+        """
+        Compute the reservoir states. The input contributions of all samples are computed at once, so that only the
+        recurrent connections remain in the loop over the samples.
+
+        Parameters
+        ----------
+        X : ndarray of shape (n_samples, n_features)
+            The input data
+
+        Returns
+        -------
+        reservoir_state : ndarray of shape (n_samples, n_neurons)
+        """
+        if self.ext_bias > 0:
+            reservoir_state = safe_sparse_dot(X[:, :-self.ext_bias], self.input_weights.T, dense_output=True)
+            reservoir_state += np.dot(X[:, -self.ext_bias:], self.bias_weights.T)
+        else:
+            reservoir_state = safe_sparse_dot(X, self.input_weights.T, dense_output=True)
+            reservoir_state += self.bias_weights
+        reservoir_state = np.ascontiguousarray(reservoir_state)
+        activation = ACTIVATIONS[self.reservoir_activation]
+        previous_state = np.zeros(reservoir_state.shape[1], dtype=reservoir_state.dtype)
+        for sample in range(reservoir_state.shape[0]):
+            state = reservoir_state[sample]
+            state += self.reservoir_weights * previous_state
+            activation(state)
+            if self.leakage != 1.:
+                state *= self.leakage
+                state += (1 - self.leakage) * previous_state
+            previous_state = state
+        return reservoir_state
@@ -8,12 +8,11 @@ The :mod:`extreme_learninc_machine` contains the ELMRegressor and the ELMClassif
 import numpy as np
 
 from sklearn.base import BaseEstimator, ClassifierMixin, RegressorMixin, MultiOutputMixin, is_regressor
-from pyrcn.base import InputToNode
+from pyrcn.base import InputToNode, InputToNodeUnion
 from pyrcn.linear_model import IncrementalRegression
 from sklearn.utils import check_random_state
 from sklearn.preprocessing import LabelBinarizer
 from sklearn.exceptions import NotFittedError
-from sklearn.pipeline import FeatureUnion
 
 
 class ELMRegressor(BaseEstimator, MultiOutputMixin, RegressorMixin):
@@ -64,7 +63,7 @@ class ELMRegressor(BaseEstimator, MultiOutputMixin, RegressorMixin):
         self._validate_data(X, y, multi_output=True)
 
         if self._input_to_node is None:
-            self._input_to_node = FeatureUnion(
+            self._input_to_node = InputToNodeUnion(
                 transformer_list=self.input_to_nodes,
                 n_jobs=n_jobs,
                 transformer_weights=transformer_weights).fit(X)
@@ -97,7 +96,7 @@ class ELMRegressor(BaseEstimator, MultiOutputMixin, RegressorMixin):
         self._validate_hyperparameters()
         self._validate_data(X, y, multi_output=True)
 
-        self._input_to_node = FeatureUnion(
+        self._input_to_node = InputToNodeUnion(
             transformer_list=self.input_to_nodes,
             n_jobs=n_jobs,
             transformer_weights=transformer_weights)
@@ -54,3 +54,22 @@ def test_iris_ensemble_iterative_regression():
 
     print('score: %f' % cls.score(X_test, y_test))
     assert cls.score(X_test, y_test) >= 4./5.
+
+
+def test_elm_concurrent_predict():
+    print('\ntest_elm_concurrent_predict():')
+    from concurrent.futures import ThreadPoolExecutor
+    X_train, X_test, y_train, y_test = train_test_split(X_iris, y_iris, test_size=50, random_state=42)
+    cls = ELMClassifier(
+        input_to_nodes=[('default', InputToNode(hidden_layer_size=50, random_state=42))],
+        regressor=IncrementalRegression(alpha=.01, normalize=True),
+        random_state=42)
+    for samples in np.split(np.arange(0, X_train.shape[0]), 5):
+        cls.partial_fit(X_train[samples, :], y_train[samples])
+    n_samples_seen = cls._regressor.scaler.n_samples_seen_
+    y_predicted = [cls.predict(X_test[start:start + 10]) for start in range(0, 50, 10)]
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        y_concurrent = list(executor.map(cls.predict, [X_test[start:start + 10] for start in range(0, 50, 10)]))
+    assert cls._regressor.scaler.n_samples_seen_ == n_samples_seen
+    for y_batch, y_concurrent_batch in zip(y_predicted, y_concurrent):
+        np.testing.assert_array_equal(y_batch, y_concurrent_batch)
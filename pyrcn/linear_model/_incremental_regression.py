@@ -7,7 +7,7 @@ Incremental regression
 
 import numpy as np
 import scipy
-from sklearn.base import BaseEstimator, RegressorMixin
+from sklearn.base import BaseEstimator, RegressorMixin, clone
 from sklearn.utils import check_X_y
 from sklearn.utils.extmath import safe_sparse_dot
 from sklearn.preprocessing import StandardScaler
@@ -56,7 +56,8 @@ class IncrementalRegression(BaseEstimator, RegressorMixin):
         X : {ndarray, sparse matrix} of shape (n_samples, n_features)
         y : {ndarray, sparse matrix} of shape (n_samples,) or (n_samples, n_targets)
         partial_normalize : bool, default=True
-            Partial fits the normalization transformer on this sample if True.
+            Partial fits the normalization transformer on this sample if True. Otherwise, the sample is normalized with
+            the transformer fitted on the prior samples.
         reset : bool, default=False
             Begin a new fit, drop prior fits.
 
@@ -69,6 +70,12 @@ class IncrementalRegression(BaseEstimator, RegressorMixin):
         if reset:
             self._K = None
             self._P = None
+            self._output_weights = None
+
+        if self._K is None and self._output_weights is not None:
+            # e.g. after a fit in dual form, the update below requires the statistics of all prior samples
+            raise ValueError("The statistics of the prior fits are not available. Call partial_fit with reset=True to "
+                             "begin a new fit.")
 
         if self._K is None:
             self._K = safe_sparse_dot(X_preprocessed.T, X_preprocessed)
@@ -98,10 +105,38 @@ class IncrementalRegression(BaseEstimator, RegressorMixin):
         self
         """
         X, y = check_X_y(X, y)
+        # the normalization is fitted on this sample only
+        self.scaler = clone(self.scaler)
 
-        self.partial_fit(X, y, partial_normalize=False, reset=True)
+        if X.shape[0] < X.shape[1] + self.fit_intercept:
+            # Fewer samples than features: solve the (n_samples x n_samples) dual system instead
+            X_preprocessed = self._preprocessing(X)
+            self._K = None
+            self._P = None
+            self._output_weights = self._solve_dual(X_preprocessed, y)
+        else:
+            self.partial_fit(X, y, reset=True)
         return self
 
+    def _solve_dual(self, X, y):
+        """Computes the output weights from the dual form X.T (X X.T + alpha^2 I)^-1 y.
+
+        This is equivalent to the primal solution (X.T X + alpha^2 I)^-1 X.T y, but requires only the solution of an
+        (n_samples x n_samples) linear system.
+
+        Parameters
+        ----------
+        X : {ndarray, sparse matrix} of shape (n_samples, n_features)
+            The preprocessed input data.
+        y : {ndarray, sparse matrix} of shape (n_samples,) or (n_samples, n_targets)
+
+        Returns
+        -------
+        output_weights : ndarray of shape (n_features,) or (n_features, n_targets)
+        """
+        gram = safe_sparse_dot(X, X.T, dense_output=True) + self.alpha**2 * np.identity(X.shape[0])
+        return safe_sparse_dot(X.T, np.linalg.solve(gram, y), dense_output=True)
+
     def predict(self, X):
         """Predicts output y according to input X.
 
@@ -125,7 +160,8 @@ class IncrementalRegression(BaseEstimator, RegressorMixin):
         ----------
         X : {ndarray, sparse matrix} of shape (n_samples, n_features)
         partial_normalize : bool, default=True
-            Partial fits the normalization transformer on this sample if True.
+            Partial fits the normalization transformer on this sample if True. Otherwise, the sample is normalized with
+            the transformer fitted on the prior samples.
 
         Returns
         -------
@@ -138,8 +174,8 @@ class IncrementalRegression(BaseEstimator, RegressorMixin):
 
         if self.normalize:
             if partial_normalize:
-                self.scaler.partial_fit(X_preprocessed).transform(X_preprocessed)
-            else:
-                self.scaler.fit_transform(X_preprocessed)
+                self.scaler.partial_fit(X_preprocessed)
+            # not in place, so that predict does not modify the data of the caller
+            X_preprocessed = self.scaler.transform(X_preprocessed, copy=True)
 
         return X_preprocessed
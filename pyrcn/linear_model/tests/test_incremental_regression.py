@@ -31,3 +31,60 @@ def test_linear():
     print("tests: {0}\nregr: {1}".format(y_test, y_reg))
     np.testing.assert_allclose(y_reg, y_test, rtol=.01, atol=.15)
 
+
+def test_normalize():
+    print('\ntest_normalize():')
+    rs = np.random.RandomState(42)
+    X = rs.uniform(low=-1., high=1., size=(100, 3)) * [1., 10., 100.]
+    y = rs.uniform(low=-1., high=1., size=100)
+    reg = IncrementalRegression(alpha=.1, fit_intercept=False, normalize=True).fit(X, y)
+    X_scaled = (X - X.mean(axis=0)) / X.std(axis=0)
+    output_weights = np.linalg.solve(np.dot(X_scaled.T, X_scaled) + .01 * np.identity(3), np.dot(X_scaled.T, y))
+    np.testing.assert_allclose(reg._output_weights, output_weights, atol=1e-10)
+
+    # predict applies the fitted normalization and leaves X unchanged
+    X_test = X[:10].copy()
+    np.testing.assert_allclose(reg.predict(X_test), np.dot(X_scaled[:10], output_weights), atol=1e-10)
+    np.testing.assert_array_equal(X_test, X[:10])
+    np.testing.assert_allclose(reg.predict(X_test[:1]), reg.predict(X_test)[:1], atol=1e-10)
+
+    # a new fit does not normalize with the statistics of the prior fit
+    np.testing.assert_allclose(reg.fit(X[50:], y[50:]).scaler.mean_, X[50:].mean(axis=0))
+
+
+def test_dual():
+    print('\ntest_dual():')
+    rs = np.random.RandomState(42)
+    X = rs.uniform(low=-1., high=1., size=(20, 50))
+    y = rs.uniform(low=-1., high=1., size=(20, 2))
+    reg = IncrementalRegression(alpha=.1)
+    reg.fit(X, y[:, 0])
+    assert reg._K is None
+
+    X_intercept = np.hstack((X, np.ones(shape=(20, 1))))
+    output_weights = np.linalg.solve(np.dot(X_intercept.T, X_intercept) + .01 * np.identity(51),
+                                     np.dot(X_intercept.T, y[:, 0]))
+    np.testing.assert_allclose(reg._output_weights, output_weights, atol=1e-10)
+    np.testing.assert_allclose(reg.predict(X), np.dot(X_intercept, output_weights), atol=1e-10)
+
+
+def test_dual_partial_fit():
+    print('\ntest_dual_partial_fit():')
+    rs = np.random.RandomState(42)
+    X = rs.uniform(low=-1., high=1., size=(40, 50))
+    y = rs.uniform(low=-1., high=1., size=(40, 2))
+    reg = IncrementalRegression(alpha=.1)
+    reg.fit(X[:20, :], y[:20, 0])
+    assert reg._K is None
+    # the dual fit keeps no statistics to continue from
+    with pytest.raises(ValueError):
+        reg.partial_fit(X[20:, :], y[20:, 0])
+    reg.partial_fit(X[:20, :], y[:20, 0], reset=True)
+    reg.partial_fit(X[20:, :], y[20:, 0])
+    np.testing.assert_allclose(reg._output_weights, IncrementalRegression(alpha=.1).fit(X, y[:, 0])._output_weights,
+                               atol=1e-10)
+
+    # a new fit does not depend on the prior fits
+    reg.fit(X[:20, :], y[:20, 0])
+    np.testing.assert_allclose(reg._output_weights, IncrementalRegression(alpha=.1).fit(
+        X[:20, :], y[:20, 0])._output_weights, atol=1e-10)
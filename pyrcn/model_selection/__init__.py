@@ -0,0 +1,9 @@
+"""
+The :mod:`pyrcn.model_selection` module includes tools to tune the hyperparameters of reservoir computing models.
+"""
+
+# See https://github.com/TUD-STKS/PyRCN and for documentation.
+
+from pyrcn.model_selection._search import SuccessiveHalvingSearch
+
+__all__ = ['SuccessiveHalvingSearch']
@@ -0,0 +1,521 @@
+"""
+Hyperparameter search for Echo State Networks
+"""
+
+# Author: Michael Schindler <michael.schindler@maschindler.de>
+# License: BSD 3 clause
+
+import os
+import shutil
+import tempfile
+from collections import namedtuple
+
+import numpy as np
+from sklearn.base import BaseEstimator, MetaEstimatorMixin, clone, is_classifier
+from sklearn.model_selection import ParameterGrid
+from sklearn.utils import check_random_state
+from sklearn.utils.validation import check_is_fitted
+
+from pyrcn.echo_state_network import BaseEchoStateNetwork, _SETTING_PARAMETERS
+
+# Solvers whose output weights are computed from xTx and xTy
+_GRAM_SOLVERS = ['ridge', 'pinv']
+
+# A memory mapped matrix that is passed between processes by its file name
+_StoredMatrix = namedtuple('_StoredMatrix', ['filename'])
+
+
+class SuccessiveHalvingSearch(BaseEstimator, MetaEstimatorMixin):
+    """Successive halving search over the hyperparameters of an Echo State Network.
+
+    All candidates are evaluated on a small number of training sequences at first. After each round, only the best
+    1 / factor of the candidates are kept, and the number of training sequences is multiplied by factor. Optionally,
+    the reservoir size grows with the number of sequences, so that bad candidates are dropped before a large reservoir
+    is simulated.
+
+    Candidates that only differ in input_scaling, spectral_radius, bias, leakage and beta share their reservoir
+    weights. They form one group that is passed through the reservoir in one batched pass, see
+    :meth:`BaseEchoStateNetwork.partial_fit_settings`. The groups are evaluated in parallel worker processes. As long as
+    the reservoir size does not change, a group keeps its xTx and xTy from the previous round and only passes the
+    additional sequences through the reservoir. xTx and xTy are memory mapped files in a temporary directory, inside
+    the working_dir of estimator if it is set, so that only their file names are sent between the processes.
+
+    The output weights for all values in betas are computed in closed form from one eigendecomposition of xTx per
+    candidate. Each candidate is scored with its best beta on held-out validation sequences, with the negative mean
+    squared error for regressors and the accuracy of the individual samples for classifiers.
+
+    Parameters
+    ----------
+    estimator : ESNRegressor or ESNClassifier
+        The model to be tuned. It needs to use one of the solvers 'ridge' or 'pinv'.
+    param_grid : dict or list of dict
+        The hyperparameters to be searched, as for :class:`sklearn.model_selection.GridSearchCV`.
+    betas : list of float, default None
+        The regularization parameters that are evaluated in closed form for each candidate. If None, the beta of the
+        candidate is used. beta must not be part of param_grid if betas is given.
+    factor : int, default 3
+        The fraction 1 / factor of the candidates is kept after each round.
+    min_resources : int, default None
+        The number of training sequences in the first round. If None, it is chosen such that all training sequences
+        are used in the last round.
+    min_reservoir_size : int, default None
+        If not None, the reservoir size of all candidates grows with the number of training sequences, starting with
+        at least min_reservoir_size neurons. The last round always uses the full reservoir size.
+    validation_fraction : float, default 0.2
+        The fraction of the sequences that are held out for the validation.
+    refit : bool, default True
+        If True, the best candidate is fitted on all sequences and stored in best_estimator_.
+    n_jobs : int, default None
+        The number of worker processes. None means 1, -1 means all processors.
+    random_state : int, RandomState instance, default None
+        Determines the split into training and validation sequences.
+
+    Attributes
+    ----------
+    cv_results_ : dict of lists
+        For each evaluated candidate and round, the 'params', the round 'iter', the number of training sequences
+        'n_resources', the 'reservoir_size' and the 'mean_test_score'.
+    best_params_ : dict
+        The parameters of the best candidate of the last round, including the best beta.
+    best_score_ : float
+        The validation score of the best candidate.
+    best_index_ : int
+        The index of the best candidate in cv_results_.
+    best_estimator_ : estimator
+        The best candidate fitted on all sequences, if refit is True.
+    n_candidates_ : list of int
+        The number of candidates in each round.
+    n_resources_ : list of int
+        The number of training sequences in each round.
+    """
+    def __init__(self, estimator, param_grid, betas=None, factor: int = 3, min_resources: int = None,
+                 min_reservoir_size: int = None, validation_fraction: float = .2, refit: bool = True,
+                 n_jobs: int = None, random_state=None):
+        self.estimator = estimator
+        self.param_grid = param_grid
+        self.betas = betas
+        self.factor = factor
+        self.min_resources = min_resources
+        self.min_reservoir_size = min_reservoir_size
+        self.validation_fraction = validation_fraction
+        self.refit = refit
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+
+    def fit(self, X, y):
+        """
+        Run the search on the sequences X with the targets y.
+
+        Parameters
+        ----------
+        X : list of ndarray of shape (n_samples, n_features)
+            The input sequences
+        y : list of ndarray of shape (n_samples, ) or (n_samples, n_outputs)
+            The target values of each sequence (class labels in classification, real numbers in regression).
+
+        Returns
+        -------
+        self : returns the fitted search.
+        """
+        candidates = list(ParameterGrid(self.param_grid))
+        self._validate_hyperparameters(candidates)
+        X, y = self._validate_input(X, y)
+        rs = check_random_state(self.random_state)
+        indices = rs.permutation(len(X))
+        n_validation = max(1, int(round(self.validation_fraction * len(X))))
+        X_train, y_train = [X[i] for i in indices[n_validation:]], [y[i] for i in indices[n_validation:]]
+        X_val, y_val = [X[i] for i in indices[:n_validation]], [y[i] for i in indices[:n_validation]]
+        n_resources = self._resource_schedule(len(candidates), len(X_train))
+
+        self.cv_results_ = {'params': [], 'iter': [], 'n_resources': [], 'reservoir_size': [], 'mean_test_score': []}
+        self.n_candidates_ = []
+        self.n_resources_ = []
+        groups = _group_candidates(candidates)
+        working_dir = tempfile.mkdtemp(prefix='successive_halving_', dir=self.estimator.working_dir)
+        try:
+            self._run_rounds(groups, n_resources, X_train, y_train, X_val, y_val, working_dir)
+        finally:
+            shutil.rmtree(working_dir, ignore_errors=True)
+
+        first = len(self.cv_results_['params']) - self.n_candidates_[-1]
+        self.best_index_ = first + int(np.argmax(self.cv_results_['mean_test_score'][first:]))
+        self.best_params_ = self.cv_results_['params'][self.best_index_]
+        self.best_score_ = self.cv_results_['mean_test_score'][self.best_index_]
+        if self.refit:
+            self.best_estimator_ = self._refit(X, y)
+        return self
+
+    def predict(self, X):
+        """
+        Predict with the best estimator.
+
+        Parameters
+        ----------
+        X : array-like, shape (n_samples, n_features)
+            The input data.
+
+        Returns
+        -------
+        y_pred : array-like, shape (n_samples,) or (n_samples, n_outputs)
+            The predicted values
+        """
+        check_is_fitted(self, ['best_estimator_'])
+        return self.best_estimator_.predict(X)
+
+    def score(self, X, y):
+        """
+        Return the score of the best estimator on the data X and y.
+
+        Parameters
+        ----------
+        X : array-like, shape (n_samples, n_features)
+            The input data.
+        y : array-like, shape (n_samples, ) or (n_samples, n_outputs)
+            The target values.
+
+        Returns
+        -------
+        score : float
+        """
+        check_is_fitted(self, ['best_estimator_'])
+        return self.best_estimator_.score(X, y)
+
+    @property
+    def _classifier(self):
+        return is_classifier(self.estimator)
+
+    def _validate_hyperparameters(self, candidates):
+        """
+        Validate the hyperparameters.
+
+        Parameters
+        ----------
+        candidates : list of dict
+            The parameter settings that are searched
+
+        Returns
+        -------
+
+        """
+        if not isinstance(self.estimator, BaseEchoStateNetwork):
+            raise ValueError("estimator must be an Echo State Network, got %s." % type(self.estimator).__name__)
+        if self.estimator.solver not in _GRAM_SOLVERS and \
+                any(candidate.get('solver', self.estimator.solver) not in _GRAM_SOLVERS for candidate in candidates):
+            raise ValueError("The solver must be one of %s." % ", ".join(_GRAM_SOLVERS))
+        if self.betas is not None and any('beta' in candidate for candidate in candidates):
+            raise ValueError("beta must not be part of param_grid if betas is given.")
+        if self.factor < 2:
+            raise ValueError("factor must be >= 2, got %s." % self.factor)
+        if self.min_resources is not None and self.min_resources < 1:
+            raise ValueError("min_resources must be >= 1, got %s." % self.min_resources)
+        if self.min_reservoir_size is not None and self.min_reservoir_size < 1:
+            raise ValueError("min_reservoir_size must be >= 1, got %s." % self.min_reservoir_size)
+        if not 0. < self.validation_fraction < 1.:
+            raise ValueError("validation_fraction must be in (0, 1), got %s." % self.validation_fraction)
+
+    def _validate_input(self, X, y):
+        """
+        Ensure that the sequences are two-dimensional and transform the targets of classifiers to one output per class.
+
+        Parameters
+        ----------
+        X : list of ndarray of shape (n_samples, n_features)
+            The input sequences
+        y : list of ndarray of shape (n_samples, ) or (n_samples, n_outputs)
+            The target values of each sequence
+
+        Returns
+        -------
+        X : list of ndarray of shape (n_samples, n_features)
+            The input sequences
+        y : list of ndarray of shape (n_samples, n_outputs)
+            The target values of each sequence
+        """
+        if len(X) != len(y):
+            raise ValueError("X and y must contain the same number of sequences, got %s and %s." % (len(X), len(y)))
+        if len(X) < 2:
+            raise ValueError("At least two sequences are required, got %s." % len(X))
+        X = [np.asarray(sequence, dtype=float) for sequence in X]
+        if self._classifier:
+            from sklearn.preprocessing import LabelBinarizer
+            self._label_binarizer = LabelBinarizer().fit(np.concatenate([np.ravel(sequence) for sequence in y]))
+            self.classes_ = self._label_binarizer.classes_
+            y = [self._label_binarizer.transform(np.ravel(sequence)).astype(float) for sequence in y]
+        else:
+            y = [np.asarray(sequence, dtype=float) for sequence in y]
+        y = [sequence.reshape((len(sequence), -1)) for sequence in y]
+        return X, y
+
+    def _run_rounds(self, groups, n_resources, X_train, y_train, X_val, y_val, working_dir):
+        """
+        Evaluate the groups of candidates in successive rounds and drop the worst candidates after each round.
+
+        Parameters
+        ----------
+        groups : list of dict
+            The groups of candidates, see _group_candidates
+        n_resources : list of int
+            The number of training sequences in each round
+        X_train, y_train : list of ndarray
+            The training sequences and their targets
+        X_val, y_val : list of ndarray
+            The validation sequences and their targets
+        working_dir : str
+            The directory for the memory mapped xTx and xTy of all candidates
+
+        Returns
+        -------
+
+        """
+        from joblib import Parallel, delayed
+        consumed = 0
+        for iteration, resources in enumerate(n_resources):
+            fraction = float(self.factor) ** (iteration - len(n_resources) + 1)
+            jobs = []
+            for group in groups:
+                reservoir_size = self._reservoir_size(group['params'], fraction)
+                if group['estimator'] is None or group['estimator'].reservoir_size != reservoir_size:
+                    if group['estimator'] is not None:
+                        _remove_statistics(group['estimator'].setting_estimators_)
+                    group['estimator'] = clone(self.estimator).set_params(
+                        **dict(group['params'], reservoir_size=reservoir_size, working_dir=working_dir))
+                    start = 0
+                else:
+                    start = consumed
+                jobs.append((group['estimator'], group['settings'], start))
+            results = Parallel(n_jobs=self.n_jobs)(
+                delayed(_fit_and_score_group)(estimator, settings, X_train[start:resources], y_train[start:resources],
+                                              X_val, y_val, self.betas, self._classifier)
+                for estimator, settings, start in jobs)
+            consumed = resources
+
+            scores = []
+            for group, (estimator, group_scores, group_betas) in zip(groups, results):
+                group['estimator'] = estimator
+                group['scores'] = group_scores
+                group['betas'] = group_betas
+                for setting, score, beta in zip(group['settings'], group_scores, group_betas):
+                    params = dict(group['params'], **setting)
+                    if self.betas is not None:
+                        params['beta'] = beta
+                    self.cv_results_['params'].append(params)
+                    self.cv_results_['iter'].append(iteration)
+                    self.cv_results_['n_resources'].append(resources)
+                    self.cv_results_['reservoir_size'].append(estimator.reservoir_size)
+                    self.cv_results_['mean_test_score'].append(score)
+                    scores.append(score)
+            self.n_candidates_.append(len(scores))
+            self.n_resources_.append(resources)
+            if iteration < len(n_resources) - 1:
+                n_keep = max(1, int(np.ceil(len(scores) / self.factor)))
+                threshold = np.sort(scores)[::-1][n_keep - 1]
+                groups = _prune_groups(groups, threshold, n_keep)
+
+    def _resource_schedule(self, n_candidates, n_sequences):
+        """
+        Compute the number of training sequences in each round.
+
+        Parameters
+        ----------
+        n_candidates : int
+            The number of candidates in the first round
+        n_sequences : int
+            The number of training sequences
+
+        Returns
+        -------
+        n_resources : list of int
+        """
+        n_rounds = 1 + int(np.floor(np.log(n_candidates) / np.log(self.factor)))
+        if self.min_resources is None:
+            min_resources = max(1, n_sequences // self.factor ** (n_rounds - 1))
+        else:
+            min_resources = min(self.min_resources, n_sequences)
+        n_rounds = min(n_rounds, 1 + int(np.floor(np.log(n_sequences / min_resources) / np.log(self.factor))))
+        return [min(n_sequences, min_resources * self.factor ** iteration) for iteration in range(n_rounds)]
+
+    def _reservoir_size(self, params, fraction):
+        """
+        The reservoir size of a group of candidates in a round that uses the given fraction of the resources of the
+        last round.
+
+        Parameters
+        ----------
+        params : dict
+            The parameters of the group
+        fraction : float
+
+        Returns
+        -------
+        reservoir_size : int
+        """
+        reservoir_size = params.get('reservoir_size', self.estimator.reservoir_size)
+        if self.min_reservoir_size is None:
+            return reservoir_size
+        return min(reservoir_size, max(self.min_reservoir_size, int(round(fraction * reservoir_size))))
+
+    def _refit(self, X, y):
+        """
+        Fit the best candidate on all sequences.
+
+        Parameters
+        ----------
+        X : list of ndarray of shape (n_samples, n_features)
+            The input sequences
+        y : list of ndarray of shape (n_samples, n_outputs)
+            The target values of each sequence
+
+        Returns
+        -------
+        estimator : estimator
+            The fitted best candidate
+        """
+        setting = {key: value for key, value in self.best_params_.items() if key in _SETTING_PARAMETERS}
+        params = {key: value for key, value in self.best_params_.items() if key not in _SETTING_PARAMETERS}
+        group_estimator = clone(self.estimator).set_params(**params)
+        for sequence, target in zip(X, y):
+            group_estimator.partial_fit_settings(sequence, target, [setting], update_output_weights=False)
+        estimator = group_estimator.setting_estimators_[0]
+        estimator.finalize()
+        estimator.setting_estimators_ = None
+        if self._classifier:
+            estimator._label_binarizer = self._label_binarizer
+            estimator.classes_ = self.classes_
+        return estimator
+
+
+def _group_candidates(candidates):
+    """Group the candidates by all parameters that change the weights of the model."""
+    groups = []
+    for candidate in candidates:
+        params = {key: value for key, value in candidate.items() if key not in _SETTING_PARAMETERS}
+        setting = {key: value for key, value in candidate.items() if key in _SETTING_PARAMETERS}
+        group = next((group for group in groups if group['params'] == params), None)
+        if group is None:
+            group = {'params': params, 'settings': [], 'estimator': None}
+            groups.append(group)
+        group['settings'].append(setting)
+    return groups
+
+
+def _prune_groups(groups, threshold, n_keep):
+    """Keep the n_keep candidates with a score of at least threshold. The groups keep their collected statistics."""
+    pruned = []
+    for group in groups:
+        keep = []
+        for n, score in enumerate(group['scores']):
+            if score >= threshold and n_keep > 0:
+                keep.append(n)
+                n_keep -= 1
+        estimator = group['estimator']
+        _remove_statistics([setting_estimator for n, setting_estimator in enumerate(estimator.setting_estimators_)
+                            if n not in keep])
+        if not keep:
+            continue
+        estimator.setting_estimators_ = [estimator.setting_estimators_[n] for n in keep]
+        estimator._settings = [estimator._settings[n] for n in keep]
+        pruned.append({'params': group['params'], 'settings': [group['settings'][n] for n in keep],
+                       'estimator': estimator})
+    return pruned
+
+
+def _fit_and_score_group(estimator, settings, X_train, y_train, X_val, y_val, betas, classifier):
+    """Pass the training sequences through the reservoir for all settings of one group and score the readouts."""
+    _open_statistics(getattr(estimator, 'setting_estimators_', None))
+    for X, y in zip(X_train, y_train):
+        estimator.partial_fit_settings(X, y, settings, update_output_weights=False)
+    scores = _readout_scores(estimator, X_val, y_val, betas, classifier)
+    best = np.argmax(scores, axis=1)
+    if betas is None:
+        best_betas = [setting_estimator.beta for setting_estimator in estimator.setting_estimators_]
+    else:
+        best_betas = [betas[n] for n in best]
+    _store_statistics(estimator.setting_estimators_)
+    return estimator, scores[np.arange(len(best)), best], best_betas
+
+
+def _store_statistics(setting_estimators):
+    """Replace the memory mapped xTx and xTy of the estimators by their file names, so that only these are pickled."""
+    for setting_estimator in setting_estimators or []:
+        for name in ['_xTx', '_xTy']:
+            matrix = getattr(setting_estimator, name)
+            if isinstance(matrix, np.memmap):
+                matrix.flush()
+                setattr(setting_estimator, name, _StoredMatrix(matrix.filename))
+
+
+def _open_statistics(setting_estimators):
+    """Revert _store_statistics."""
+    for setting_estimator in setting_estimators or []:
+        for name in ['_xTx', '_xTy']:
+            matrix = getattr(setting_estimator, name)
+            if isinstance(matrix, _StoredMatrix):
+                setattr(setting_estimator, name, np.load(matrix.filename, mmap_mode='r+'))
+
+
+def _remove_statistics(setting_estimators):
+    """Remove the files of the stored xTx and xTy of the estimators."""
+    for setting_estimator in setting_estimators or []:
+        for name in ['_xTx', '_xTy']:
+            matrix = getattr(setting_estimator, name)
+            if isinstance(matrix, _StoredMatrix):
+                os.remove(matrix.filename)
+            setattr(setting_estimator, name, None)
+
+
+def _readout_scores(estimator, X_val, y_val, betas, classifier):
+    """
+    Score the readouts of all settings of estimator for all values of beta in closed form. With the eigendecomposition
+    xTx = V diag(w) V^T, the output weights are V diag(1 / (w + lmda)) V^T xTy for every regularization lmda.
+
+    Parameters
+    ----------
+    estimator : BaseEchoStateNetwork
+        A model that has collected xTx and xTy with partial_fit_settings
+    X_val : list of ndarray of shape (n_samples, n_features)
+        The validation sequences
+    y_val : list of ndarray of shape (n_samples, n_outputs)
+        The target values of the validation sequences
+    betas : list of float or None
+        The regularization parameters. If None, the beta of each setting is used.
+    classifier : bool
+        If True, the accuracy is computed, otherwise the negative mean squared error.
+
+    Returns
+    -------
+    scores : ndarray of shape (n_settings, n_betas)
+    """
+    readouts = []
+    for setting_estimator in estimator.setting_estimators_:
+        w, V = np.linalg.eigh(setting_estimator._xTx)
+        projected_xTy = np.dot(V.T, setting_estimator._xTy)
+        if setting_estimator.solver == 'ridge':
+            lmdas = np.asarray([setting_estimator.beta] if betas is None else betas) ** 2 * \
+                setting_estimator._n_samples
+        else:
+            lmdas = np.zeros(1 if betas is None else len(betas))
+        inverse = np.zeros(shape=(len(lmdas), len(w)))
+        eigenvalues = w + lmdas[:, None]
+        # pseudo-inverse of the singular part
+        np.divide(1., eigenvalues, out=inverse, where=eigenvalues > np.finfo(float).eps * max(w.max(), 1.))
+        readouts.append((V, projected_xTy, inverse))
+
+    errors = np.zeros(shape=(len(readouts), len(readouts[0][2])))
+    n_samples = 0
+    for X, y in zip(X_val, y_val):
+        reservoir_states = estimator._pass_through_reservoir_settings(X)[estimator.wash_out:, :, :]
+        y = y[estimator.wash_out:, :]
+        n_samples += len(y)
+        for n, (V, projected_xTy, inverse) in enumerate(readouts):
+            projected_states = np.dot(reservoir_states[:, :, n], V)
+            for m, inverse_eigenvalues in enumerate(inverse):
+                y_pred = np.dot(projected_states, inverse_eigenvalues[:, None] * projected_xTy)
+                if not classifier:
+                    errors[n, m] += np.sum((y_pred - y) ** 2) / y.shape[1]
+                elif y.shape[1] == 1:
+                    errors[n, m] += np.sum((y_pred > .5) != (y > .5))
+                else:
+                    errors[n, m] += np.sum(np.argmax(y_pred, axis=1) != np.argmax(y, axis=1))
+    if classifier:
+        return 1. - errors / max(n_samples, 1)
+    return -errors / max(n_samples, 1)
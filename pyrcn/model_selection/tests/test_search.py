@@ -0,0 +1,79 @@
+"""
+Testing for the hyperparameter search (pyrcn.model_selection)
+"""
+import numpy as np
+
+import pytest
+
+from pyrcn.echo_state_network import ESNRegressor, ESNClassifier
+from pyrcn.model_selection import SuccessiveHalvingSearch
+from pyrcn.model_selection._search import _readout_scores
+
+
+def _sequences(n_sequences, rs):
+    X = [rs.uniform(low=-1., high=1., size=(50, 2)) for _ in range(n_sequences)]
+    y = [np.sin(np.cumsum(sequence[:, 0])) for sequence in X]
+    return X, y
+
+
+def test_successive_halving_search(tmp_path):
+    print('\ntest_successive_halving_search():')
+    rs = np.random.RandomState(42)
+    X, y = _sequences(40, rs)
+    param_grid = {'input_scaling': [.1, .5, 1.], 'spectral_radius': [.0, .5, .9], 'k_res': [5, 10]}
+    search = SuccessiveHalvingSearch(ESNRegressor(k_in=1, reservoir_size=50, wash_out=5, random_state=42),
+                                     param_grid, betas=[1e-4, 1e-2, 1.], min_reservoir_size=20, random_state=42)
+    search.fit(X, y)
+    assert search.n_candidates_ == [18, 6, 2]
+    assert search.n_resources_ == [3, 9, 27]
+    assert search.cv_results_['reservoir_size'][0] == 20
+    assert search.cv_results_['reservoir_size'][-1] == 50
+    assert search.best_params_['beta'] in [1e-4, 1e-2, 1.]
+    assert search.best_score_ == max(search.cv_results_['mean_test_score'][-2:])
+    assert search.predict(X[0]).shape == (50, )
+
+    # xTx and xTy stay in memory mapped files between the rounds in the worker processes
+    search_parallel = SuccessiveHalvingSearch(
+        ESNRegressor(k_in=1, reservoir_size=50, wash_out=5, working_dir=str(tmp_path), random_state=42), param_grid,
+        betas=[1e-4, 1e-2, 1.], min_reservoir_size=20, n_jobs=2, random_state=42).fit(X, y)
+    np.testing.assert_allclose(search_parallel.cv_results_['mean_test_score'], search.cv_results_['mean_test_score'],
+                               rtol=1e-6)
+    assert len(list(tmp_path.iterdir())) == 0
+
+    with pytest.raises(ValueError):
+        SuccessiveHalvingSearch(ESNRegressor(), {'beta': [1e-2]}, betas=[1e-2]).fit(X, y)
+    with pytest.raises(ValueError):
+        SuccessiveHalvingSearch(ESNRegressor(solver='cg'), param_grid).fit(X, y)
+
+
+def test_successive_halving_search_classifier():
+    print('\ntest_successive_halving_search_classifier():')
+    rs = np.random.RandomState(42)
+    X, y = _sequences(20, rs)
+    y = [(target > 0).astype(int) + 2 * (sequence[:, 1] > 0) for sequence, target in zip(X, y)]
+    search = SuccessiveHalvingSearch(ESNClassifier(k_in=1, reservoir_size=50, random_state=42),
+                                     {'input_scaling': [.1, 1.], 'leakage': [.5, 1.]}, factor=2, random_state=42)
+    search.fit(X, y)
+    assert set(search.predict(X[0])) <= {0, 1, 2, 3}
+    assert 0. <= search.best_score_ <= 1.
+
+
+def test_readout_scores():
+    print('\ntest_readout_scores():')
+    rs = np.random.RandomState(42)
+    X, y = _sequences(4, rs)
+    y = [target.reshape(-1, 1) for target in y]
+    settings = [{'input_scaling': .5}, {'spectral_radius': .9}]
+    esn = ESNRegressor(k_in=1, reservoir_size=50, wash_out=5, random_state=42)
+    for sequence, target in zip(X[:3], y[:3]):
+        esn.partial_fit_settings(sequence, target, settings, update_output_weights=False)
+    scores = _readout_scores(esn, X[3:], y[3:], [1e-3, 1e-1], False)
+    for n, setting in enumerate(settings):
+        for m, beta in enumerate([1e-3, 1e-1]):
+            reference = ESNRegressor(k_in=1, reservoir_size=50, wash_out=5, beta=beta, random_state=42)
+            reference.set_params(**setting)
+            for sequence, target in zip(X[:3], y[:3]):
+                reference.partial_fit(sequence, target, update_output_weights=False)
+            reference.finalize()
+            y_pred = reference.predict(X[3])[5:]
+            np.testing.assert_allclose(scores[n, m], -np.mean((y_pred - y[3][5:, 0]) ** 2), rtol=1e-6)
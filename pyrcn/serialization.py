@@ -0,0 +1,138 @@
+"""
+The :mod:`pyrcn.serialization` module stores fitted models in a compact format for fast loading.
+"""
+
+# Author: Michael Schindler <michael.schindler@maschindler.de>
+# License: BSD 3 clause
+
+import os
+import json
+import shutil
+import importlib
+
+import scipy
+import numpy as np
+
+from sklearn.base import BaseEstimator
+
+_FORMAT_VERSION = 1
+
+# Training statistics and buffers that are not required for prediction
+_TRAINING_ATTRIBUTES = {
+    '_xTx', '_xTy', '_K', '_P', '_state_chunks', '_activations_mean', '_activations_var', 'activations_mean',
+    'activations_var', 'reservoir_state', '_random_state', '_reservoir_eigenbasis', '_reservoir_matrix',
+    '_sequence_statistics'}
+
+
+def save_model(estimator, path):
+    """Saves a fitted model, e.g. an ESNRegressor, ESNClassifier or ELMRegressor, to the directory path.
+
+    Every array of the model, including the components of sparse weight matrices, is stored as separate .npy file,
+    the remaining attributes are stored in a JSON file. Training statistics, such as xTx and xTy, are not stored.
+    Random number generators are stored as None.
+
+    Parameters
+    ----------
+    estimator : BaseEstimator
+        The fitted model.
+    path : str
+        The directory to store the model in. An existing model in path is replaced.
+
+    Returns
+    -------
+
+    """
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.makedirs(path)
+    model = {'version': _FORMAT_VERSION, 'model': _encode(estimator, path, 'model')}
+    with open(os.path.join(path, 'model.json'), 'w') as f:
+        json.dump(model, f)
+
+
+def load_model(path, mmap_mode='r'):
+    """Loads a model that has been saved with :func:`save_model`.
+
+    The arrays are memory mapped by default. The model can then be loaded in a few milliseconds, and several processes
+    that load the same model share one copy of the arrays in the page cache.
+
+    Parameters
+    ----------
+    path : str
+        The directory of the model.
+    mmap_mode : {None, 'r', 'r+', 'c'}, default='r'
+        The memory map mode passed to :func:`numpy.load`. If None, the arrays are loaded into memory.
+
+    Returns
+    -------
+    estimator : BaseEstimator
+        The loaded model.
+    """
+    with open(os.path.join(path, 'model.json'), 'r') as f:
+        model = json.load(f)
+    if model['version'] != _FORMAT_VERSION:
+        raise ValueError("Unsupported model format version %s." % model['version'])
+    return _decode(model['model'], path, mmap_mode)
+
+
+def _encode(value, path, name):
+    """Converts value into a JSON serializable node. Arrays are written to path with file names derived from name."""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.random.RandomState):
+        return None
+    if isinstance(value, np.ndarray) and value.dtype != object:
+        np.save(os.path.join(path, name + '.npy'), value)
+        return {'__array__': name + '.npy'}
+    if isinstance(value, np.ndarray):
+        return {'__objects__': _encode(value.tolist(), path, name)}
+    if scipy.sparse.issparse(value):
+        value = value.tocsr() if value.format not in ('csr', 'csc') else value
+        return {'__sparse__': value.format,
+                'shape': list(value.shape),
+                'data': _encode(value.data, path, name + '.data'),
+                'indices': _encode(value.indices, path, name + '.indices'),
+                'indptr': _encode(value.indptr, path, name + '.indptr')}
+    if isinstance(value, slice):
+        return {'__slice__': [value.start, value.stop, value.step]}
+    if isinstance(value, tuple):
+        return {'__tuple__': [_encode(v, path, '%s.%d' % (name, n)) for n, v in enumerate(value)]}
+    if isinstance(value, list):
+        return [_encode(v, path, '%s.%d' % (name, n)) for n, v in enumerate(value)]
+    if isinstance(value, dict) and all(isinstance(key, str) for key in value):
+        return {'__dict__': {key: _encode(v, path, '%s.%s' % (name, key)) for key, v in value.items()}}
+    if isinstance(value, BaseEstimator):
+        return {'__estimator__': '%s:%s' % (type(value).__module__, type(value).__qualname__),
+                'attributes': {key: None if key in _TRAINING_ATTRIBUTES else _encode(v, path, '%s.%s' % (name, key))
+                               for key, v in vars(value).items()}}
+    raise TypeError("Cannot save %s of type %s." % (name, type(value)))
+
+
+def _decode(node, path, mmap_mode):
+    """Reverts _encode."""
+    if isinstance(node, list):
+        return [_decode(v, path, mmap_mode) for v in node]
+    if not isinstance(node, dict):
+        return node
+    if '__array__' in node:
+        return np.load(os.path.join(path, node['__array__']), mmap_mode=mmap_mode)
+    if '__objects__' in node:
+        return np.array(_decode(node['__objects__'], path, mmap_mode), dtype=object)
+    if '__sparse__' in node:
+        matrix_type = scipy.sparse.csc_matrix if node['__sparse__'] == 'csc' else scipy.sparse.csr_matrix
+        return matrix_type((_decode(node['data'], path, mmap_mode),
+                            _decode(node['indices'], path, mmap_mode),
+                            _decode(node['indptr'], path, mmap_mode)), shape=tuple(node['shape']), copy=False)
+    if '__slice__' in node:
+        return slice(*node['__slice__'])
+    if '__tuple__' in node:
+        return tuple(_decode(v, path, mmap_mode) for v in node['__tuple__'])
+    if '__dict__' in node:
+        return {key: _decode(v, path, mmap_mode) for key, v in node['__dict__'].items()}
+    module_name, class_name = node['__estimator__'].split(':')
+    estimator_class = getattr(importlib.import_module(module_name), class_name)
+    estimator = estimator_class.__new__(estimator_class)
+    estimator.__dict__.update({key: _decode(v, path, mmap_mode) for key, v in node['attributes'].items()})
+    return estimator
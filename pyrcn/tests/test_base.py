@@ -2,13 +2,15 @@
 Testing for Extreme Learning Machine module (pyrcn.extreme_learning_machine)
 """
 import scipy
+import scipy.linalg
 import numpy as np
 
 import pytest
 
 from sklearn.utils.extmath import safe_sparse_dot
 
-from pyrcn.base import InputToNode
+from pyrcn import base
+from pyrcn.base import InputToNode, InputToNodeUnion, FastfoodInputToNode, FixedFanInMatrix
 
 
 def test_input_to_node_dense():
@@ -43,3 +45,112 @@ def test_transform_bounded_relu():
     print('tests bounded relu')
     print(y)
     assert y.shape == (10, 5)
+
+
+def test_input_to_node_union():
+    print('\ntest_input_to_node_union():')
+    rs = np.random.RandomState(42)
+    X = rs.uniform(low=-1., high=1., size=(10, 3))
+    i2n_tanh = InputToNode(hidden_layer_size=5, activation='tanh', random_state=42)
+    i2n_relu = InputToNode(hidden_layer_size=4, sparsity=.5, activation='relu', random_state=43)
+    union = InputToNodeUnion(
+        transformer_list=[('tanh', i2n_tanh), ('dropped', 'drop'), ('relu', i2n_relu)],
+        n_jobs=2,
+        transformer_weights={'relu': 2.})
+    y = union.fit_transform(X)
+    y_expected = np.hstack((i2n_tanh.fit(X).transform(X), 2. * i2n_relu.fit(X).transform(X)))
+    assert y.shape == (10, 9)
+    np.testing.assert_allclose(y, y_expected)
+
+
+def test_transform_out():
+    print('\ntest_transform_out():')
+    rs = np.random.RandomState(42)
+    i2n = InputToNode(hidden_layer_size=5, sparsity=1., activation='identity', input_scaling=.5, bias_scaling=2.,
+                      random_state=42)
+    X = rs.uniform(low=-1., high=1., size=(10, 3))
+    i2n.fit(X)
+    out = np.zeros(shape=(10, 7))
+    y = i2n.transform(X, out=out[:, 1:6])
+    assert np.shares_memory(y, out)
+    assert not hasattr(i2n, '_hidden_layer_state')
+    np.testing.assert_allclose(out[:, 1:6], np.dot(X, i2n._input_weights) + i2n._bias)
+    np.testing.assert_array_equal(out[:, [0, 6]], 0.)
+
+
+def test_fastfood_input_to_node():
+    print('\ntest_fastfood_input_to_node():')
+    rs = np.random.RandomState(42)
+    i2n = FastfoodInputToNode(hidden_layer_size=20, activation='identity', input_scaling=1., bias_scaling=0.,
+                              random_state=42)
+    X = rs.uniform(low=-1., high=1., size=(10, 3))
+    i2n.fit(X)
+    assert i2n._gaussian.shape == (5, 4)
+    # the structured projection is linear, its dense equivalent is obtained by transforming the unit vectors
+    input_weights = i2n.transform(np.eye(3))
+    assert input_weights.shape == (3, 20)
+    np.testing.assert_allclose(i2n.transform(X), np.dot(X, input_weights))
+    hadamard = scipy.linalg.hadamard(4)
+    block = np.diag(i2n._scaling[0]) @ hadamard @ np.diag(i2n._gaussian[0]) @ np.eye(4)[i2n._permutation[0]] \
+        @ hadamard @ np.diag(i2n._signs[0])
+    np.testing.assert_allclose(input_weights[:, :4], block[:, :3].T)
+    out = np.zeros(shape=(10, 21))
+    i2n.set_params(activation='tanh')
+    i2n.transform(X, out=out[:, 1:])
+    np.testing.assert_allclose(out[:, 1:], np.tanh(np.dot(X, input_weights)))
+    with pytest.raises(ValueError):
+        i2n.transform(X[:, :2])
+    with pytest.raises(ValueError):
+        i2n.transform(np.ones((10, 5)))
+
+
+def test_fixed_fan_in_matrix():
+    print('\ntest_fixed_fan_in_matrix():')
+    rs = np.random.RandomState(42)
+    matrix = scipy.sparse.random(20, 30, density=.2, format='csc', random_state=rs)
+    fixed_fan_in = FixedFanInMatrix.from_sparse(matrix, scale=2.)
+    assert fixed_fan_in.indices.shape == (20, np.diff(matrix.tocsr().indptr).max())
+    np.testing.assert_allclose(fixed_fan_in.toarray(), 2. * matrix.toarray())
+    x = rs.randn(30)
+    np.testing.assert_allclose(fixed_fan_in.dot(x), 2. * matrix.dot(x))
+    X = rs.randn(30, 4)
+    np.testing.assert_allclose(fixed_fan_in.dot(X), 2. * matrix.dot(X))
+
+
+def test_select_matrix_format(monkeypatch):
+    print('\ntest_select_matrix_format():')
+    rs = np.random.RandomState(42)
+    matrix = scipy.sparse.random(50, 50, density=.1, format='csc', random_state=rs)
+    x = rs.randn(50)
+    for matrix_format in base.MATRIX_FORMATS:
+        np.testing.assert_allclose(base.convert_matrix(matrix, matrix_format, scale=.5).dot(x), .5 * matrix.dot(x))
+    with pytest.raises(ValueError):
+        base.convert_matrix(matrix, 'coo')
+
+    monkeypatch.setattr(base, '_MATRIX_FORMAT_CACHE', {})
+    matrix_format = base.select_matrix_format(matrix)
+    assert matrix_format in base.MATRIX_FORMATS
+    assert base._MATRIX_FORMAT_CACHE == {((50, 50), matrix.nnz, 1): matrix_format}
+    # the benchmark is not repeated for a matrix of the same structure
+    base._MATRIX_FORMAT_CACHE[((50, 50), matrix.nnz, 1)] = 'csc'
+    assert base.select_matrix_format(scipy.sparse.random(50, 50, density=.1, random_state=rs)) == 'csc'
+    monkeypatch.setattr(base, '_DENSE_MAX_ELEMENTS', 100)
+    assert base.select_matrix_format(matrix, n_vectors=3) != 'dense'
+
+
+def test_structured_matrices():
+    print('\ntest_structured_matrices():')
+    rs = np.random.RandomState(42)
+    matrices = {'cycle': base.CycleMatrix(rs.randn(6)),
+                'delay_line': base.DelayLineMatrix(rs.randn(5), rs.randn(5)),
+                'block_diagonal': base.BlockDiagonalMatrix(rs.randn(2, 3, 3))}
+    x = rs.randn(6)
+    X = rs.randn(6, 4)
+    for matrix_format, matrix in matrices.items():
+        dense = matrix.toarray()
+        np.testing.assert_allclose(matrix.dot(x), np.dot(dense, x))
+        np.testing.assert_allclose(matrix.dot(X), np.dot(dense, X))
+        converted = base.convert_matrix(scipy.sparse.csc_matrix(dense), matrix_format, scale=2., block_size=3)
+        np.testing.assert_allclose(converted.toarray(), 2. * dense)
+    with pytest.raises(ValueError):
+        base.BlockDiagonalMatrix.from_sparse(np.ones((6, 6)), block_size=3)
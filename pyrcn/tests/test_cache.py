@@ -0,0 +1,80 @@
+"""
+Testing for the reservoir state cache (pyrcn.cache)
+"""
+import os
+import time
+
+import scipy
+import numpy as np
+
+import pytest
+
+from pyrcn.cache import ReservoirStateCache
+from pyrcn.echo_state_network import ESNRegressor
+
+
+def test_state_cache_esn(tmp_path):
+    print('\ntest_state_cache_esn():')
+    rs = np.random.RandomState(42)
+    X = rs.uniform(low=-1., high=1., size=(200, 2))
+    y = rs.uniform(low=-1., high=1., size=(200, 2))
+    kwargs = dict(k_in=1, input_scaling=.5, spectral_radius=.9, reservoir_size=50, k_res=5, beta=1e-2,
+                  random_state=42)
+    esn = ESNRegressor(**kwargs).fit(X, y)
+    esn_cached = ESNRegressor(state_cache=str(tmp_path), **kwargs).fit(X, y)
+    assert len(os.listdir(str(tmp_path))) == 1
+    np.testing.assert_array_equal(esn_cached.predict(X), esn.predict(X))
+    assert isinstance(ReservoirStateCache(str(tmp_path)).load(os.listdir(str(tmp_path))[0][:-4]), np.memmap)
+    esn_cached.set_params(beta=1e-1).fit(X, y)
+    assert len(os.listdir(str(tmp_path))) == 1
+    np.testing.assert_allclose(esn_cached.predict(X), esn.set_params(beta=1e-1).fit(X, y).predict(X))
+
+    # cached states are used instead of the recurrence
+    esn_cached._forward_pass = None
+    esn_cached.predict(X)
+    with pytest.raises(TypeError):
+        esn_cached.predict(X[:100])
+    with pytest.raises(TypeError):
+        esn_cached.set_params(spectral_radius=.8).predict(X)
+
+    esn_compact = ESNRegressor(state_cache=ReservoirStateCache(str(tmp_path / 'compact'), dtype='float32'), **kwargs)
+    esn_compact.fit(X, y)
+    np.testing.assert_allclose(esn_compact.predict(X), esn.set_params(beta=1e-2).fit(X, y).predict(X), atol=1e-4)
+    assert np.load(str(next((tmp_path / 'compact').iterdir()))).dtype == np.float32
+
+    # a cache hit does not report the probe error of an earlier time-chunked pass
+    esn_chunked = ESNRegressor(state_cache=str(tmp_path / 'chunked'), n_time_chunks=4, chunk_warm_up=20,
+                               **kwargs).fit(X, y)
+    assert esn_chunked.time_chunk_error_ is not None
+    esn_chunked.set_params(beta=1e-1).fit(X, y)
+    assert esn_chunked.time_chunk_error_ is None
+
+    # the cache is not part of a checkpoint
+    esn_cached.save_checkpoint(str(tmp_path / 'checkpoint'))
+    esn_resumed = ESNRegressor(state_cache=str(tmp_path / 'compact'))
+    esn_resumed.load_checkpoint(str(tmp_path / 'checkpoint'))
+    assert esn_resumed.state_cache == str(tmp_path / 'compact')
+    assert esn_resumed.spectral_radius == .8
+
+
+def test_state_cache_eviction(tmp_path):
+    print('\ntest_state_cache_eviction():')
+    cache = ReservoirStateCache(str(tmp_path), max_bytes=3 * 100 * 8 + 400)
+    # files that are not stored states, e.g. features, are neither counted nor removed
+    np.save(str(tmp_path / 'features.npy'), np.zeros((1000, 1)))
+    keys = [cache.key(np.full((100, 1), n), spectral_radius=.9) for n in range(4)]
+    assert len(set(keys)) == 4
+    assert cache.key(np.full((100, 1), 0), spectral_radius=.8) != keys[0]
+    assert cache.key(scipy.sparse.eye(10)) == cache.key(scipy.sparse.eye(10, format='csc'))
+    for n, key in enumerate(keys[:3]):
+        cache.store(key, np.full((100, 1), float(n)))
+        time.sleep(.01)
+    np.testing.assert_equal(cache.load(keys[0]), np.zeros((100, 1)))
+    time.sleep(.01)
+    cache.store(keys[3], np.full((100, 1), 3.))
+    assert cache.load(keys[1]) is None
+    assert all(cache.load(key) is not None for key in [keys[0], keys[2], keys[3]])
+    cache.store(cache.key(np.zeros(1000)), np.zeros((1000, 1)))
+    assert len(os.listdir(str(tmp_path))) == 4
+    cache.clear()
+    assert os.listdir(str(tmp_path)) == ['features.npy']
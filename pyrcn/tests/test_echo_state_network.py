@@ -0,0 +1,492 @@
+"""
+Testing for Echo State Network module (pyrcn.echo_state_network)
+"""
+import scipy
+import numpy as np
+
+import pytest
+
+from sklearn.model_selection import LeaveOneGroupOut
+
+from pyrcn import base, echo_state_network
+from pyrcn.echo_state_network import ESNRegressor, ESNClassifier
+
+
+def test_esn_regressor_dual():
+    print('\ntest_esn_regressor_dual():')
+    rs = np.random.RandomState(42)
+    X = rs.uniform(low=-1., high=1., size=(30, 2))
+    y = rs.uniform(low=-1., high=1., size=(30, 2))
+    esn = ESNRegressor(k_in=1, input_scaling=.5, spectral_radius=.9, reservoir_size=50, k_res=5, wash_out=5,
+                       beta=1e-2, random_state=42)
+    esn.fit(X, y)
+    assert esn._xTx is None
+
+    reservoir_state = esn._pass_through_reservoir(X)[5:, :]
+    assert np.all(np.isfinite(reservoir_state))
+    output_weights = np.linalg.solve(
+        np.dot(reservoir_state.T, reservoir_state) + 1e-4 * 25 * np.eye(reservoir_state.shape[1]),
+        np.dot(reservoir_state.T, y[5:, :]))
+    np.testing.assert_allclose(esn.output_weights_, output_weights, atol=1e-8)
+
+
+def test_esn_regressor_cg(tmp_path):
+    print('\ntest_esn_regressor_cg():')
+    rs = np.random.RandomState(42)
+    X = rs.uniform(low=-1., high=1., size=(200, 2))
+    y = rs.uniform(low=-1., high=1., size=(200, 2))
+    esn_ridge = ESNRegressor(k_in=1, input_scaling=.5, spectral_radius=.9, reservoir_size=50, k_res=5, wash_out=5,
+                             beta=1e-2, random_state=42)
+    esn_cg = ESNRegressor(k_in=1, input_scaling=.5, spectral_radius=.9, reservoir_size=50, k_res=5, wash_out=5,
+                          beta=1e-2, solver='cg', working_dir=str(tmp_path), random_state=42)
+    for X_sequence, y_sequence in zip(np.split(X, 4), np.split(y, 4)):
+        esn_ridge.partial_fit(X_sequence, y_sequence, update_output_weights=False)
+        esn_cg.partial_fit(X_sequence, y_sequence, update_output_weights=False)
+    assert esn_cg._xTx is None
+    assert len(list(tmp_path.iterdir())) == 4
+
+    esn_ridge.finalize()
+    esn_cg.compute_output_weights()
+    np.testing.assert_allclose(esn_cg.output_weights_, esn_ridge.output_weights_, atol=1e-4)
+
+    esn_cg.set_params(beta=1e-1).compute_output_weights()
+    esn_cg.finalize()
+    assert len(list(tmp_path.iterdir())) == 0
+    assert not np.allclose(esn_cg.output_weights_, esn_ridge.output_weights_, atol=1e-4)
+
+
+def test_esn_regressor_out_of_core(tmp_path, monkeypatch):
+    print('\ntest_esn_regressor_out_of_core():')
+    monkeypatch.setattr(echo_state_network, '_BLOCK_SIZE', 16)
+    rs = np.random.RandomState(42)
+    X = rs.uniform(low=-1., high=1., size=(200, 2))
+    y = rs.uniform(low=-1., high=1., size=(200, 2))
+    esn = ESNRegressor(k_in=1, input_scaling=.5, spectral_radius=.9, reservoir_size=50, k_res=5, wash_out=5,
+                       beta=1e-2, random_state=42)
+    esn_out_of_core = ESNRegressor(k_in=1, input_scaling=.5, spectral_radius=.9, reservoir_size=50, k_res=5,
+                                   wash_out=5, beta=1e-2, working_dir=str(tmp_path), random_state=42)
+    for X_sequence, y_sequence in zip(np.split(X, 4), np.split(y, 4)):
+        esn.partial_fit(X_sequence, y_sequence, update_output_weights=False)
+        esn_out_of_core.partial_fit(X_sequence, y_sequence, update_output_weights=False)
+    assert isinstance(esn_out_of_core._xTx, np.memmap)
+    assert np.all(np.isfinite(esn._xTx))
+    np.testing.assert_allclose(esn_out_of_core._xTx, esn._xTx)
+    np.testing.assert_allclose(esn_out_of_core._xTy, esn._xTy)
+
+    esn.finalize()
+    esn_out_of_core.finalize()
+    assert len(list(tmp_path.iterdir())) == 0
+    np.testing.assert_allclose(esn_out_of_core.output_weights_, esn.output_weights_, atol=1e-8)
+
+
+def test_esn_classifier_checkpoint(tmp_path):
+    print('\ntest_esn_classifier_checkpoint():')
+    rs = np.random.RandomState(42)
+    X = rs.uniform(low=-1., high=1., size=(200, 2))
+    y = (X[:, 0] > X[:, 1]).astype(int)
+    sequences = list(zip(np.split(X, 4), np.split(y, 4)))
+    esn = ESNClassifier(k_in=1, input_scaling=.5, spectral_radius=.9, reservoir_size=50, k_res=5, beta=1e-2,
+                        random_state=42)
+    for X_sequence, y_sequence in sequences:
+        esn.partial_fit(X_sequence, y_sequence, classes=[0, 1], update_output_weights=False)
+    esn.finalize()
+
+    for triangular in [False, True]:
+        checkpoint = str(tmp_path / 'checkpoint')
+        esn_interrupted = ESNClassifier(k_in=1, input_scaling=.5, spectral_radius=.9, reservoir_size=50, k_res=5,
+                                        beta=1e-2, random_state=42)
+        for n_consumed, (X_sequence, y_sequence) in enumerate(sequences[:2]):
+            esn_interrupted.partial_fit(X_sequence, y_sequence, classes=[0, 1], update_output_weights=False)
+            esn_interrupted.save_checkpoint(checkpoint, consumed=list(range(n_consumed + 1)), triangular=triangular)
+
+        esn_resumed = ESNClassifier()
+        consumed = esn_resumed.load_checkpoint(checkpoint)
+        assert consumed == [0, 1]
+        assert esn_resumed.reservoir_size == 50
+        for X_sequence, y_sequence in sequences[len(consumed):]:
+            esn_resumed.partial_fit(X_sequence, y_sequence, classes=[0, 1], update_output_weights=False)
+        esn_resumed.finalize()
+        np.testing.assert_allclose(esn_resumed.output_weights_, esn.output_weights_)
+        np.testing.assert_array_equal(esn_resumed.predict(X), esn.predict(X))
+
+    # loading into a model that is being trained replaces its memory mapped matrices
+    working_dir = tmp_path / 'working_dir'
+    working_dir.mkdir()
+    esn = ESNClassifier(k_in=1, input_scaling=.5, spectral_radius=.9, reservoir_size=50, k_res=5, beta=1e-2,
+                        working_dir=str(working_dir), random_state=42)
+    esn.partial_fit(*sequences[0], classes=[0, 1], update_output_weights=False)
+    esn.save_checkpoint(str(tmp_path / 'checkpoint'))
+    esn.load_checkpoint(str(tmp_path / 'checkpoint'))
+    assert len(list(working_dir.iterdir())) == 2
+    esn.finalize()
+    assert len(list(working_dir.iterdir())) == 0
+
+
+def test_export_inference_model():
+    print('\ntest_export_inference_model():')
+    rs = np.random.RandomState(42)
+    X = rs.uniform(low=-1., high=1., size=(200, 2))
+    y = np.stack((np.sin(np.cumsum(X[:, 0])), X[:, 1] ** 2), axis=1)
+    esn = ESNRegressor(k_in=1, input_scaling=.5, spectral_radius=.9, bias=.1, leakage=.8, reservoir_size=50, k_res=5,
+                       bi_directional=True, beta=1e-2, random_state=42)
+    esn.fit(X, y)
+    assert np.all(np.isfinite(esn.predict(X)))
+    model = esn.export_inference_model(dtype='float64')
+    np.testing.assert_allclose(model.predict(X), esn.predict(X), atol=1e-10)
+    model = esn.export_inference_model()
+    assert model.output_weights.dtype == np.float32
+    np.testing.assert_allclose(model.predict(X), esn.predict(X), atol=1e-4)
+    model = esn.export_inference_model(quantize_readout=True)
+    assert model.output_weights.dtype == np.int8
+    assert np.mean(np.abs(model.predict(X) - esn.predict(X))) < 5e-2
+
+    # without recurrent connections, neurons with a zero readout are removed
+    esn = ESNRegressor(k_in=1, input_scaling=.5, spectral_radius=0., bias=.1, reservoir_size=50, random_state=42)
+    esn.fit(X, y)
+    esn.output_weights_[1:26] = 0.
+    model = esn.export_inference_model(dtype='float64')
+    assert model.input_weights.shape == (25, 2)
+    assert model.reservoir_weights.shape == (25, 25)
+    np.testing.assert_allclose(model.predict(X), esn.predict(X), atol=1e-10)
+
+    # output weights computed per output with joblib
+    esn = ESNRegressor(k_in=1, input_scaling=.5, spectral_radius=.9, reservoir_size=50, k_res=5, beta=1e-2,
+                       random_state=42)
+    esn.fit(X, y, n_jobs=2)
+    assert esn.output_weights_.shape == (51, 2)
+    np.testing.assert_allclose(esn.export_inference_model(dtype='float64').predict(X), esn.predict(X), atol=1e-10)
+
+    esn = ESNClassifier(k_in=1, input_scaling=.5, spectral_radius=.9, reservoir_size=50, k_res=5, ext_bias=1,
+                        beta=1e-2, random_state=42)
+    X = np.concatenate((X, np.ones((X.shape[0], 1))), axis=1)
+    esn.fit(X, (X[:, 0] > X[:, 1]).astype(int))
+    np.testing.assert_array_equal(esn.export_inference_model(dtype='float64').predict(X), esn.predict(X))
+
+
+def test_esn_reservoir_formats():
+    print('\ntest_esn_reservoir_formats():')
+    rs = np.random.RandomState(42)
+    X = rs.uniform(low=-1., high=1., size=(100, 2))
+    y = np.sin(np.cumsum(X[:, 0]))
+    esn = ESNRegressor(k_in=1, input_scaling=.5, spectral_radius=.9, leakage=.5, reservoir_size=50, k_res=5,
+                       random_state=42).fit(X, y)
+    assert esn._reservoir_format in base.MATRIX_FORMATS
+    # the weights are converted once at fit time
+    assert esn._recurrent_weights() is esn._recurrent_weights()
+    y_pred = esn.predict(X)
+    for matrix_format in base.MATRIX_FORMATS:
+        esn._reservoir_format = matrix_format
+        np.testing.assert_allclose(esn.predict(X), y_pred)
+        esn._convert_reservoir_weights()
+        np.testing.assert_allclose(esn.predict(X), y_pred)
+    np.testing.assert_allclose(esn._recurrent_weights().dot(np.ones(50)),
+                               .9 * esn.reservoir_weights_.dot(np.ones(50)))
+    np.testing.assert_allclose(esn.set_params(spectral_radius=.5)._recurrent_weights().dot(np.ones(50)),
+                               .5 * esn.reservoir_weights_.dot(np.ones(50)))
+
+
+def test_esn_reorder_neurons():
+    print('\ntest_esn_reorder_neurons():')
+    rs = np.random.RandomState(42)
+    X = rs.uniform(low=-1., high=1., size=(100, 2))
+    y = np.sin(np.cumsum(X[:, 0]))
+    kwargs = dict(k_in=1, input_scaling=.5, spectral_radius=.9, bias=.1, reservoir_size=50, k_res=2, beta=1e-2,
+                  random_state=42)
+    esn = ESNRegressor(**kwargs).fit(X, y)
+    esn_reordered = ESNRegressor(reorder_neurons=True, **kwargs).fit(X, y)
+
+    def bandwidth(matrix):
+        matrix = matrix.tocoo()
+        return np.abs(matrix.row - matrix.col).max()
+    assert bandwidth(esn_reordered.reservoir_weights_) < bandwidth(esn.reservoir_weights_)
+    np.testing.assert_allclose(esn_reordered.predict(X), esn.predict(X), atol=1e-8)
+
+
+def test_esn_reservoir_topologies():
+    print('\ntest_esn_reservoir_topologies():')
+    rs = np.random.RandomState(42)
+    X = rs.uniform(low=-1., high=1., size=(100, 2))
+    y = np.sin(np.cumsum(X[:, 0]))
+    for reservoir_topology in ['cycle', 'delay_line', 'block_diagonal']:
+        esn = ESNRegressor(k_in=1, input_scaling=.5, spectral_radius=.9, leakage=.5, reservoir_size=50, k_res=5,
+                           reservoir_topology=reservoir_topology, beta=1e-2, random_state=42).fit(X, y)
+        assert esn._reservoir_format == reservoir_topology
+        np.testing.assert_allclose(np.abs(np.linalg.eigvals(esn.reservoir_weights_.toarray())).max(), 1.)
+        y_pred = esn.predict(X)
+        esn._reservoir_format = 'csr'
+        np.testing.assert_allclose(esn.predict(X), y_pred)
+    with pytest.raises(ValueError):
+        ESNRegressor(reservoir_size=50, k_res=3, reservoir_topology='block_diagonal').fit(X, y)
+    with pytest.raises(ValueError):
+        ESNRegressor(reservoir_topology='ring').fit(X, y)
+
+
+def test_esn_linear_scan():
+    print('\ntest_esn_linear_scan():')
+    rs = np.random.RandomState(42)
+    X = np.concatenate((rs.uniform(low=-1., high=1., size=(1000, 2)), np.ones((1000, 1))), axis=1)
+    y = np.sin(np.cumsum(X[:, 0]))
+    for ext_bias, reservoir_topology in [(0, 'random'), (1, 'random'), (0, 'cycle')]:
+        kwargs = dict(k_in=1, input_scaling=.5, spectral_radius=.9, bias=.1, ext_bias=ext_bias, leakage=.5,
+                      reservoir_size=50, k_res=5, reservoir_activation='identity', bi_directional=True,
+                      reservoir_topology=reservoir_topology, beta=1e-2, random_state=42)
+        X_train = X if ext_bias else X[:, :2]
+        esn = ESNRegressor(**kwargs).fit(X_train, y)
+        esn_scan = ESNRegressor(linear_scan=True, **kwargs).fit(X_train, y)
+        np.testing.assert_allclose(esn_scan._pass_through_reservoir(X_train), esn._pass_through_reservoir(X_train),
+                                   atol=1e-10)
+        np.testing.assert_allclose(esn_scan.predict(X_train), esn.predict(X_train), atol=1e-8)
+    with pytest.raises(ValueError):
+        ESNRegressor(linear_scan=True).fit(X, y)
+
+
+def test_esn_time_chunks():
+    print('\ntest_esn_time_chunks():')
+    rs = np.random.RandomState(42)
+    X = rs.uniform(low=-1., high=1., size=(1000, 2))
+    y = np.sin(np.cumsum(X[:, 0]))
+    kwargs = dict(k_in=1, input_scaling=.5, spectral_radius=.5, reservoir_size=50, k_res=5, beta=1e-2,
+                  random_state=42)
+    esn = ESNRegressor(**kwargs).fit(X, y)
+    esn_chunked = ESNRegressor(n_time_chunks=4, chunk_warm_up=50, **kwargs).fit(X, y)
+    states = esn_chunked._pass_through_reservoir(X)
+    np.testing.assert_allclose(states, esn._pass_through_reservoir(X), atol=1e-8)
+    assert esn_chunked.time_chunk_error_ < 1e-8
+    np.testing.assert_allclose(esn_chunked.predict(X), esn.predict(X), atol=1e-6)
+    np.testing.assert_allclose(esn_chunked._pass_through_reservoir(X[:200]), esn._pass_through_reservoir(X[:200]),
+                               atol=1e-12)
+    # the workers get no training statistics
+    esn_chunked = ESNRegressor(n_time_chunks=4, chunk_warm_up=50, keep_sequence_statistics=True, **kwargs)
+    estimator = esn_chunked.partial_fit(X, y, update_output_weights=False)._recurrence_estimator()
+    assert estimator.n_time_chunks == 1
+    assert not any(hasattr(estimator, name) for name in ['_xTx', '_sequence_statistics', '_activations_var'])
+    np.testing.assert_allclose(estimator._forward_pass(X[:200]), esn._forward_pass(X[:200]), atol=1e-12)
+    with pytest.raises(ValueError):
+        ESNRegressor(n_time_chunks=0).fit(X, y)
+
+
+def test_esn_partial_fit_settings():
+    print('\ntest_esn_partial_fit_settings():')
+    rs = np.random.RandomState(42)
+    X = rs.uniform(low=-1., high=1., size=(200, 2))
+    y = np.sin(np.cumsum(X[:, 0]))
+    settings = [{'input_scaling': .1, 'spectral_radius': .5}, {'input_scaling': .5, 'spectral_radius': .9},
+                {'bias': .5, 'leakage': .3, 'beta': 1e-1}]
+    kwargs = dict(k_in=1, reservoir_size=50, k_res=5, wash_out=5, bias=.1, beta=1e-2, bi_directional=True,
+                  random_state=42)
+    esn = ESNRegressor(**kwargs)
+    estimators = esn.partial_fit_settings(X[:100], y[:100], settings, update_output_weights=False)
+    assert esn._xTx is None and esn._xTy is None
+    assert esn.partial_fit_settings(X[100:], y[100:], settings, update_output_weights=False) is estimators
+    for estimator in estimators:
+        estimator.finalize()
+    y_pred = esn.predict_settings(X)
+    assert y_pred.shape == (3, 200, 1)
+    for setting, estimator, y_setting in zip(settings, estimators, y_pred):
+        reference = ESNRegressor(**kwargs).set_params(**setting)
+        reference.partial_fit(X[:100], y[:100], update_output_weights=False)
+        reference.partial_fit(X[100:], y[100:], update_output_weights=False)
+        reference.finalize()
+        np.testing.assert_allclose(estimator.predict(X), reference.predict(X), atol=1e-8)
+        np.testing.assert_allclose(y_setting.ravel(), reference.predict(X), atol=1e-8)
+    with pytest.raises(ValueError):
+        esn.partial_fit_settings(X, y, [{'reservoir_size': 20}])
+
+
+def test_esn_cross_validate_readout(tmp_path):
+    print('\ntest_esn_cross_validate_readout():')
+    rs = np.random.RandomState(42)
+    X = np.split(rs.uniform(low=-1., high=1., size=(400, 2)), 8)
+    y = [np.stack((np.sin(np.cumsum(sequence[:, 0])), sequence[:, 1] ** 2), axis=1) for sequence in X]
+    kwargs = dict(k_in=1, input_scaling=.5, spectral_radius=.9, reservoir_size=50, k_res=5, wash_out=5, beta=1e-2,
+                  random_state=42)
+    esn = ESNRegressor(keep_sequence_statistics=True, working_dir=str(tmp_path), **kwargs)
+    for X_sequence, y_sequence in zip(X, y):
+        esn.partial_fit(X_sequence, y_sequence, update_output_weights=False)
+    assert len(list(tmp_path.iterdir())) == 2 + 2 * 8
+    groups = [0, 0, 1, 1, 2, 2, 3, 3]
+    scores = esn.cross_validate_readout(cv=LeaveOneGroupOut(), groups=groups, betas=[1e-2, 1e-1])
+    assert scores.shape == (4, 2)
+    for n, beta in enumerate([1e-2, 1e-1]):
+        for group in range(4):
+            reference = ESNRegressor(**kwargs).set_params(beta=beta)
+            for X_sequence, y_sequence, sequence_group in zip(X, y, groups):
+                if sequence_group != group:
+                    reference.partial_fit(X_sequence, y_sequence, update_output_weights=False)
+            reference.finalize()
+            errors = [(reference.predict(X_sequence)[5:, :] - y_sequence[5:, :]) ** 2
+                      for X_sequence, y_sequence, sequence_group in zip(X, y, groups) if sequence_group == group]
+            np.testing.assert_allclose(scores[group, n], -np.mean(errors), rtol=1e-6)
+    np.testing.assert_allclose(esn.cross_validate_readout(cv=4, groups=groups), scores[:, 0], rtol=1e-10)
+    esn.finalize()
+    assert len(list(tmp_path.iterdir())) == 0
+
+
+def test_esn_checkpoint_sequence_statistics(tmp_path):
+    print('\ntest_esn_checkpoint_sequence_statistics():')
+    rs = np.random.RandomState(42)
+    X = np.split(rs.uniform(low=-1., high=1., size=(200, 2)), 4)
+    y = [np.stack((np.sin(np.cumsum(sequence[:, 0])), sequence[:, 1] ** 2), axis=1) for sequence in X]
+    kwargs = dict(k_in=1, input_scaling=.5, spectral_radius=.9, reservoir_size=50, k_res=5, wash_out=5, beta=1e-2,
+                  keep_sequence_statistics=True, random_state=42)
+    esn = ESNRegressor(**kwargs)
+    for X_sequence, y_sequence in zip(X, y):
+        esn.partial_fit(X_sequence, y_sequence, update_output_weights=False)
+
+    esn_interrupted = ESNRegressor(**kwargs)
+    for X_sequence, y_sequence in zip(X[:2], y[:2]):
+        esn_interrupted.partial_fit(X_sequence, y_sequence, update_output_weights=False)
+    esn_interrupted.save_checkpoint(str(tmp_path / 'checkpoint'))
+    esn_resumed = ESNRegressor()
+    esn_resumed.load_checkpoint(str(tmp_path / 'checkpoint'))
+    for X_sequence, y_sequence in zip(X[2:], y[2:]):
+        esn_resumed.partial_fit(X_sequence, y_sequence, update_output_weights=False)
+    np.testing.assert_allclose(esn_resumed.cross_validate_readout(cv=4), esn.cross_validate_readout(cv=4),
+                               rtol=1e-10)
+    esn.finalize()
+    esn_resumed.finalize()
+    np.testing.assert_allclose(esn_resumed.output_weights_, esn.output_weights_, atol=1e-10)
+
+
+def test_esn_feedback():
+    print('\ntest_esn_feedback():')
+    rs = np.random.RandomState(42)
+    X = rs.uniform(low=-1., high=1., size=(100, 1))
+    y = np.sin(np.cumsum(X, axis=0))
+    esn = ESNRegressor(k_in=1, input_scaling=.5, spectral_radius=.9, leakage=.7, feedback_scaling=.3,
+                       reservoir_size=30, k_res=5, beta=1e-2, random_state=42)
+    esn.fit(X, y)
+
+    # teacher forcing
+    reservoir_weights = esn.spectral_radius * esn.reservoir_weights_.toarray()
+    input_weights = esn.input_scaling * esn.input_weights_.toarray()
+    states = np.zeros(shape=(101, 30))
+    for t in range(100):
+        feedback = esn.feedback_scaling * np.dot(esn.feedback_weights_, y[t - 1]) if t > 0 else 0
+        state = np.tanh(np.dot(input_weights, X[t]) + np.dot(reservoir_weights, states[t])
+                        + esn.bias * esn.bias_weights_ + feedback)
+        states[t + 1] = .7 * state + .3 * states[t]
+    np.testing.assert_allclose(esn._pass_through_reservoir(X, teacher=y)[:, 1:], states[1:], atol=1e-10)
+
+    # closed loop
+    y_pred = esn.predict(X)
+    output_weights = esn.output_weights_.ravel()
+    np.testing.assert_allclose(esn._forward_pass(X, teacher=y_pred[:, None]),
+                               esn._pass_through_reservoir(X)[:, 1:], atol=1e-10)
+    np.testing.assert_allclose(y_pred, esn._pass_through_reservoir(X).dot(output_weights), atol=1e-10)
+
+    # autoregressive generation
+    y_gen = esn.generate(X[:50], n_steps=5, autoregressive=True)
+    history = X[:50]
+    for step in range(5):
+        history = np.concatenate((history, [[esn.predict(history)[-1]]]))
+        np.testing.assert_allclose(y_gen[step], esn.predict(history)[-1], atol=1e-10)
+    state = np.tanh(np.dot(reservoir_weights, states[-1]) + esn.bias * esn.bias_weights_
+                    + esn.feedback_scaling * np.dot(esn.feedback_weights_, y[-1]))
+    state = .7 * state + .3 * states[-1]
+    np.testing.assert_allclose(esn.generate(X, n_steps=3, y=y)[0], output_weights[0] + state.dot(output_weights[1:]),
+                               atol=1e-10)
+
+    # several outputs, with output weights computed per output with joblib
+    y = np.concatenate((y, np.cos(np.cumsum(X, axis=0))), axis=1)
+    y_gen = esn.set_params(feedback_scaling=.1).fit(X, y).generate(X, n_steps=3, y=y)
+    np.testing.assert_allclose(esn.fit(X, y, n_jobs=2).generate(X, n_steps=3, y=y), y_gen, atol=1e-10)
+
+    with pytest.raises(ValueError):
+        ESNRegressor(feedback_scaling=.3, bi_directional=True).fit(X, y)
+
+
+def test_esn_sparse_input():
+    print('\ntest_esn_sparse_input():')
+    rs = np.random.RandomState(42)
+    X = scipy.sparse.random(200, 20, density=.05, format='csr', random_state=rs)
+    X[:, -1] = 1.
+    y = np.stack((np.sin(np.cumsum(X[:, 0].toarray())), np.cumsum(X[:, 1].toarray()) % 2), axis=1)
+    for kwargs in [{}, {'ext_bias': 1}, {'bi_directional': True}, {'n_time_chunks': 2, 'chunk_warm_up': 20},
+                   {'linear_scan': True, 'reservoir_activation': 'identity'}]:
+        esn_dense = ESNRegressor(k_in=2, reservoir_size=30, k_res=5, beta=1e-2, random_state=42, **kwargs)
+        esn_sparse = ESNRegressor(k_in=2, reservoir_size=30, k_res=5, beta=1e-2, random_state=42, **kwargs)
+        esn_dense.fit(X.toarray(), y)
+        esn_sparse.fit(X, y)
+        np.testing.assert_allclose(esn_sparse.output_weights_, esn_dense.output_weights_, atol=1e-10)
+        np.testing.assert_allclose(esn_sparse.predict(X), esn_dense.predict(X.toarray()), atol=1e-10)
+    esn = ESNClassifier(k_in=2, reservoir_size=30, k_res=5, random_state=42)
+    esn.fit(X, y[:, 1] > 1)
+    np.testing.assert_array_equal(esn.predict(X), esn.predict(X.toarray()))
+
+
+def test_esn_classifier_sparse_targets():
+    print('\ntest_esn_classifier_sparse_targets():')
+    rs = np.random.RandomState(42)
+    X = rs.uniform(low=-1., high=1., size=(300, 3))
+    labels = rs.randint(20, size=300)
+    kwargs = dict(k_in=2, reservoir_size=30, k_res=5, wash_out=5, beta=1e-2, random_state=42)
+    for solver, teacher_shift in [('ridge', 0.), ('ridge', -.5), ('cg', 0.)]:
+        esn = ESNClassifier(solver=solver, teacher_shift=teacher_shift, **kwargs).fit(X, labels)
+        y = np.eye(20)[labels] + teacher_shift
+        reference = ESNRegressor(solver=solver, **kwargs).fit(X, y)
+        np.testing.assert_allclose(esn.output_weights_, reference.output_weights_, atol=1e-8)
+    esn_sparse = ESNClassifier(keep_sequence_statistics=True, **kwargs)
+    esn_dense = ESNClassifier(keep_sequence_statistics=True, **kwargs)
+    y = np.eye(20)[labels]
+    for start in range(0, 300, 100):
+        esn_sparse.partial_fit(X[start:start + 100], scipy.sparse.csr_matrix(y[start:start + 100]),
+                               classes=np.arange(20), update_output_weights=False)
+        esn_dense.partial_fit(X[start:start + 100], y[start:start + 100], classes=np.arange(20),
+                              update_output_weights=False)
+    np.testing.assert_allclose(esn_sparse.cross_validate_readout(cv=3), esn_dense.cross_validate_readout(cv=3),
+                               rtol=1e-10)
+    esn_sparse.finalize()
+    esn_dense.finalize()
+    np.testing.assert_allclose(esn_sparse.output_weights_, esn_dense.output_weights_, atol=1e-10)
+
+
+def test_esn_concurrent_predict():
+    print('\ntest_esn_concurrent_predict():')
+    from concurrent.futures import ThreadPoolExecutor
+    rs = np.random.RandomState(42)
+    X = [rs.uniform(low=-1., high=1., size=(500, 2)) for _ in range(8)]
+    y = np.sin(np.cumsum(X[0][:, 0]))
+    for kwargs in [{}, {'linear_scan': True, 'reservoir_activation': 'identity'},
+                   {'n_time_chunks': 2, 'chunk_warm_up': 50}]:
+        esn = ESNRegressor(k_in=1, reservoir_size=50, k_res=5, beta=1e-2, random_state=42, **kwargs).fit(X[0], y)
+        attributes = {name: id(value) for name, value in vars(esn).items()}
+        y_pred = [esn.predict(X_sequence) for X_sequence in X]
+        states = []
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            y_concurrent = list(executor.map(
+                lambda X_sequence: esn.predict(X_sequence, reservoir_state_callback=states.append), X))
+        assert {name: id(value) for name, value in vars(esn).items()} == attributes
+        assert len(states) == 8 and states[0].shape == (500, 51)
+        for y_sequence, y_concurrent_sequence in zip(y_pred, y_concurrent):
+            np.testing.assert_array_equal(y_sequence, y_concurrent_sequence)
+
+
+def test_esn_memory_mapped_input(tmp_path):
+    print('\ntest_esn_memory_mapped_input():')
+    rs = np.random.RandomState(42)
+    np.save(str(tmp_path / 'X.npy'), rs.uniform(low=-1., high=1., size=(3000, 4)).astype(np.float32))
+    X = np.load(str(tmp_path / 'X.npy'), mmap_mode='r')
+    y = np.sin(np.cumsum(X[:, :2], axis=0))
+    esn = ESNRegressor(k_in=2, reservoir_size=30, k_res=5, beta=1e-2, teacher_scaling=2., teacher_shift=.5,
+                       random_state=42)
+    X_valid, y_valid = esn._validate_input(X, y)
+    assert X_valid is X and y_valid is y
+    esn.fit(X, y)
+    reference = ESNRegressor(k_in=2, reservoir_size=30, k_res=5, beta=1e-2, random_state=42).fit(np.array(X),
+                                                                                                2. * y + .5)
+    np.testing.assert_allclose(esn.output_weights_, reference.output_weights_, atol=1e-6)
+    np.testing.assert_allclose(esn.predict(X), reference.predict(np.array(X)), atol=1e-6)
+    for solver in ['cg', 'ridge']:
+        esn.set_params(solver=solver).fit(X[:20], y[:20])
+        reference.set_params(solver=solver).fit(np.array(X[:20]), 2. * y[:20] + .5)
+        np.testing.assert_allclose(esn.output_weights_, reference.output_weights_, atol=1e-8)
+
+    X_invalid = np.array(X)
+    X_invalid[-1, 0] = np.nan
+    with pytest.raises(ValueError):
+        esn.fit(X_invalid, y)
+    with pytest.raises(ValueError):
+        esn.predict(X_invalid)
+    classifier = ESNClassifier(teacher_shift=-.5)
+    assert scipy.sparse.issparse(classifier._validate_input(X, y[:, 0] > 0)[1])
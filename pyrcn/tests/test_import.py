@@ -0,0 +1,22 @@
+"""
+Testing the lazy import of the pyrcn submodules
+"""
+import sys
+import subprocess
+
+
+def test_lazy_import():
+    print('\ntest_lazy_import():')
+    code = ("import sys; import pyrcn; "
+            "assert 'sklearn' not in sys.modules; "
+            "assert pyrcn.echo_state_network.ESNRegressor; "
+            "assert 'pyrcn.echo_state_network' in sys.modules; "
+            "assert 'sklearn.neural_network' not in sys.modules")
+    subprocess.run([sys.executable, '-c', code], check=True)
+
+
+def test_activations_not_registered_in_sklearn():
+    print('\ntest_activations_not_registered_in_sklearn():')
+    code = ("from sklearn.neural_network._base import ACTIVATIONS; import pyrcn.base; "
+            "assert 'bounded_relu' not in ACTIVATIONS; assert 'bounded_relu' in pyrcn.base.ACTIVATIONS")
+    subprocess.run([sys.executable, '-c', code], check=True)
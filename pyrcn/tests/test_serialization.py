@@ -0,0 +1,58 @@
+"""
+Testing for the serialization module (pyrcn.serialization)
+"""
+import scipy
+import numpy as np
+
+import pytest
+
+from sklearn.datasets import load_iris
+
+from pyrcn.base import InputToNode, FastfoodInputToNode
+from pyrcn.linear_model import IncrementalRegression
+from pyrcn.extreme_learning_machine import ELMClassifier
+from pyrcn.echo_state_network import ESNClassifier, ESNRegressor
+from pyrcn.serialization import save_model, load_model
+
+
+X_iris, y_iris = load_iris(return_X_y=True)
+
+
+def test_save_load_esn_regressor(tmp_path):
+    print('\ntest_save_load_esn_regressor():')
+    rs = np.random.RandomState(42)
+    X = rs.uniform(low=-1., high=1., size=(200, 2))
+    y = rs.uniform(low=-1., high=1., size=(200, 2))
+    esn = ESNRegressor(k_in=1, input_scaling=.5, spectral_radius=.9, reservoir_size=50, k_res=5, beta=1e-2,
+                       random_state=42).fit(X, y)
+    save_model(esn, str(tmp_path / 'esn'))
+    esn_loaded = load_model(str(tmp_path / 'esn'))
+    assert isinstance(esn_loaded, ESNRegressor)
+    assert isinstance(esn_loaded.output_weights_, np.memmap)
+    assert not esn_loaded.reservoir_weights_.data.flags.owndata
+    assert esn_loaded.get_params() == esn.get_params()
+    np.testing.assert_array_equal(esn_loaded.predict(X), esn.predict(X))
+
+
+def test_save_load_esn_classifier(tmp_path):
+    print('\ntest_save_load_esn_classifier():')
+    esn = ESNClassifier(k_in=2, input_scaling=.5, spectral_radius=.9, reservoir_size=50, k_res=5, beta=1e-2,
+                        random_state=42).fit(X_iris, y_iris)
+    save_model(esn, str(tmp_path / 'esn'))
+    esn_loaded = load_model(str(tmp_path / 'esn'), mmap_mode=None)
+    np.testing.assert_array_equal(esn_loaded.classes_, esn.classes_)
+    np.testing.assert_array_equal(esn_loaded.predict(X_iris), esn.predict(X_iris))
+
+
+def test_save_load_elm_classifier(tmp_path):
+    print('\ntest_save_load_elm_classifier():')
+    elm = ELMClassifier(
+        input_to_nodes=[
+            ('tanh', InputToNode(hidden_layer_size=10, sparsity=.5, random_state=42)),
+            ('fastfood', FastfoodInputToNode(hidden_layer_size=10, random_state=42))],
+        regressor=IncrementalRegression(alpha=.01),
+        random_state=42)
+    elm.partial_fit(X_iris, y_iris)
+    save_model(elm, str(tmp_path / 'elm'))
+    elm_loaded = load_model(str(tmp_path / 'elm'))
+    np.testing.assert_array_equal(elm_loaded.predict(X_iris), elm.predict(X_iris))